@@ -2,19 +2,236 @@ import os
 import sys
 import streamlit as st
 import pandas as pd
-import copy
+import time
+from concurrent import futures
 
 # Add project root to sys.path so that "src" can be imported
 sys.path.append(os.path.join(os.path.dirname(__file__), '..'))
 
 from src.search_engine import search_engine
-from src.ranking import get_relevance_score, listwise_rank, re_rank_results
+from src.ranking import (
+    get_relevance_score, re_rank_results, get_cache_stats,
+    alistwise_rank, astream_re_rank,
+)
+from src.concurrency import submit
+from src.fusion import IncrementalFusion
+from src.llm_registry import get_embeddings
+from src.scorers import EmbeddingScorer
+from src.pipeline import run_bulk_pipeline
+from src.instrumentation import instrumentation
+from src.prompt_budget import get_budget_stats
 import src.config as config
 
 st.set_page_config(layout="wide", page_title="LLM-Powered Search PoC")
 import folium
 from streamlit_folium import st_folium
 
+def _ranked_table_html(ranked_results):
+    columns = {
+        "Original Pos.": [r["original_index"] for r in ranked_results],
+        "Image": [f'<img src="{r["thumbnail"]}">' for r in ranked_results],
+        "Title": [r["title"] for r in ranked_results],
+        "Description": [r["description"] for r in ranked_results],
+        "LLM Score": [r.get("llm_score", "N/A") for r in ranked_results],
+        "Reasoning": [r.get("llm_reasoning", "N/A") for r in ranked_results]
+    }
+    if any("llm_confidence" in r for r in ranked_results):
+        columns["Confidence"] = [r.get("llm_confidence", "N/A") for r in ranked_results]
+    if any("fused_score" in r for r in ranked_results):
+        columns["Fused Score"] = [round(r["fused_score"], 4) for r in ranked_results]
+        columns["Listwise Score"] = [r.get("listwise_score", "N/A") for r in ranked_results]
+        columns["Pointwise Score"] = [r.get("pointwise_score", "N/A") for r in ranked_results]
+    return pd.DataFrame(columns).to_html(escape=False, index=False)
+
+MANUAL_VIEWS = ["Baseline", "LLM Listwise", "LLM Pointwise", "Embedding", "Fused"]
+MANUAL_RUNS_KEPT = 10  # Searches memoized per browser session
+MANUAL_REFRESH_SECONDS = 0.2  # How often a running search re-renders the selected view
+
+def _view_selector(label, options, key):
+    # Unlike st.tabs, which builds every tab on each rerun, only the selected view is rendered.
+    if hasattr(st, "segmented_control"):
+        return st.segmented_control(label, options, default=options[0], key=key) or options[0]
+    return st.radio(label, options, horizontal=True, key=key)
+
+@st.cache_resource
+def _embedding_scorer(provider, model):
+    return EmbeddingScorer(get_embeddings(provider, model))
+
+def _settings_signature():
+    # Settings that change rankings; a search repeated after saving new settings is recomputed.
+    return (
+        config.DEFAULT_LLM_PROVIDER, config.DEFAULT_LLM_MODEL, config.DEFAULT_LLM_TEMPERATURE,
+        config.DEFAULT_POINTWISE_PROMPT, config.DEFAULT_POINTWISE_BATCH_PROMPT,
+        config.DEFAULT_POINTWISE_LOGPROB_PROMPT, config.DEFAULT_LISTWISE_PROMPT,
+        config.DEFAULT_POINTWISE_SCORING_MODE, config.DEFAULT_POINTWISE_BATCH_SIZE,
+        config.DEFAULT_LISTWISE_WINDOW_SIZE, config.DEFAULT_LISTWISE_WINDOW_STRIDE,
+        config.PROMPT_BUDGET_ENABLED, config.PROMPT_DOCUMENT_MAX_TOKENS, config.PROMPT_DOCUMENTS_MAX_TOKENS,
+        config.EMBEDDING_PROVIDER, config.EMBEDDING_MODEL,
+    )
+
+def _baseline_table_html(results):
+    return pd.DataFrame({
+        "Original Pos.": [r["original_index"] for r in results],
+        "Image": [f'<img src="{r["thumbnail"]}">' for r in results],
+        "Title": [r["title"] for r in results],
+        "Description": [r["description"] for r in results]
+    }).to_html(escape=False, index=False)
+
+def _compute_manual_run(query, lat, lon, view, progress_slot, slot):
+    """
+    Runs the search and the LLM rankers once for a manual query, showing progress in progress_slot
+    and rendering the selected view into slot as results arrive: the baseline (and the
+    baseline-only fused ranking) right after the search, pointwise rows as they are scored, and
+    the fused ranking again as each score or ranking lands. The returned run is stored in session
+    state by the caller and rendered by _render_manual_view on later reruns.
+    Both rankers run on the background event loop and are waited for until
+    config.FUSION_DEADLINE_SECONDS after the search started. The run is then served with whatever
+    has arrived; _collect_listwise and _collect_pointwise add the rest on later reruns.
+    """
+    started = time.monotonic()
+    results = search_engine(query, latitude=lat, longitude=lon)
+    for i, r in enumerate(results):
+        r["original_index"] = i + 1
+
+    # Rankers only add top-level fields, so shallow copies of the flat result dicts are enough.
+    listwise_input = [dict(r) for r in results]
+    pointwise_input = [dict(r) for r in results]
+
+    # Reciprocal rank fusion, refined as the pointwise scores and the listwise ranking arrive.
+    fusion = IncrementalFusion(results)
+    fusion.add_signal("baseline", list(range(len(results))))
+
+    run = {
+        "query": query,
+        "results": results,
+        "listwise": None,
+        "query_intent": None,
+        "listwise_future": submit(alistwise_rank(query, listwise_input)),
+        "listwise_positions": {id(item): i for i, item in enumerate(listwise_input)},
+        "pointwise": pointwise_input,
+        "pointwise_latest": pointwise_input,  # Published by _astream_pointwise
+        "pointwise_scored": 0,
+        "pointwise_future": None,
+        "pointwise_error": None,
+        "pointwise_positions": {id(item): i for i, item in enumerate(pointwise_input)},
+        "fusion": fusion,
+        "complete": False,  # Partial rankings are rendered but their tables are not cached
+        "tables": {},  # view -> HTML, built the first time the view is shown
+    }
+    run["pointwise_future"] = submit(_astream_pointwise(run, query, pointwise_input))
+
+    def show():
+        with slot.container():
+            _render_manual_view(run, view)
+
+    progress = progress_slot.progress(0.0, text="Scoring results...")
+    show()
+    deadline = config.FUSION_DEADLINE_SECONDS
+    shown = (0, False)
+    while True:
+        running = [f for f in (run["pointwise_future"], run["listwise_future"]) if f is not None and not f.done()]
+        remaining = None if deadline is None else deadline - (time.monotonic() - started)
+        if not running or (remaining is not None and remaining <= 0):
+            break
+        futures.wait(running, timeout=MANUAL_REFRESH_SECONDS if remaining is None else min(remaining, MANUAL_REFRESH_SECONDS),
+                     return_when=futures.FIRST_COMPLETED)
+        state = (run["pointwise_scored"], run["listwise_future"] is None or run["listwise_future"].done())
+        if state == shown:
+            continue
+        listwise_landed = state[1] and not shown[1]
+        shown = state
+        progress.progress(min(1.0, state[0] / max(1, len(results))), text=f"Scored {state[0]} of {len(results)} results")
+        if view in ("LLM Pointwise", "Fused") or (listwise_landed and view == "LLM Listwise"):
+            show()
+    run["complete"] = True
+    progress.empty()
+    return run
+
+async def _astream_pointwise(run, query, items):
+    # Runs on the background event loop and only publishes each provisional ranking in the run;
+    # the script thread fuses it (see _collect_pointwise), so the fusion is never shared between threads.
+    async for _, _, provisional in astream_re_rank(query, items):
+        run["pointwise_latest"] = provisional
+        run["pointwise_scored"] += 1
+
+def _collect_pointwise(run):
+    # Adds the pointwise scores published since the last call to the run and the fusion.
+    future = run["pointwise_future"]
+    if future is not None and future.done():
+        run["pointwise_future"] = None
+        if future.exception() is not None:
+            run["pointwise_error"] = f"Pointwise ranking failed: {future.exception()}"
+    latest = run["pointwise_latest"]
+    if latest is run["pointwise"]:
+        return
+    run["pointwise"] = latest
+    run["fusion"].add_ranked_items("pointwise", latest, run["pointwise_positions"])
+    run["tables"].pop("LLM Pointwise", None)
+    run["tables"].pop("Fused", None)
+
+def _collect_listwise(run):
+    # Adds the listwise ranking to the run (and the fusion) once the background call has finished.
+    future = run["listwise_future"]
+    if future is None or not future.done():
+        return
+    run["listwise_future"] = None
+    try:
+        run["listwise"], run["query_intent"] = future.result()
+    except Exception as e:
+        run["listwise"], run["query_intent"] = [], f"Listwise ranking failed: {e}"
+        return
+    run["fusion"].add_ranked_items("listwise", run["listwise"], run["listwise_positions"])
+    run["tables"].pop("Fused", None)
+
+def _view_table(run, view, build):
+    # HTML of a view, built once per run; rankings still being computed are rebuilt on every update.
+    if not run["complete"] and view in ("LLM Pointwise", "Fused"):
+        return build()
+    if view not in run["tables"]:
+        run["tables"][view] = build()
+    return run["tables"][view]
+
+def _render_manual_view(run, view):
+    _collect_listwise(run)
+    _collect_pointwise(run)
+    if view == "Baseline":
+        st.subheader("Baseline Results")
+        table = _view_table(run, view, lambda: _baseline_table_html(run["results"]))
+    elif view == "LLM Listwise":
+        st.subheader("LLM Listwise Ranking")
+        if run["listwise"] is None:
+            if not run["complete"]:
+                st.info("Ranking results...")
+            else:
+                st.info("The listwise ranking missed the latency deadline and is still running.")
+                st.button("Check again", key="manual_listwise_refresh")
+            return
+        st.markdown(f"**Model interpreted query as:** {run['query_intent']}")
+        table = _view_table(run, view, lambda: _ranked_table_html(run["listwise"]))
+    elif view == "LLM Pointwise":
+        st.subheader("LLM Pointwise Ranking")
+        if run["pointwise_error"]:
+            st.warning(run["pointwise_error"])
+        elif run["complete"] and run["pointwise_future"] is not None:
+            st.info(f"Scored {run['pointwise_scored']} of {len(run['results'])} results within the latency "
+                    "deadline; the rest are still being scored.")
+            st.button("Check again", key="manual_pointwise_refresh")
+        table = _view_table(run, view, lambda: _ranked_table_html(run["pointwise"]))
+    elif view == "Embedding":
+        st.subheader(f"Embedding Ranking ({config.EMBEDDING_PROVIDER})")
+        # Local and cheap, so it is only computed when the view is first opened.
+        scorer = _embedding_scorer(config.EMBEDDING_PROVIDER, config.EMBEDDING_MODEL)
+        table = _view_table(run, view, lambda: _ranked_table_html(
+            re_rank_results(run["query"], [dict(r) for r in run["results"]], scorer=scorer)
+        ))
+    elif view == "Fused":
+        st.subheader("Fused Ranking")
+        st.caption("Signals: " + ", ".join(run["fusion"].signals))
+        if run["complete"] and (run["listwise_future"] is not None or run["pointwise_future"] is not None):
+            st.button("Check for late rankings", key="manual_fused_refresh")
+        table = _view_table(run, view, lambda: _ranked_table_html(run["fusion"].ranking()))
+    st.markdown(table, unsafe_allow_html=True)
+
 def run_manual_query():
     st.header("Manual Query Analysis")
 
@@ -53,49 +270,27 @@ def run_manual_query():
 
             st.write(f"Selected location: {lat}, {lon}")
     st.divider()
-    if st.button("Search (Manual)", key="manual_search"):
-        results = search_engine(query, latitude=lat, longitude=lon)
-        for i, r in enumerate(results):
-            r["original_index"] = i + 1
-
-        baseline_df = pd.DataFrame({
-            "Original Pos.": [r["original_index"] for r in results],
-            "Image": [f'<img src="{r["thumbnail"]}">' for r in results],
-            "Title": [r["title"] for r in results],
-            "Description": [r["description"] for r in results]
-        }).to_html(escape=False, index=False)
-
-        listwise_results, query_intent = listwise_rank(query, copy.deepcopy(results))
-        listwise_df = pd.DataFrame({
-            "Original Pos.": [r["original_index"] for r in listwise_results],
-            "Image": [f'<img src="{r["thumbnail"]}">' for r in listwise_results],
-            "Title": [r["title"] for r in listwise_results],
-            "Description": [r["description"] for r in listwise_results],
-            "LLM Score": [r.get("llm_score", "N/A") for r in listwise_results],
-            "Reasoning": [r.get("llm_reasoning", "N/A") for r in listwise_results]
-        }).to_html(escape=False, index=False)
-
-        pointwise_results = re_rank_results(query, copy.deepcopy(results))
-        pointwise_df = pd.DataFrame({
-            "Original Pos.": [r["original_index"] for r in pointwise_results],
-            "Image": [f'<img src="{r["thumbnail"]}">' for r in pointwise_results],
-            "Title": [r["title"] for r in pointwise_results],
-            "Description": [r["description"] for r in pointwise_results],
-            "LLM Score": [r.get("llm_score", "N/A") for r in pointwise_results],
-            "Reasoning": [r.get("llm_reasoning", "N/A") for r in pointwise_results]
-        }).to_html(escape=False, index=False)
-
-        m_tab1, m_tab2, m_tab3 = st.tabs(["Baseline", "LLM Listwise", "LLM Pointwise"])
-        with m_tab1:
-            st.subheader("Baseline Results")
-            st.markdown(baseline_df, unsafe_allow_html=True)
-        with m_tab2:
-            st.subheader("LLM Listwise Ranking")
-            st.markdown(f"**Model interpreted query as:** {query_intent}")
-            st.markdown(listwise_df, unsafe_allow_html=True)
-        with m_tab3:
-            st.subheader("LLM Pointwise Ranking")
-            st.markdown(pointwise_df, unsafe_allow_html=True)
+    search_clicked = st.button("Search (Manual)", key="manual_search")
+    view = _view_selector("View", MANUAL_VIEWS, key="manual_view")
+
+    # Reruns (any widget interaction) render from session state; only Search runs the pipeline.
+    runs = st.session_state.setdefault("manual_runs", {})
+    key = (query, round(lat, 6), round(lon, 6), _settings_signature())
+    progress_slot = st.empty()
+    slot = st.empty()
+    if search_clicked:
+        if key not in runs:
+            runs[key] = _compute_manual_run(query, lat, lon, view, progress_slot, slot)
+            while len(runs) > MANUAL_RUNS_KEPT:
+                runs.pop(next(iter(runs)))
+        st.session_state["manual_run_key"] = key
+    run = runs.get(st.session_state.get("manual_run_key"))
+    if run is None:
+        return
+    with slot.container():
+        if st.session_state["manual_run_key"] != key:
+            st.caption(f"Showing results for '{run['query']}'; press Search to update them.")
+        _render_manual_view(run, view)
 
 def run_csv_bulk():
     st.header("CSV Bulk Analysis")
@@ -108,7 +303,7 @@ def run_csv_bulk():
     if uploaded_file is not None:
         try:
             df = pd.read_csv(uploaded_file, sep=delimiter)
-        except Exception as e:
+        except Exception:
             st.error("Error reading CSV file. Please check the delimiter or file format.")
             st.stop()
         
@@ -141,14 +336,21 @@ def run_csv_bulk():
         
         if st.button("Process Bulk", key="process_bulk"):
             st.markdown("## Bulk Analysis by Keyword")
-            for idx, row in filtered_df.iterrows():
-                keyword = row.get("search_keywords", None)
-                if not keyword:
-                    continue
+            keywords = [k for k in filtered_df.get("search_keywords", pd.Series(dtype=str)).tolist() if isinstance(k, str) and k]
+            progress = st.progress(0.0, text=f"Processing {len(keywords)} keywords...")
+            # Searches for upcoming keywords overlap with ranking of earlier ones; records arrive in input order.
+            for record in run_bulk_pipeline(keywords):
+                done = record["progress"]
+                progress.progress(
+                    done["ranked"] / done["total"],
+                    text=f"Searched {done['searched']}/{done['total']}, ranked {done['ranked']}/{done['total']}",
+                )
+                keyword = record["keyword"]
                 with st.expander(f"Analysis for keyword: {keyword}"):
-                    results = search_engine(keyword)
-                    for i, r in enumerate(results):
-                        r["original_index"] = i + 1
+                    if record["error"]:
+                        st.error(record["error"])
+                        continue
+                    results = record["results"]
                     
                     # Baseline table now includes Description
                     baseline_df = pd.DataFrame({
@@ -157,7 +359,7 @@ def run_csv_bulk():
                         "Description": [r["description"] for r in results]
                     })
                     
-                    listwise_results, query_intent = listwise_rank(keyword, copy.deepcopy(results))
+                    listwise_results, query_intent = record["listwise_results"], record["query_intent"]
                     listwise_df = pd.DataFrame({
                         "Original Pos.": [r["original_index"] for r in listwise_results],
                         "Title": [r["title"] for r in listwise_results],
@@ -166,7 +368,7 @@ def run_csv_bulk():
                         "Reasoning": [r.get("llm_reasoning", "N/A") for r in listwise_results]
                     })
                     
-                    pointwise_results = re_rank_results(keyword, copy.deepcopy(results))
+                    pointwise_results = record["pointwise_results"]
                     pointwise_df = pd.DataFrame({
                         "Original Pos.": [r["original_index"] for r in pointwise_results],
                         "Title": [r["title"] for r in pointwise_results],
@@ -186,11 +388,14 @@ def run_csv_bulk():
                     with p_tab:
                         st.subheader("LLM Pointwise Ranking")
                         st.dataframe(pointwise_df, use_container_width=True)
+            progress.empty()
 
 def run_settings():
     st.header("Settings")
     st.markdown("### Configure Prompt Templates for Ranking")
     new_pointwise = st.text_area("Pointwise Prompt Template", value=config.DEFAULT_POINTWISE_PROMPT, height=150)
+    new_pointwise_batch = st.text_area("Batched Pointwise Prompt Template (used when the batch size is above 1)", value=config.DEFAULT_POINTWISE_BATCH_PROMPT, height=150)
+    new_pointwise_logprob = st.text_area("Logprobs Pointwise Prompt Template (used by the logprobs scoring mode)", value=config.DEFAULT_POINTWISE_LOGPROB_PROMPT, height=150)
     new_listwise = st.text_area("Listwise Prompt Template", value=config.DEFAULT_LISTWISE_PROMPT, height=150)
     
     st.markdown("### Configure LLM Settings")
@@ -218,25 +423,74 @@ def run_settings():
     
     st.markdown("### Configure Concurrency Settings")
     new_concurrency = st.number_input("Concurrent Processes", min_value=1, max_value=20, value=config.DEFAULT_CONCURRENT_PROCESSES, step=1)
+    scoring_modes = ["structured", "logprobs"]
+    new_scoring_mode = st.selectbox("Pointwise Scoring Mode (logprobs: one-token grade, OpenAI only)", options=scoring_modes, index=scoring_modes.index(config.DEFAULT_POINTWISE_SCORING_MODE))
+    new_batch_size = st.number_input("Pointwise Batch Size (documents per LLM call)", min_value=1, max_value=50, value=config.DEFAULT_POINTWISE_BATCH_SIZE, step=1)
+    new_window_size = st.number_input("Listwise Window Size (0 = whole list in one prompt)", min_value=0, max_value=100, value=config.DEFAULT_LISTWISE_WINDOW_SIZE, step=1)
+    new_window_stride = st.number_input("Listwise Window Stride", min_value=1, max_value=100, value=config.DEFAULT_LISTWISE_WINDOW_STRIDE, step=1)
+
+    st.markdown("### Configure Prompt Token Budget")
+    new_budget_enabled = st.checkbox("Normalize and truncate listing text", value=config.PROMPT_BUDGET_ENABLED)
+    new_document_tokens = st.number_input("Max tokens per listing (0 = unlimited)", min_value=0, max_value=4000, value=config.PROMPT_DOCUMENT_MAX_TOKENS, step=50)
+    new_prompt_tokens = st.number_input("Max listing tokens per prompt (0 = unlimited)", min_value=0, max_value=100000, value=config.PROMPT_DOCUMENTS_MAX_TOKENS, step=500)
     
     if st.button("Save Settings", key="save_settings"):
         config.DEFAULT_POINTWISE_PROMPT = new_pointwise
+        config.DEFAULT_POINTWISE_BATCH_PROMPT = new_pointwise_batch
+        config.DEFAULT_POINTWISE_LOGPROB_PROMPT = new_pointwise_logprob
         config.DEFAULT_LISTWISE_PROMPT = new_listwise
         config.DEFAULT_LLM_PROVIDER = new_provider
         config.DEFAULT_LLM_MODEL = new_model
         config.DEFAULT_LLM_TEMPERATURE = new_temperature
         config.DEFAULT_CONCURRENT_PROCESSES = new_concurrency
+        config.DEFAULT_POINTWISE_BATCH_SIZE = new_batch_size
+        config.DEFAULT_POINTWISE_SCORING_MODE = new_scoring_mode
+        config.DEFAULT_LISTWISE_WINDOW_SIZE = new_window_size
+        config.DEFAULT_LISTWISE_WINDOW_STRIDE = new_window_stride
+        config.PROMPT_BUDGET_ENABLED = new_budget_enabled
+        config.PROMPT_DOCUMENT_MAX_TOKENS = new_document_tokens
+        config.PROMPT_DOCUMENTS_MAX_TOKENS = new_prompt_tokens
         st.success("Settings updated successfully!")
 
+    st.markdown("### Relevance Score Cache")
+    cache_stats = get_cache_stats()
+    if cache_stats:
+        c1, c2, c3, c4 = st.columns(4)
+        c1.metric("Memory hits", cache_stats["memory_hits"])
+        c2.metric("Disk hits", cache_stats["disk_hits"])
+        c3.metric("Misses", cache_stats["misses"])
+        c4.metric("Hit rate", f"{cache_stats['hit_rate']:.0%}")
+    else:
+        st.info("Score cache is disabled.")
+
+    st.markdown("### Prompt Token Budget")
+    budget_stats = get_budget_stats()
+    b1, b2, b3 = st.columns(3)
+    b1.metric("Listings prepared", budget_stats["documents"])
+    b2.metric("Listings truncated", budget_stats["truncated_documents"])
+    b3.metric("Tokens saved", budget_stats["tokens_saved"])
+
+    st.markdown("### Performance")
+    performance = instrumentation.summary()
+    if performance:
+        st.dataframe(pd.DataFrame(performance), use_container_width=True)
+        with st.expander("Prometheus metrics"):
+            st.code(instrumentation.to_prometheus(), language="text")
+        if st.button("Reset performance metrics"):
+            instrumentation.reset()
+            st.rerun()
+    else:
+        st.info("No calls recorded yet.")
+
 def main():
     st.title("LLM-Powered Search PoC")
-    top_tab1, top_tab2, top_tab3 = st.tabs(["Manual Query", "CSV Bulk Analysis", "Settings"])
-    
-    with top_tab1:
+    page = _view_selector("Page", ["Manual Query", "CSV Bulk Analysis", "Settings"], key="page")
+
+    if page == "Manual Query":
         run_manual_query()
-    with top_tab2:
+    elif page == "CSV Bulk Analysis":
         run_csv_bulk()
-    with top_tab3:
+    else:
         run_settings()
 
 if __name__ == "__main__":
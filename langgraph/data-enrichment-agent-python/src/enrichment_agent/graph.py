@@ -18,6 +18,13 @@ from enrichment_agent.state import InputState, OutputState, State
 from enrichment_agent.tools import scrape_website, search
 from enrichment_agent.utils import init_model
 
+try:
+    import src.config as search_config
+    from src.instrumentation import callback_handler
+except ImportError:  # Instrumentation lives in the search PoC (src/), outside this package.
+    search_config = None
+    callback_handler = None
+
 
 async def call_agent_model(
     state: State, *, config: Optional[RunnableConfig] = None
@@ -226,4 +233,7 @@ workflow.add_edge("tools", "call_agent_model")
 workflow.add_conditional_edges("reflect", route_after_checker)
 
 graph = workflow.compile()
+if search_config is not None and search_config.INSTRUMENTATION_GRAPH_CALLBACKS:
+    # Records every node run and model call (see src/instrumentation.py).
+    graph = graph.with_config(callbacks=[callback_handler])
 graph.name = "ResearchTopic"
@@ -0,0 +1,252 @@
+"""
+Headless, resumable bulk re-ranking.
+
+Usage:
+    python -m src.batch_rerank keywords.csv --output results.jsonl
+    python -m src.batch_rerank keywords.csv --output results_dir --format parquet --chunk-size 1000
+
+The input CSV is streamed in chunks; every keyword goes through search, listwise and pointwise
+ranking (see src/pipeline.py) and is written as soon as it finishes. CSV rows that completed
+without error are recorded in a checkpoint file, so re-running the same command after an
+interruption skips them. On resume, output records of rows missing from the checkpoint (rows that
+failed, or were written just before the interruption) are dropped and those rows are processed
+again, so the output holds one record per row.
+"""
+import argparse
+import csv
+import glob
+import json
+import logging
+import os
+import sys
+from typing import Dict, Iterator, List, Optional, Set, Tuple
+
+from src.concurrency import iterate_sync
+from src.pipeline import arun_bulk_pipeline
+
+_RESULT_FIELDS = ("original_index", "title", "description", "llm_score", "llm_status", "llm_reasoning")
+
+
+def read_chunks(path: str, delimiter: str, chunk_size: int) -> Iterator[List[Tuple[int, Dict]]]:
+    """Yields lists of (row_number, row) pairs of at most chunk_size rows, without loading the whole file."""
+    with open(path, newline="", encoding="utf-8") as f:
+        chunk = []
+        for row_number, row in enumerate(csv.DictReader(f, delimiter=delimiter)):
+            chunk.append((row_number, row))
+            if len(chunk) >= chunk_size:
+                yield chunk
+                chunk = []
+        if chunk:
+            yield chunk
+
+
+def load_checkpoint(path: str) -> Set[int]:
+    if not os.path.exists(path):
+        return set()
+    with open(path, encoding="utf-8") as f:
+        return {int(line) for line in f if line.strip()}
+
+
+def _slim(results: List[Dict]) -> List[Dict]:
+    return [{field: item.get(field) for field in _RESULT_FIELDS if field in item} for item in results or []]
+
+
+def to_output_record(row_number: int, row: Dict, record: Dict) -> Dict:
+    return {
+        "row_number": row_number,
+        "keyword": record["keyword"],
+        "row": row,
+        "error": record["error"],
+        "query_intent": record.get("query_intent"),
+        "baseline": _slim(record.get("results")),
+        "listwise": _slim(record.get("listwise_results")),
+        "pointwise": _slim(record.get("pointwise_results")),
+    }
+
+
+def _compact_jsonl(path: str, completed: Set[int]) -> None:
+    # Keeps the first record of every checkpointed row; lines cut short by a crash are dropped too.
+    if not os.path.exists(path):
+        return
+    kept: Set[int] = set()
+    dropped = 0
+    with open(path, encoding="utf-8") as source, open(path + ".tmp", "w", encoding="utf-8") as target:
+        for line in source:
+            try:
+                row_number = json.loads(line)["row_number"]
+            except (ValueError, KeyError, TypeError):
+                row_number = None
+            if row_number in completed and row_number not in kept:
+                kept.add(row_number)
+                target.write(line if line.endswith("\n") else line + "\n")
+            else:
+                dropped += 1
+    os.replace(path + ".tmp", path)
+    if dropped:
+        logging.info("Dropped %d unfinished or duplicate records from %s", dropped, path)
+
+
+class JsonlWriter:
+    """
+    Appends one JSON object per line; every record is flushed before it is checkpointed.
+    With completed (the checkpointed rows of a resumed run), records of other rows are dropped first.
+    """
+
+    def __init__(self, path: str, completed: Optional[Set[int]] = None):
+        if completed is not None:
+            _compact_jsonl(path, completed)
+        self._file = open(path, "a", encoding="utf-8")
+
+    def write(self, record: Dict) -> None:
+        self._file.write(json.dumps(record, ensure_ascii=False) + "\n")
+        self._file.flush()
+
+    def end_chunk(self) -> None:
+        pass
+
+    def close(self) -> None:
+        self._file.close()
+
+
+def _parquet_schema():
+    # One explicit schema for every part, so parts with and without nulls can be read together.
+    import pyarrow as pa
+    results = pa.list_(pa.struct([
+        ("original_index", pa.int64()),
+        ("title", pa.string()),
+        ("description", pa.string()),
+        ("llm_score", pa.float64()),
+        ("llm_status", pa.string()),
+        ("llm_reasoning", pa.string()),
+    ]))
+    return pa.schema([
+        ("row_number", pa.int64()),
+        ("keyword", pa.string()),
+        ("row", pa.map_(pa.string(), pa.string())),
+        ("error", pa.string()),
+        ("query_intent", pa.string()),
+        ("baseline", results),
+        ("listwise", results),
+        ("pointwise", results),
+    ])
+
+
+class ParquetWriter:
+    """
+    Buffers a chunk and writes it as its own part file in the output directory, since a Parquet
+    file cannot be appended to. All parts share _parquet_schema(). Requires pyarrow.
+    With completed (the checkpointed rows of a resumed run), rows not in it are removed from the
+    existing parts first.
+    """
+
+    def __init__(self, directory: str, completed: Optional[Set[int]] = None):
+        try:
+            import pyarrow  # noqa: F401
+        except ImportError:
+            raise SystemExit("Parquet output requires pyarrow: pip install pyarrow")
+        os.makedirs(directory, exist_ok=True)
+        self.directory = directory
+        self._part = len(glob.glob(os.path.join(directory, "part-*.parquet")))
+        self._buffer: List[Dict] = []
+        self._schema = _parquet_schema()
+        if completed is not None:
+            self._compact(completed)
+
+    def _compact(self, completed: Set[int]) -> None:
+        import pyarrow as pa
+        import pyarrow.compute as pc
+        import pyarrow.parquet as pq
+        checkpointed = pa.array(sorted(completed), pa.int64())
+        for path in sorted(glob.glob(os.path.join(self.directory, "part-*.parquet"))):
+            table = pq.read_table(path, schema=self._schema)
+            keep = pc.is_in(table["row_number"], value_set=checkpointed)
+            if pc.all(keep).as_py() is not False:
+                continue
+            kept = table.filter(keep)
+            logging.info("Dropped %d unfinished records from %s", table.num_rows - kept.num_rows, path)
+            pq.write_table(kept, path + ".tmp")
+            os.replace(path + ".tmp", path)
+
+    def write(self, record: Dict) -> None:
+        self._buffer.append(record)
+
+    def end_chunk(self) -> None:
+        if not self._buffer:
+            return
+        import pyarrow as pa
+        import pyarrow.parquet as pq
+        path = os.path.join(self.directory, f"part-{self._part:05d}.parquet")
+        pq.write_table(pa.Table.from_pylist(self._buffer, schema=self._schema), path)
+        self._part += 1
+        self._buffer = []
+
+    def close(self) -> None:
+        # Rows of an unfinished (interrupted) chunk are dropped: they are not checkpointed, so a
+        # resumed run processes them again, and writing them here would duplicate them.
+        self._buffer = []
+
+
+def run(args: argparse.Namespace) -> int:
+    checkpoint_path = args.checkpoint or args.output.rstrip("/") + ".checkpoint"
+    resuming = os.path.exists(checkpoint_path)
+    completed = load_checkpoint(checkpoint_path)
+    if resuming:
+        logging.info("Resuming: %d rows already completed according to %s", len(completed), checkpoint_path)
+    writer_class = ParquetWriter if args.format == "parquet" else JsonlWriter
+    writer = writer_class(args.output, completed if resuming else None)
+    processed = failed = 0
+    with open(checkpoint_path, "a", encoding="utf-8") as checkpoint:
+        try:
+            for chunk in read_chunks(args.input, args.delimiter, args.chunk_size):
+                pending = [(n, row) for n, row in chunk if n not in completed and row.get(args.keyword_column)]
+                if not pending:
+                    continue
+                keywords = [row[args.keyword_column] for _, row in pending]
+                finished = []
+                records = iterate_sync(arun_bulk_pipeline(
+                    keywords, args.search_concurrency, args.rank_concurrency, ordered=False
+                ))
+                for record in records:
+                    row_number, row = pending[record["index"]]
+                    writer.write(to_output_record(row_number, row, record))
+                    processed += 1
+                    if record["error"] is not None:
+                        # Not checkpointed: the row is retried when the command is run again.
+                        failed += 1
+                        continue
+                    finished.append(row_number)
+                    if args.format == "jsonl":
+                        checkpoint.write(f"{row_number}\n")
+                        checkpoint.flush()
+                writer.end_chunk()
+                if args.format == "parquet":
+                    checkpoint.writelines(f"{row_number}\n" for row_number in finished)
+                    checkpoint.flush()
+                logging.info("Chunk done: %d keywords processed so far (%d with errors)", processed, failed)
+        finally:
+            writer.close()
+    logging.info("Finished: %d keywords processed, %d with errors", processed, failed)
+    return 0
+
+
+def parse_args(argv: List[str]) -> argparse.Namespace:
+    parser = argparse.ArgumentParser(description="Resumable headless search re-ranking over a CSV of keywords.")
+    parser.add_argument("input", help="Input CSV file")
+    parser.add_argument("--output", required=True, help="Output JSONL file, or directory for Parquet parts")
+    parser.add_argument("--format", choices=("jsonl", "parquet"), default="jsonl")
+    parser.add_argument("--checkpoint", help="Checkpoint file (default: <output>.checkpoint)")
+    parser.add_argument("--delimiter", default=",")
+    parser.add_argument("--keyword-column", default="search_keywords")
+    parser.add_argument("--chunk-size", type=int, default=500, help="CSV rows read and processed per chunk")
+    parser.add_argument("--search-concurrency", type=int, default=None)
+    parser.add_argument("--rank-concurrency", type=int, default=None)
+    return parser.parse_args(argv)
+
+
+def main(argv: List[str] = None) -> int:
+    logging.basicConfig(level=logging.INFO)
+    return run(parse_args(sys.argv[1:] if argv is None else argv))
+
+
+if __name__ == "__main__":
+    sys.exit(main())
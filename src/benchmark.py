@@ -0,0 +1,165 @@
+"""
+Offline ranker benchmark.
+
+Usage:
+    python -m src.benchmark run --output bench.json [--latency-ms 300 --error-rate 0.02 --repeat 3]
+    python -m src.benchmark record "silla de madera" "iphone 12" --fixture src/fixtures/recorded_serps.json
+
+'run' replays the SERPs of a fixture file through the baseline, listwise, pointwise and embedding
+strategies using the deterministic stub chat model (src/stub_llm.py) and the configured embedding
+model, so no API calls are made with the defaults. It reports p50/p95/p99 latency, throughput, LLM
+calls, prompt tokens and (simulated) prompt-cache tokens per query as JSON, which can be diffed
+between commits. 'record' captures live search responses into a fixture file.
+"""
+import argparse
+import asyncio
+import copy
+import json
+import logging
+import os
+import sys
+import time
+from typing import Callable, Dict, List
+
+import numpy as np
+
+import src.config as config
+from src.concurrency import run_sync
+from src.llm_registry import get_llm
+
+DEFAULT_FIXTURE = os.path.join(os.path.dirname(__file__), "fixtures", "recorded_serps.json")
+
+
+def load_fixture(path: str) -> List[Dict]:
+    with open(path, encoding="utf-8") as f:
+        return json.load(f)["serps"]
+
+
+async def _baseline(query: str, results: List[Dict]) -> List[Dict]:
+    return results
+
+
+def _strategies() -> Dict[str, Callable]:
+    from src.llm_registry import get_embeddings
+    from src.ranking import alistwise_rank, are_rank_results
+    from src.scorers import EmbeddingScorer
+
+    async def embedding(query: str, results: List[Dict]) -> List[Dict]:
+        return await are_rank_results(query, results, scorer=EmbeddingScorer(get_embeddings()))
+
+    return {"baseline": _baseline, "listwise": alistwise_rank, "pointwise": are_rank_results, "embedding": embedding}
+
+
+async def _bench_strategy(strategy: Callable, serps: List[Dict], repeat: int, concurrency: int) -> Dict:
+    semaphore = asyncio.Semaphore(concurrency)
+    latencies: List[float] = []
+
+    async def one(serp: Dict) -> None:
+        async with semaphore:
+            started = time.perf_counter()
+            await strategy(serp["query"], copy.deepcopy(serp["results"]))
+            latencies.append(time.perf_counter() - started)
+
+    started = time.perf_counter()
+    await asyncio.gather(*(one(serp) for _ in range(repeat) for serp in serps))
+    elapsed = time.perf_counter() - started
+    p50, p95, p99 = np.percentile(np.array(latencies) * 1000, [50, 95, 99])
+    return {
+        "queries": len(latencies),
+        "p50_ms": round(float(p50), 2),
+        "p95_ms": round(float(p95), 2),
+        "p99_ms": round(float(p99), 2),
+        "throughput_qps": round(len(latencies) / elapsed, 3),
+    }
+
+
+def run_benchmark(
+    serps: List[Dict],
+    strategies: List[str],
+    repeat: int = 1,
+    concurrency: int = 1,
+) -> Dict:
+    """
+    Benchmarks the given strategies on the stub provider and returns the report as a dict.
+    The score cache is disabled for the duration so every run pays for its LLM calls.
+    """
+    saved = (config.DEFAULT_LLM_PROVIDER, config.SCORE_CACHE_ENABLED)
+    config.DEFAULT_LLM_PROVIDER = "Stub"
+    config.SCORE_CACHE_ENABLED = False
+    available = _strategies()
+    report = {"settings": {
+        "stub": dict(config.STUB_LLM_SETTINGS),
+        "repeat": repeat,
+        "concurrency": concurrency,
+        "serps": len(serps),
+        "results_per_serp": round(sum(len(s["results"]) for s in serps) / max(len(serps), 1), 1),
+        "pointwise_batch_size": config.DEFAULT_POINTWISE_BATCH_SIZE,
+        "listwise_window_size": config.DEFAULT_LISTWISE_WINDOW_SIZE,
+    }, "strategies": {}}
+    try:
+        stub = get_llm()
+        for name in strategies:
+            stub.reset_stats()
+            result = run_sync(_bench_strategy(available[name], serps, repeat, concurrency))
+            stats = stub.stats()
+            result["llm_calls_per_query"] = round(stats["calls"] / result["queries"], 2)
+            result["prompt_tokens_per_query"] = round(stats["prompt_tokens"] / result["queries"], 1)
+            result["cached_prompt_tokens_per_query"] = round(stats["cached_tokens"] / result["queries"], 1)
+            result["injected_errors"] = stats["errors"]
+            report["strategies"][name] = result
+            logging.info("%s: %s", name, result)
+    finally:
+        config.DEFAULT_LLM_PROVIDER, config.SCORE_CACHE_ENABLED = saved
+    return report
+
+
+def record_fixture(queries: List[str], path: str) -> None:
+    """Runs live searches for the queries and stores the responses in a fixture file."""
+    from src.search_engine import search_engine
+    serps = [{"query": query, "results": search_engine(query)} for query in queries]
+    with open(path, "w", encoding="utf-8") as f:
+        json.dump({"source": "Recorded with python -m src.benchmark record", "serps": serps}, f, ensure_ascii=False, indent=1)
+    logging.info("Recorded %d SERPs to %s", len(serps), path)
+
+
+def main(argv: List[str] = None) -> int:
+    logging.basicConfig(level=logging.INFO)
+    parser = argparse.ArgumentParser(description="Offline benchmark of the search re-rankers.")
+    sub = parser.add_subparsers(dest="command", required=True)
+    run_parser = sub.add_parser("run", help="Benchmark rankers on recorded SERPs with the stub LLM")
+    run_parser.add_argument("--fixture", default=DEFAULT_FIXTURE)
+    run_parser.add_argument("--output", help="Write the JSON report here (default: stdout)")
+    run_parser.add_argument("--strategies", nargs="+", default=["baseline", "listwise", "pointwise", "embedding"])
+    run_parser.add_argument("--repeat", type=int, default=1, help="Passes over the fixture per strategy")
+    run_parser.add_argument("--concurrency", type=int, default=1, help="Queries in flight at once")
+    run_parser.add_argument("--latency-ms", type=float, default=config.STUB_LLM_SETTINGS["latency_ms"])
+    run_parser.add_argument("--latency-sigma", type=float, default=config.STUB_LLM_SETTINGS["latency_sigma"])
+    run_parser.add_argument("--error-rate", type=float, default=config.STUB_LLM_SETTINGS["error_rate"])
+    run_parser.add_argument("--seed", type=int, default=config.STUB_LLM_SETTINGS["seed"])
+    record_parser = sub.add_parser("record", help="Record live search responses into a fixture file")
+    record_parser.add_argument("queries", nargs="+")
+    record_parser.add_argument("--fixture", default=DEFAULT_FIXTURE)
+    args = parser.parse_args(sys.argv[1:] if argv is None else argv)
+
+    if args.command == "record":
+        record_fixture(args.queries, args.fixture)
+        return 0
+
+    config.STUB_LLM_SETTINGS = {
+        "latency_ms": args.latency_ms,
+        "latency_sigma": args.latency_sigma,
+        "error_rate": args.error_rate,
+        "seed": args.seed,
+    }
+    report = run_benchmark(load_fixture(args.fixture), args.strategies, args.repeat, args.concurrency)
+    output = json.dumps(report, indent=2, sort_keys=True)
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as f:
+            f.write(output + "\n")
+    else:
+        sys.stdout.write(output + "\n")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,254 @@
+import asyncio
+import atexit
+import hashlib
+import json
+import logging
+import os
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+from typing import Any, Dict, Optional, Tuple
+
+import src.config as config
+
+_MISSING = object()
+
+
+class TTLLRUCache:
+    """
+    Thread-safe in-process LRU cache with a maximum number of entries and a per-entry TTL.
+    Expired entries are dropped lazily on access; the least recently used entry is evicted
+    once max_entries is exceeded.
+    """
+
+    def __init__(self, max_entries: int, ttl_seconds: Optional[float] = None):
+        self.max_entries = max_entries
+        self.ttl_seconds = ttl_seconds
+        self._data: "OrderedDict[str, tuple]" = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key: str, default: Any = None) -> Any:
+        with self._lock:
+            entry = self._data.get(key, _MISSING)
+            if entry is _MISSING:
+                return default
+            value, expires_at = entry
+            if expires_at is not None and expires_at <= time.time():
+                del self._data[key]
+                return default
+            self._data.move_to_end(key)
+            return value
+
+    def set(self, key: str, value: Any, expires_at: Optional[float] = None) -> None:
+        if expires_at is None and self.ttl_seconds is not None:
+            expires_at = time.time() + self.ttl_seconds
+        with self._lock:
+            self._data[key] = (value, expires_at)
+            self._data.move_to_end(key)
+            while len(self._data) > self.max_entries:
+                self._data.popitem(last=False)
+
+    def clear(self) -> None:
+        with self._lock:
+            self._data.clear()
+
+    def __len__(self) -> int:
+        return len(self._data)
+
+
+class TwoTierCache:
+    """
+    JSON-serialisable key/value cache with an in-process TTLLRUCache in front of a SQLite table.
+    Memory hits never touch the disk; disk hits are promoted into memory with their remaining TTL.
+    Writes go to memory at once and are written to disk behind the caller by a background thread,
+    which commits them in batches every config.SCORE_CACHE_FLUSH_SECONDS (the database runs in WAL
+    mode so these commits do not block readers). Coroutines should use aget(), which does disk
+    lookups in the default executor instead of on the event loop. Hit and miss counters are
+    available through stats().
+    """
+
+    def __init__(self, path: str, table: str, max_entries: int, ttl_seconds: Optional[float]):
+        self.path = path
+        self.table = table
+        self.ttl_seconds = ttl_seconds
+        self.memory = TTLLRUCache(max_entries, ttl_seconds)
+        self._lock = threading.Lock()
+        self._counters = {"memory_hits": 0, "disk_hits": 0, "misses": 0, "writes": 0}
+        # key -> (json value, expires_at) not written to disk yet
+        self._pending: Dict[str, Tuple[str, Optional[float]]] = {}
+        self._flush_requested = threading.Event()
+        self._writer: Optional[threading.Thread] = None
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        self._conn = sqlite3.connect(path, check_same_thread=False)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("PRAGMA synchronous=NORMAL")
+        self._conn.execute(
+            f"CREATE TABLE IF NOT EXISTS {table} "
+            "(key TEXT PRIMARY KEY, value TEXT NOT NULL, expires_at REAL)"
+        )
+        self._conn.commit()
+        atexit.register(self.flush)
+
+    def _count(self, counter: str) -> None:
+        with self._lock:
+            self._counters[counter] += 1
+
+    def _disk_get(self, key: str) -> Any:
+        with self._lock:
+            row = self._pending.get(key)
+            if row is None:
+                row = self._conn.execute(
+                    f"SELECT value, expires_at FROM {self.table} WHERE key = ?", (key,)
+                ).fetchone()
+        if row is None or (row[1] is not None and row[1] <= time.time()):
+            self._count("misses")
+            return _MISSING
+        value = json.loads(row[0])
+        self.memory.set(key, value, expires_at=row[1])
+        self._count("disk_hits")
+        return value
+
+    def get(self, key: str, default: Any = None) -> Any:
+        value = self.memory.get(key, _MISSING)
+        if value is not _MISSING:
+            self._count("memory_hits")
+            return value
+        value = self._disk_get(key)
+        return default if value is _MISSING else value
+
+    async def aget(self, key: str, default: Any = None) -> Any:
+        """Like get(), but a memory miss is looked up on disk in the default executor."""
+        value = self.memory.get(key, _MISSING)
+        if value is not _MISSING:
+            self._count("memory_hits")
+            return value
+        value = await asyncio.get_running_loop().run_in_executor(None, self._disk_get, key)
+        return default if value is _MISSING else value
+
+    def set(self, key: str, value: Any) -> None:
+        expires_at = time.time() + self.ttl_seconds if self.ttl_seconds is not None else None
+        self.memory.set(key, value, expires_at=expires_at)
+        with self._lock:
+            self._pending[key] = (json.dumps(value), expires_at)
+            self._counters["writes"] += 1
+            if self._writer is None:
+                self._writer = threading.Thread(target=self._write_behind, name=f"cache-{self.table}", daemon=True)
+                self._writer.start()
+
+    def _write_behind(self) -> None:
+        while True:
+            self._flush_requested.wait(config.SCORE_CACHE_FLUSH_SECONDS)
+            self._flush_requested.clear()
+            try:
+                self.flush()
+            except sqlite3.Error:
+                logging.exception("Could not write cache entries to %s", self.path)
+
+    def flush(self) -> int:
+        """Writes pending entries to disk in one transaction and returns how many were written."""
+        with self._lock:
+            if not self._pending:
+                return 0
+            rows = [(key, value, expires_at) for key, (value, expires_at) in self._pending.items()]
+            self._conn.executemany(
+                f"INSERT OR REPLACE INTO {self.table} (key, value, expires_at) VALUES (?, ?, ?)", rows
+            )
+            self._conn.commit()
+            self._pending.clear()
+            return len(rows)
+
+    def purge_expired(self) -> int:
+        """Deletes expired rows from the on-disk tier and returns how many were removed."""
+        self.flush()
+        with self._lock:
+            cursor = self._conn.execute(
+                f"DELETE FROM {self.table} WHERE expires_at IS NOT NULL AND expires_at <= ?",
+                (time.time(),),
+            )
+            self._conn.commit()
+            return cursor.rowcount
+
+    def clear(self) -> None:
+        self.memory.clear()
+        with self._lock:
+            self._pending.clear()
+            self._conn.execute(f"DELETE FROM {self.table}")
+            self._conn.commit()
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            stats = dict(self._counters)
+            stats["pending_writes"] = len(self._pending)
+        lookups = stats["memory_hits"] + stats["disk_hits"] + stats["misses"]
+        stats["hit_rate"] = (stats["memory_hits"] + stats["disk_hits"]) / lookups if lookups else 0.0
+        stats["memory_entries"] = len(self.memory)
+        return stats
+
+
+def make_cache_key(**parts: Any) -> str:
+    """
+    Builds a stable content-addressed key from the given keyword arguments.
+    Any 'prompt_template' part is replaced by its SHA-256 digest before hashing.
+    """
+    if "prompt_template" in parts:
+        parts["prompt_template"] = hashlib.sha256(parts["prompt_template"].encode("utf-8")).hexdigest()
+    payload = json.dumps(parts, sort_keys=True, ensure_ascii=False)
+    return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+
+_score_cache: Optional[TwoTierCache] = None
+_score_cache_lock = threading.Lock()
+
+
+def get_score_cache() -> Optional[TwoTierCache]:
+    """
+    Returns the process-wide relevance score cache, creating it on first use.
+    Returns None when config.SCORE_CACHE_ENABLED is False.
+    """
+    global _score_cache
+    if not config.SCORE_CACHE_ENABLED:
+        return None
+    if _score_cache is None:
+        with _score_cache_lock:
+            if _score_cache is None:
+                try:
+                    _score_cache = TwoTierCache(
+                        config.SCORE_CACHE_PATH,
+                        "relevance_scores",
+                        config.SCORE_CACHE_MAX_ENTRIES,
+                        config.SCORE_CACHE_TTL_SECONDS,
+                    )
+                except sqlite3.Error:
+                    logging.exception("Could not open score cache at %s", config.SCORE_CACHE_PATH)
+                    return None
+    return _score_cache
+
+
+_intent_cache: Optional[TwoTierCache] = None
+
+
+def get_intent_cache() -> Optional[TwoTierCache]:
+    """
+    Returns the process-wide query-intent cache (a separate table in the score cache file),
+    creating it on first use. Returns None when config.SCORE_CACHE_ENABLED is False.
+    """
+    global _intent_cache
+    if not config.SCORE_CACHE_ENABLED:
+        return None
+    if _intent_cache is None:
+        with _score_cache_lock:
+            if _intent_cache is None:
+                try:
+                    _intent_cache = TwoTierCache(
+                        config.SCORE_CACHE_PATH,
+                        "query_intents",
+                        config.SCORE_CACHE_MAX_ENTRIES,
+                        config.QUERY_INTENT_CACHE_TTL_SECONDS,
+                    )
+                except sqlite3.Error:
+                    logging.exception("Could not open query intent cache at %s", config.SCORE_CACHE_PATH)
+                    return None
+    return _intent_cache
@@ -0,0 +1,156 @@
+import asyncio
+import threading
+from collections import deque
+from concurrent.futures import Future
+from typing import Any, AsyncIterator, Coroutine, Iterator, Optional
+
+import src.config as config
+
+
+class ConcurrencyBudget:
+    """
+    Process-wide async limit on the number of in-flight calls.
+    Unlike asyncio.Semaphore it is not bound to a single event loop: coroutines running on any
+    loop, in any thread, draw from the same budget. The limit can be changed at runtime.
+    """
+
+    def __init__(self, limit: int):
+        self._limit = limit
+        self._in_flight = 0
+        self._waiters: deque = deque()
+        self._lock = threading.Lock()
+
+    @property
+    def limit(self) -> int:
+        return self._limit
+
+    @property
+    def in_flight(self) -> int:
+        return self._in_flight
+
+    def set_limit(self, limit: int) -> None:
+        with self._lock:
+            self._limit = max(1, int(limit))
+            self._wake_waiters()
+
+    async def acquire(self) -> None:
+        loop = asyncio.get_running_loop()
+        with self._lock:
+            if self._in_flight < self._limit and not self._waiters:
+                self._in_flight += 1
+                return
+            waiter = loop.create_future()
+            self._waiters.append((loop, waiter))
+        try:
+            await waiter
+        except asyncio.CancelledError:
+            with self._lock:
+                try:
+                    self._waiters.remove((loop, waiter))
+                    queued = True
+                except ValueError:
+                    queued = False
+            # A slot granted just before cancellation must be handed back.
+            if not queued and waiter.done() and not waiter.cancelled():
+                self.release()
+            raise
+
+    def release(self) -> None:
+        with self._lock:
+            self._in_flight -= 1
+            self._wake_waiters()
+
+    def _wake_waiters(self) -> None:
+        # Must be called with self._lock held.
+        while self._waiters and self._in_flight < self._limit:
+            loop, waiter = self._waiters.popleft()
+            if loop.is_closed():
+                continue
+            self._in_flight += 1
+            loop.call_soon_threadsafe(self._grant, waiter)
+
+    def _grant(self, waiter: asyncio.Future) -> None:
+        if waiter.done():
+            # The waiter was cancelled after the slot was assigned to it.
+            self.release()
+        else:
+            waiter.set_result(None)
+
+    async def __aenter__(self) -> "ConcurrencyBudget":
+        await self.acquire()
+        return self
+
+    async def __aexit__(self, *exc_info: Any) -> None:
+        self.release()
+
+
+_llm_budget = ConcurrencyBudget(config.DEFAULT_CONCURRENT_PROCESSES)
+_configured_limit = config.DEFAULT_CONCURRENT_PROCESSES
+
+
+def get_llm_budget() -> ConcurrencyBudget:
+    """
+    Returns the budget shared by every LLM call in the process.
+    It starts at config.DEFAULT_CONCURRENT_PROCESSES and is reset whenever that setting changes
+    (e.g. from the Settings tab); in between, the scheduler adapts it to provider rate limits.
+    """
+    global _configured_limit
+    if _configured_limit != config.DEFAULT_CONCURRENT_PROCESSES:
+        _configured_limit = config.DEFAULT_CONCURRENT_PROCESSES
+        _llm_budget.set_limit(_configured_limit)
+    return _llm_budget
+
+
+_background_loop: Optional[asyncio.AbstractEventLoop] = None
+_background_thread: Optional[threading.Thread] = None
+_background_lock = threading.Lock()
+
+
+def _get_background_loop() -> asyncio.AbstractEventLoop:
+    global _background_loop, _background_thread
+    with _background_lock:
+        if _background_loop is None:
+            _background_loop = asyncio.new_event_loop()
+            _background_thread = threading.Thread(
+                target=_background_loop.run_forever, name="llm-event-loop", daemon=True
+            )
+            _background_thread.start()
+    return _background_loop
+
+
+def run_sync(coro: Coroutine) -> Any:
+    """
+    Runs a coroutine to completion from synchronous code and returns its result.
+    All sync callers share one long-lived background event loop, so async HTTP clients keep
+    their connection pools between calls instead of being tied to a short-lived loop.
+    """
+    loop = _get_background_loop()
+    if threading.current_thread() is _background_thread:
+        raise RuntimeError("run_sync() cannot be called from the background event loop")
+    return asyncio.run_coroutine_threadsafe(coro, loop).result()
+
+
+def submit(coro: Coroutine) -> Future:
+    """Schedules a coroutine on the background event loop without waiting for it."""
+    return asyncio.run_coroutine_threadsafe(coro, _get_background_loop())
+
+
+async def _anext(iterator: AsyncIterator) -> Any:
+    return await iterator.__anext__()
+
+
+def iterate_sync(iterator: AsyncIterator) -> Iterator:
+    """
+    Drives an async iterator on the background event loop and yields its items to sync code.
+    If the consumer stops early, the async iterator is closed so it can cancel pending work.
+    """
+    try:
+        while True:
+            try:
+                yield run_sync(_anext(iterator))
+            except StopAsyncIteration:
+                return
+    finally:
+        aclose = getattr(iterator, "aclose", None)
+        if aclose is not None:
+            run_sync(aclose())
@@ -1,7 +1,7 @@
 # src/config.py
 
-# Default prompt templates
-DEFAULT_POINTWISE_PROMPT = (
+# Relevance rubric shared by the pointwise prompt templates
+POINTWISE_RUBRIC = (
     """You are an expert document relevance rater. Your task is to assess the relevance of a document to a given intent and assign a rating from the following scale: 2, 1, 0, or "unknown".
 
     Here are the rating guidelines:
@@ -35,22 +35,176 @@ DEFAULT_POINTWISE_PROMPT = (
     2.  Determine the degree to which the document satisfies the intent based on the rating guidelines.
     3.  Assign the appropriate rating (2, 1, 0, or "unknown").
     
-    Query: \"{query}\"\n\nDocument: \"{document}\"\n\nScore:"""
+    """
+)
+
+# Default prompt templates
+# {intent_block} is the cached query intent line (see QUERY_INTENT_ENABLED), or empty
+DEFAULT_POINTWISE_PROMPT = POINTWISE_RUBRIC + "Query: \"{query}\"\n{intent_block}\nDocument: \"{document}\"\n\nScore:"
+
+# Batched pointwise template: scores several documents per call, one entry per document
+DEFAULT_POINTWISE_BATCH_PROMPT = POINTWISE_RUBRIC + (
+    "Rate each of the numbered documents below independently against the same query. "
+    "Return one object per document with 'index' (the document number, starting at 1) and "
+    "'score' (its rating).\n\n"
+    "Query: \"{query}\"\n{intent_block}\nDocuments:\n\n{documents_block}"
+)
+
+# Single-token pointwise template for the "logprobs" scoring mode (see DEFAULT_POINTWISE_SCORING_MODE)
+DEFAULT_POINTWISE_LOGPROB_PROMPT = POINTWISE_RUBRIC + (
+    "Reply with the digit of your rating only: 2, 1 or 0.\n\n"
+    "Query: \"{query}\"\n{intent_block}\nDocument: \"{document}\"\n\nRating:"
 )
 
+# Static instructions first and the query last, so the instructions form a cacheable prefix
+# (see PROMPT_PREFIX_LAYOUT)
 DEFAULT_LISTWISE_PROMPT = (
-    "Rank the following search results for the query: '{query}' from most to least relevant. "
+    "Rank the search results below for the given query from most to least relevant. "
     "For each result, provide an object with 'index' (the original position, starting at 1), "
     "'score' (a relevance score between 1 and 10), and 'reasoning' (a brief explanation). "
-    "Also include a property 'query_intent' that describes how you interpreted the query. "
-    "Return the result as a JSON object with keys 'query_intent' and 'ranking'.\n\n"
+    "Return the result as a JSON object with the key 'ranking'.\n\n"
+    "Query: '{query}'\n{intent_block}\n"
     "{results_block}"
 )
 
+# Query-intent stage (see QUERY_INTENT_ENABLED)
+DEFAULT_QUERY_INTENT_PROMPT = (
+    "A user typed the search query below on a second-hand marketplace. In one or two sentences, "
+    "describe what they are looking for: the kind of item and any brand, model, size, material or "
+    "other attribute the query requires. Do not list results.\n\n"
+    "Query: \"{query}\""
+)
+
 # LLM configuration defaults
-DEFAULT_LLM_PROVIDER = "ChatOpenAI"  # Options: "ChatOpenAI", "ChatGemini", "ChatBedrock"
+DEFAULT_LLM_PROVIDER = "ChatOpenAI"  # Options: "ChatOpenAI", "ChatGemini", "ChatBedrock", "Stub" (offline, see src/stub_llm.py), "Replay" (see src/replay_llm.py)
 DEFAULT_LLM_MODEL = "gpt-4o-mini"      # For ChatOpenAI; for ChatGemini, e.g., "gemini-model-1"; for ChatBedrock, e.g., "amazon.titan-text-express-v1"
 DEFAULT_LLM_TEMPERATURE = 0.0
 
-# Default number of concurrent processes for pointwise ranking
+# Initial number of in-flight LLM calls shared by all queries in the process
+# (the scheduler adapts it between 1 and LLM_MAX_CONCURRENCY)
 DEFAULT_CONCURRENT_PROCESSES = 5
+
+# Relevance score cache (in-process LRU in front of a SQLite file)
+SCORE_CACHE_ENABLED = True
+SCORE_CACHE_PATH = ".cache/llm_cache.sqlite"
+SCORE_CACHE_MAX_ENTRIES = 10000
+SCORE_CACHE_TTL_SECONDS = 7 * 24 * 3600  # One week
+SCORE_CACHE_FLUSH_SECONDS = 0.5  # Interval of the batched write-behind commits to the SQLite file
+
+# Number of documents scored per pointwise LLM call (1 = one call per document)
+DEFAULT_POINTWISE_BATCH_SIZE = 1
+
+# Pointwise scoring mode: "structured" (score returned through structured output) or "logprobs"
+# (a one-token grade; the score is the expected grade under the top LOGPROB_TOP_K token
+# log-probabilities, with a confidence). Providers not in LOGPROB_PROVIDERS use "structured".
+DEFAULT_POINTWISE_SCORING_MODE = "structured"
+LOGPROB_PROVIDERS = ("ChatOpenAI", "Stub")
+LOGPROB_TOP_K = 5
+
+# Sliding-window listwise ranking: lists longer than the window are ranked in overlapping
+# windows (0 disables windowing and always sends the whole list in one prompt)
+DEFAULT_LISTWISE_WINDOW_SIZE = 20
+DEFAULT_LISTWISE_WINDOW_STRIDE = 10
+
+# Cascade ranking: a BM25 first stage keeps the top M results for the LLM ("listwise" or "pointwise")
+DEFAULT_CASCADE_TOP_M = 15
+DEFAULT_CASCADE_SECOND_STAGE = "pointwise"
+
+# LLM scheduler (src/scheduler.py): per-provider rate limits, retries and adaptive concurrency.
+# Adjust the rate limits to your account tier.
+LLM_RATE_LIMITS = {
+    "ChatOpenAI": {"rpm": 500, "tpm": 200000},
+    "ChatGemini": {"rpm": 1000, "tpm": 1000000},
+    "ChatBedrock": {"rpm": 400, "tpm": 300000},
+    "Stub": {"rpm": 1000000, "tpm": 1000000000},
+    "Replay": {"rpm": 1000000, "tpm": 1000000000},
+    "default": {"rpm": 300, "tpm": 100000},
+}
+LLM_EXPECTED_OUTPUT_TOKENS = 100     # Added to the prompt estimate when reserving TPM
+LLM_MAX_RETRIES = 5
+LLM_BACKOFF_BASE_SECONDS = 1.0
+LLM_BACKOFF_MAX_SECONDS = 60.0
+LLM_MAX_CONCURRENCY = 32             # Ceiling for the adaptive concurrency budget
+LLM_CONCURRENCY_INCREASE_EVERY = 10  # Successful calls between +1 concurrency steps
+
+# Wallapop search HTTP client
+SEARCH_CONNECT_TIMEOUT_SECONDS = 3.05
+SEARCH_READ_TIMEOUT_SECONDS = 10.0
+SEARCH_MAX_RETRIES = 3
+SEARCH_BACKOFF_FACTOR = 0.5
+SEARCH_POOL_SIZE = 10
+
+# Search result cache, keyed by normalized query and geohash cell of the search location
+SEARCH_CACHE_ENABLED = True
+SEARCH_CACHE_GEOHASH_PRECISION = 6   # ~1.2 km x 0.6 km cells
+SEARCH_CACHE_TTL_SECONDS = 600
+SEARCH_CACHE_MAX_ENTRIES = 512
+
+# CSV bulk pipeline (src/pipeline.py): keywords searched / ranked at once, and how many searched
+# keywords may wait for ranking
+BULK_SEARCH_CONCURRENCY = 4
+BULK_RANK_CONCURRENCY = 4
+BULK_PREFETCH = 8
+
+# Offline stub chat model used by the "Stub" provider and the benchmark (src/benchmark.py)
+STUB_LLM_SETTINGS = {"latency_ms": 300.0, "latency_sigma": 0.3, "error_rate": 0.0, "seed": 0}
+
+# Record/replay provider ("Replay"): answers from a cassette file, calling REPLAY_UPSTREAM_PROVIDER
+# on misses when REPLAY_MISS_POLICY is "record" ("fail" raises instead)
+REPLAY_CASSETTE_PATH = "cassettes/llm_replay.jsonl"
+REPLAY_UPSTREAM_PROVIDER = "ChatOpenAI"
+REPLAY_MISS_POLICY = "record"
+
+# Per-call instrumentation (src/instrumentation.py)
+INSTRUMENTATION_ENABLED = True
+INSTRUMENTATION_SAMPLE_SIZE = 10000     # Latency samples kept per (stage, provider, model) for percentiles
+INSTRUMENTATION_OTEL_ENABLED = False    # Also emit OpenTelemetry spans (requires opentelemetry-api)
+INSTRUMENTATION_GRAPH_CALLBACKS = True  # Attach the instrumentation handler to the enrichment graph (LangGraph)
+
+# Token budget for listing text in prompts (src/prompt_budget.py): documents are normalized
+# (emoji, repeated punctuation, whitespace) and truncated fairly; 0 disables a limit
+PROMPT_BUDGET_ENABLED = True
+PROMPT_DOCUMENT_MAX_TOKENS = 200     # Per listing
+PROMPT_DOCUMENTS_MAX_TOKENS = 3000   # All listings of one prompt together
+
+# Near-duplicate collapse (src/dedup.py): results whose title + description SimHash fingerprints
+# differ in at most DEDUP_MAX_HAMMING_DISTANCE of 64 bits are scored once per cluster
+DEDUP_ENABLED = True
+DEDUP_MAX_HAMMING_DISTANCE = 3
+
+# Prompt layout (src/prompts.py): the static part of each template (rubric, instructions) is sent
+# as a system message ahead of the variable query/documents, so provider prompt caching can reuse it.
+# PROMPT_CACHE_CONTROL additionally marks the prefix with an explicit cache_control breakpoint for
+# the listed providers. Only list providers whose client sends message content blocks to an
+# Anthropic model (the prefix must also reach the provider's minimum cacheable length). None of
+# the current registry providers qualify: "ChatBedrock" is built as BedrockLLM, a text-completion
+# client that flattens messages into one string, so the marker would be dropped.
+PROMPT_PREFIX_LAYOUT = True
+PROMPT_CACHE_CONTROL = False
+PROMPT_CACHE_CONTROL_PROVIDERS = ()
+
+# Embedding scorer (src/scorers.py EmbeddingScorer). Providers: "Hashing" (local, offline),
+# "OpenAI", "HuggingFace" (local sentence-transformers, requires langchain-huggingface), "Fake" (tests)
+EMBEDDING_PROVIDER = "Hashing"
+EMBEDDING_MODEL = "text-embedding-3-small"  # For OpenAI; for HuggingFace, e.g., "sentence-transformers/paraphrase-multilingual-MiniLM-L12-v2"
+EMBEDDING_DIMENSIONS = 512                  # Hashing and Fake providers
+
+# On-disk embedding store (src/embedding_store.py): listing vectors are reused across queries,
+# runs and worker processes instead of being recomputed
+EMBEDDING_STORE_ENABLED = True
+EMBEDDING_STORE_PATH = ".cache/embeddings"
+EMBEDDING_STORE_DTYPE = "float16"    # "float16" or "int8" (4x smaller than float32)
+EMBEDDING_STORE_EXACT_BELOW = 5000   # Brute-force search below this many vectors, LSH above
+EMBEDDING_STORE_LSH_TABLES = 8
+EMBEDDING_STORE_LSH_BITS = 12
+
+# Query-intent stage: the intent is extracted once per normalized query and model, cached next to
+# the relevance scores, and injected into the pointwise and listwise prompts
+QUERY_INTENT_ENABLED = True
+QUERY_INTENT_CACHE_TTL_SECONDS = 30 * 24 * 3600  # 30 days
+
+# Rank fusion (src/fusion.py): weighted reciprocal rank fusion of the search engine order and the
+# listwise and pointwise rankings, refined as each ranker finishes (weight 0 skips a ranker)
+FUSION_WEIGHTS = {"baseline": 1.0, "listwise": 1.0, "pointwise": 1.0}
+FUSION_RRF_K = 60
+FUSION_DEADLINE_SECONDS = 5.0        # Latency budget; rankers not done by then are left out (None waits)
@@ -0,0 +1,69 @@
+import hashlib
+from collections import Counter
+from typing import Dict, List, Optional
+
+import src.config as config
+from src.lexical import tokenize
+
+_SIMHASH_BITS = 64
+
+
+def _feature_hash(feature: str) -> int:
+    # Stable across processes, unlike hash().
+    return int.from_bytes(hashlib.blake2b(feature.encode("utf-8"), digest_size=8).digest(), "big")
+
+
+def simhash(text: str) -> int:
+    """
+    64-bit SimHash of text over its word unigrams and bigrams (see src/lexical.py tokenize), weighted
+    by frequency. Texts that share most of their words get fingerprints a few bits apart.
+    """
+    tokens = tokenize(text)
+    features = Counter(tokens)
+    features.update(f"{a} {b}" for a, b in zip(tokens, tokens[1:]))
+    weights = [0] * _SIMHASH_BITS
+    for feature, count in features.items():
+        h = _feature_hash(feature)
+        for bit in range(_SIMHASH_BITS):
+            weights[bit] += count if h >> bit & 1 else -count
+    return sum(1 << bit for bit, weight in enumerate(weights) if weight > 0)
+
+
+def hamming_distance(a: int, b: int) -> int:
+    return bin(a ^ b).count("1")
+
+
+def cluster_near_duplicates(texts: List[str], max_distance: Optional[int] = None) -> List[int]:
+    """
+    Groups near-duplicate texts: two texts are linked when their SimHash fingerprints differ in
+    at most max_distance bits (default: config.DEDUP_MAX_HAMMING_DISTANCE), and clusters are the
+    connected groups of links. Returns, for each text, the index of its cluster's representative,
+    which is the cluster's first text (so texts without duplicates map to themselves).
+    """
+    max_distance = config.DEDUP_MAX_HAMMING_DISTANCE if max_distance is None else max_distance
+    fingerprints = [simhash(text) for text in texts]
+    parent = list(range(len(texts)))
+
+    def find(i: int) -> int:
+        while parent[i] != i:
+            parent[i] = parent[parent[i]]
+            i = parent[i]
+        return i
+
+    for i in range(len(texts)):
+        for j in range(i + 1, len(texts)):
+            if hamming_distance(fingerprints[i], fingerprints[j]) <= max_distance:
+                root_i, root_j = find(i), find(j)
+                if root_i != root_j:
+                    # The lower index stays the root, so it is the cluster's first text.
+                    parent[max(root_i, root_j)] = min(root_i, root_j)
+    return [find(i) for i in range(len(texts))]
+
+
+def cluster_members(representatives: List[int]) -> Dict[int, List[int]]:
+    """Maps each representative index to the indices of the other members of its cluster."""
+    members: Dict[int, List[int]] = {i: [] for i in set(representatives)}
+    for i, representative in enumerate(representatives):
+        if i != representative:
+            members[representative].append(i)
+    return members
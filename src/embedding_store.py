@@ -0,0 +1,292 @@
+import asyncio
+import hashlib
+import json
+import logging
+import os
+import re
+import threading
+from contextlib import contextmanager
+from typing import Dict, Iterator, List, Optional, Sequence, Tuple
+
+import numpy as np
+from langchain_core.embeddings import Embeddings
+
+import src.config as config
+
+try:
+    import fcntl
+except ImportError:  # Windows: appends are only serialised within the process
+    fcntl = None
+
+_DTYPES = ("float16", "int8")
+
+
+def content_key(text: str) -> str:
+    """Stable key of a listing text (SHA-256 of the text)."""
+    return hashlib.sha256(text.encode("utf-8")).hexdigest()
+
+
+class _LSHIndex:
+    """
+    Random-hyperplane LSH over unit vectors: num_tables tables keyed by num_bits sign bits each.
+    Rows whose signature matches the query's in any table are the candidates for exact re-scoring.
+    """
+
+    def __init__(self, dimensions: int, num_tables: int, num_bits: int, seed: int = 0):
+        rng = np.random.default_rng(seed)
+        self.num_tables = num_tables
+        self.planes = rng.standard_normal((dimensions, num_tables * num_bits)).astype(np.float32)
+        self.weights = (1 << np.arange(num_bits, dtype=np.int64))
+        self.num_bits = num_bits
+        self.tables: List[Dict[int, List[int]]] = [{} for _ in range(num_tables)]
+        self.size = 0
+
+    def _signatures(self, vectors: np.ndarray) -> np.ndarray:
+        bits = (vectors @ self.planes > 0).reshape(len(vectors), self.num_tables, self.num_bits)
+        return bits @ self.weights
+
+    def add(self, vectors: np.ndarray) -> None:
+        for offset, signatures in enumerate(self._signatures(vectors)):
+            for table, signature in zip(self.tables, signatures):
+                table.setdefault(int(signature), []).append(self.size + offset)
+        self.size += len(vectors)
+
+    def candidates(self, query: np.ndarray) -> np.ndarray:
+        rows = set()
+        for table, signature in zip(self.tables, self._signatures(query[None, :])[0]):
+            rows.update(table.get(int(signature), ()))
+        return np.fromiter(rows, dtype=np.int64, count=len(rows))
+
+
+class EmbeddingStore:
+    """
+    Append-only on-disk store of unit-normalised embeddings under string keys (StoredEmbeddings
+    uses content hashes).
+    Vectors are kept as float16 or int8 (with one float32 scale per row) in a flat binary file that
+    is memory-mapped read-only, so worker processes share one copy through the page cache; appends
+    from several processes are serialised with a file lock. search() uses an in-memory LSH index
+    built from the mapped vectors and falls back to exact brute force for small stores, too few
+    candidates, or exact=True.
+
+    Files in the store directory: meta.json (dimensions, dtype), vectors.bin, scales.bin (int8
+    only) and keys.jsonl, whose line number is the row. Rows are written before their keys, and
+    before appending, add() truncates vectors.bin and scales.bin to one row per stored key (and
+    keys.jsonl to its last complete line), so rows orphaned by a crash between the writes are
+    discarded instead of shifting the rows of later keys.
+    """
+
+    def __init__(self, path: str, dtype: str = "float16"):
+        if dtype not in _DTYPES:
+            raise ValueError("Unsupported embedding store dtype: " + dtype)
+        self.path = path
+        self.dtype = dtype
+        self.dimensions: Optional[int] = None
+        self._rows: Dict[str, int] = {}
+        self._keys: List[str] = []
+        self._keys_offset = 0
+        self._vectors: Optional[np.ndarray] = None
+        self._scales: Optional[np.ndarray] = None
+        self._index: Optional[_LSHIndex] = None
+        self._lock = threading.RLock()
+        os.makedirs(path, exist_ok=True)
+        self._refresh()
+
+    def _file(self, name: str) -> str:
+        return os.path.join(self.path, name)
+
+    @contextmanager
+    def _file_lock(self) -> Iterator[None]:
+        with open(self._file(".lock"), "a") as lock_file:
+            if fcntl is not None:
+                fcntl.flock(lock_file, fcntl.LOCK_EX)
+            try:
+                yield
+            finally:
+                if fcntl is not None:
+                    fcntl.flock(lock_file, fcntl.LOCK_UN)
+
+    def _refresh(self) -> None:
+        """Picks up rows appended since the last call (by this or another process)."""
+        keys_path = self._file("keys.jsonl")
+        if self.dimensions is None and os.path.exists(self._file("meta.json")):
+            with open(self._file("meta.json"), encoding="utf-8") as f:
+                meta = json.load(f)
+            self.dimensions, self.dtype = meta["dimensions"], meta["dtype"]
+        if self.dimensions is None or not os.path.exists(keys_path):
+            return
+        if os.path.getsize(keys_path) == self._keys_offset:
+            return
+        with open(keys_path, "rb") as f:
+            f.seek(self._keys_offset)
+            for line in f:
+                if not line.endswith(b"\n"):
+                    break  # Partially written by a concurrent append; read it next time.
+                key = json.loads(line)
+                self._rows[key] = len(self._keys)
+                self._keys.append(key)
+                self._keys_offset += len(line)
+        count = len(self._keys)
+        self._vectors = np.memmap(self._file("vectors.bin"), dtype=self.dtype, mode="r", shape=(count, self.dimensions))
+        if self.dtype == "int8":
+            self._scales = np.memmap(self._file("scales.bin"), dtype=np.float32, mode="r", shape=(count,))
+        if self._index is not None and self._index.size < count:
+            self._index.add(self._decode(np.arange(self._index.size, count)))
+
+    def __len__(self) -> int:
+        with self._lock:
+            self._refresh()
+            return len(self._rows)
+
+    def __contains__(self, key: str) -> bool:
+        with self._lock:
+            self._refresh()
+            return key in self._rows
+
+    def _decode(self, rows: np.ndarray) -> np.ndarray:
+        vectors = np.asarray(self._vectors[rows], dtype=np.float32)
+        if self.dtype == "int8":
+            vectors *= self._scales[rows][:, None]
+        return vectors
+
+    def get(self, keys: Sequence[str]) -> List[Optional[np.ndarray]]:
+        """Returns the stored (unit-normalised, float32) vector of each key, or None if missing."""
+        with self._lock:
+            self._refresh()
+            rows = [self._rows.get(key) for key in keys]
+            found = [row for row in rows if row is not None]
+            decoded = iter(self._decode(np.array(found, dtype=np.int64))) if found else iter(())
+            return [next(decoded) if row is not None else None for row in rows]
+
+    def add(self, keys: Sequence[str], vectors: Sequence[Sequence[float]]) -> int:
+        """Appends the vectors of keys not stored yet and returns how many were added."""
+        if not keys:
+            return 0
+        vectors = np.asarray(vectors, dtype=np.float32)
+        vectors = vectors / np.maximum(np.linalg.norm(vectors, axis=1, keepdims=True), 1e-12)
+        with self._lock, self._file_lock():
+            self._refresh()
+            if self.dimensions is None:
+                self.dimensions = vectors.shape[1]
+                with open(self._file("meta.json"), "w", encoding="utf-8") as f:
+                    json.dump({"dimensions": self.dimensions, "dtype": self.dtype}, f)
+            if vectors.shape[1] != self.dimensions:
+                raise ValueError(f"Expected {self.dimensions}-dimensional vectors, got {vectors.shape[1]}")
+            new = {}
+            for key, vector in zip(keys, vectors):
+                if key not in self._rows and key not in new:
+                    new[key] = vector
+            if not new:
+                return 0
+            self._truncate_orphans()
+            block = np.stack(list(new.values()))
+            if self.dtype == "int8":
+                scales = np.maximum(np.abs(block).max(axis=1), 1e-12) / 127.0
+                with open(self._file("scales.bin"), "ab") as f:
+                    f.write(scales.astype(np.float32).tobytes())
+                block = np.round(block / scales[:, None]).astype(np.int8)
+            with open(self._file("vectors.bin"), "ab") as f:
+                f.write(block.astype(self.dtype).tobytes())
+            with open(self._file("keys.jsonl"), "ab") as f:
+                f.write("".join(json.dumps(key) + "\n" for key in new).encode("utf-8"))
+            self._refresh()
+            return len(new)
+
+    def _truncate_orphans(self) -> None:
+        # Must be called with the file lock held, after _refresh(): drops rows (or partial rows)
+        # written by an append that crashed before its keys were, and a partial last key line.
+        count = len(self._keys)
+        files = [("keys.jsonl", self._keys_offset), ("vectors.bin", count * self.dimensions * np.dtype(self.dtype).itemsize)]
+        if self.dtype == "int8":
+            files.append(("scales.bin", count * np.dtype(np.float32).itemsize))
+        for name, size in files:
+            path = self._file(name)
+            if os.path.exists(path) and os.path.getsize(path) > size:
+                logging.warning("Discarding %d orphaned bytes at the end of %s", os.path.getsize(path) - size, path)
+                with open(path, "r+b") as f:
+                    f.truncate(size)
+
+    def search(self, query: Sequence[float], k: int = 10, exact: bool = False) -> List[Tuple[str, float]]:
+        """
+        Returns up to k (key, cosine similarity) pairs, most similar first. Uses the LSH index
+        unless exact is set or the store has fewer than config.EMBEDDING_STORE_EXACT_BELOW rows;
+        if the index yields fewer than k candidates the search falls back to brute force.
+        """
+        query = np.asarray(query, dtype=np.float32)
+        query = query / max(float(np.linalg.norm(query)), 1e-12)
+        with self._lock:
+            self._refresh()
+            count = len(self._rows)
+            if count == 0:
+                return []
+            rows = None
+            if not exact and count >= config.EMBEDDING_STORE_EXACT_BELOW:
+                if self._index is None:
+                    self._index = _LSHIndex(self.dimensions, config.EMBEDDING_STORE_LSH_TABLES, config.EMBEDDING_STORE_LSH_BITS)
+                    self._index.add(self._decode(np.arange(count)))
+                rows = self._index.candidates(query)
+                if len(rows) < k:
+                    rows = None
+            if rows is None:
+                rows = np.arange(count)
+            similarities = self._decode(rows) @ query
+            top = np.argsort(-similarities)[:k]
+            return [(self._keys[rows[i]], float(similarities[i])) for i in top]
+
+
+class StoredEmbeddings(Embeddings):
+    """
+    Embeddings wrapper that reuses document vectors from an EmbeddingStore, keyed by content hash,
+    and only sends texts it has not seen before to the wrapped model. Query vectors are not stored.
+    """
+
+    def __init__(self, embeddings: Embeddings, store: EmbeddingStore):
+        self.embeddings = embeddings
+        self.store = store
+
+    def embed_documents(self, texts: List[str]) -> List[List[float]]:
+        keys = [content_key(text) for text in texts]
+        vectors = self.store.get(keys)
+        missing = [i for i, vector in enumerate(vectors) if vector is None]
+        if missing:
+            self.store.add([keys[i] for i in missing], self.embeddings.embed_documents([texts[i] for i in missing]))
+            vectors = self.store.get(keys)
+        return [vector.tolist() for vector in vectors]
+
+    async def aembed_documents(self, texts: List[str]) -> List[List[float]]:
+        # Store reads and appends are file I/O, so they run in a worker thread.
+        keys = [content_key(text) for text in texts]
+        vectors = await asyncio.to_thread(self.store.get, keys)
+        missing = [i for i, vector in enumerate(vectors) if vector is None]
+        if missing:
+            new_vectors = await self.embeddings.aembed_documents([texts[i] for i in missing])
+            await asyncio.to_thread(self.store.add, [keys[i] for i in missing], new_vectors)
+            vectors = await asyncio.to_thread(self.store.get, keys)
+        return [vector.tolist() for vector in vectors]
+
+    def embed_query(self, text: str) -> List[float]:
+        return self.embeddings.embed_query(text)
+
+    async def aembed_query(self, text: str) -> List[float]:
+        return await self.embeddings.aembed_query(text)
+
+
+_stores: Dict[str, EmbeddingStore] = {}
+_stores_lock = threading.Lock()
+
+
+def get_embedding_store(provider: Optional[str] = None, model: Optional[str] = None) -> EmbeddingStore:
+    """
+    Returns the store for vectors of (provider, model), in its own directory under
+    config.EMBEDDING_STORE_PATH so that vectors of different models never mix.
+    """
+    provider = provider or config.EMBEDDING_PROVIDER
+    model = model or config.EMBEDDING_MODEL
+    if provider in ("Hashing", "Fake"):
+        model = f"{config.EMBEDDING_DIMENSIONS}d"
+    name = re.sub(r"[^A-Za-z0-9._-]+", "_", f"{provider}-{model}")
+    path = os.path.join(config.EMBEDDING_STORE_PATH, name)
+    with _stores_lock:
+        store = _stores.get(path)
+        if store is None:
+            store = _stores[path] = EmbeddingStore(path, config.EMBEDDING_STORE_DTYPE)
+    return store
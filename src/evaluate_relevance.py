@@ -1,14 +1,13 @@
-import math
-import re
-from typing import List
-from langchain_openai import ChatOpenAI
+from typing import List, Optional
 from pydantic import BaseModel
 from dotenv import load_dotenv
 
-load_dotenv()
+from src.llm_registry import get_structured_llm
+from src.metrics import calculate_ndcg
+from src.prompt_budget import fit_document, fit_documents, normalize_text
+from src.scheduler import LLMCallFailed, invoke_llm
 
-# Initialize the LLM (change to your desired model and parameters)
-llm = ChatOpenAI(model='gpt-4o-mini', temperature=0)  # or use your Ollama setup if needed
+load_dotenv()
 
 # Existing pointwise response model
 class LLMPointwiseResponse(BaseModel):
@@ -24,45 +23,36 @@ class LLMListwiseDetailedResponse(BaseModel):
     query_intent: str               # how the model understood the query
     ranking: List[LLMListwiseDetailedItem]  # list of ranked items
 
-def get_relevance_score(query: str, document: str) -> float:
+def get_relevance_score(query: str, document: str) -> Optional[float]:
     """
     Uses the LLM to rate the relevance of a document given a query.
     The prompt instructs the LLM to return a numeric score between 1 and 10.
+    Returns None (unscored) if the call fails after the scheduler's retries.
     """
     prompt = (
         f"Given the following query and document, "
         f"rate the semantic relevance on a scale of 1 to 10 and return only the numeric score.\n\n"
-        f"Query: \"{query}\"\n\nDocument: \"{document}\"\n\nScore:"
+        f"Query: \"{query}\"\n\nDocument: \"{fit_document(document)}\"\n\nScore:"
     )
     
-    response = llm.with_structured_output(LLMPointwiseResponse).invoke(prompt)
+    try:
+        response = invoke_llm(get_structured_llm(LLMPointwiseResponse), prompt, stage="evaluate_pointwise")
+    except LLMCallFailed:
+        return None
     return response.score
 
-def calculate_ndcg(scores):
-    """
-    Calculate the Normalized Discounted Cumulative Gain (NDCG) for a list of relevance scores.
-    DCG = sum((2^relevance - 1) / log2(i+2)) for i in 0...n-1.
-    IDCG is computed on the ideal (sorted) list.
-    """
-    def dcg(relevances):
-        return sum((2 ** rel - 1) / math.log2(i + 2) for i, rel in enumerate(relevances))
-    
-    dcg_val = dcg(scores)
-    ideal_scores = sorted(scores, reverse=True)
-    idcg_val = dcg(ideal_scores)
-    return dcg_val / idcg_val if idcg_val > 0 else 0
-
 def evaluate_results(query: str, results):
     """
     Iterates over search results and calls the LLM for each query-document pair.
     Returns the aggregated NDCG metric and a list of individual LLM scores.
+    Unscored documents (None) are excluded from the NDCG.
     """
     scores = []
     for item in results:
         document = f"{item.get('title', '')} {item.get('description', '')}"
         score = get_relevance_score(query, document)
         scores.append(score)
-    ndcg = calculate_ndcg(scores)
+    ndcg = calculate_ndcg([score for score in scores if score is not None])
     return ndcg, scores
 
 
@@ -83,13 +73,13 @@ def listwise_rank(query: str, results):
         "Also, include a property 'query_intent' that describes how you interpreted the query. "
         "Return the result as a JSON object with keys 'query_intent' and 'ranking'.\n\n"
     )
-    for idx, item in enumerate(results, start=1):
-        title = item.get('title', '')
-        description = item.get('description', '')
+    descriptions = fit_documents([item.get('description', '') for item in results])
+    for idx, (item, description) in enumerate(zip(results, descriptions), start=1):
+        title = normalize_text(item.get('title', ''))
         prompt += f"{idx}. Title: {title}\n   Description: {description}\n\n"
     
     # Get the structured response using our detailed schema
-    response = llm.with_structured_output(LLMListwiseDetailedResponse).invoke(prompt)
+    response = invoke_llm(get_structured_llm(LLMListwiseDetailedResponse), prompt, stage="evaluate_listwise")
     
     new_ranking = response.ranking
     query_intent = response.query_intent
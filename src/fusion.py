@@ -0,0 +1,168 @@
+import asyncio
+import logging
+import time
+from typing import AsyncIterator, Dict, Iterator, List, Optional, Tuple
+
+import src.config as config
+from src.concurrency import iterate_sync, run_sync
+
+BASELINE = "baseline"
+LISTWISE = "listwise"
+POINTWISE = "pointwise"
+
+
+class IncrementalFusion:
+    """
+    Weighted reciprocal rank fusion over the results of one query, updated one signal at a time.
+    Each signal is an ordering of (a subset of) the result positions; an item at rank r (1-based)
+    of signal s earns weights[s] / (k + r), and items a signal did not rank earn nothing from it.
+    ranking() can be called after any number of signals, so a fused order is always available.
+    """
+
+    def __init__(self, results: List[Dict], weights: Optional[Dict[str, float]] = None, k: Optional[int] = None):
+        self.results = results
+        self.weights = weights or config.FUSION_WEIGHTS
+        self.k = config.FUSION_RRF_K if k is None else k
+        self.signals: Dict[str, List[int]] = {}
+        self.signal_scores: Dict[str, Dict[int, Optional[float]]] = {}
+
+    def add_signal(self, name: str, order: List[int], scores: Optional[Dict[int, Optional[float]]] = None) -> None:
+        """Adds (or replaces) a signal: positions in rank order, and optionally the signal's raw score per position."""
+        self.signals[name] = order
+        self.signal_scores[name] = scores or {}
+
+    def add_ranked_items(self, name: str, ranked: List[Dict], positions: Dict[int, int], score_field: str = "llm_score") -> None:
+        """Adds a signal from ranked result dicts; positions maps id(item) to its position in results."""
+        order = [positions[id(item)] for item in ranked if id(item) in positions and item.get(score_field) is not None]
+        self.add_signal(name, order, {positions[id(item)]: item.get(score_field) for item in ranked if id(item) in positions})
+
+    def scores(self) -> List[float]:
+        fused = [0.0] * len(self.results)
+        for name, order in self.signals.items():
+            weight = self.weights.get(name, 1.0)
+            for rank, i in enumerate(order, start=1):
+                fused[i] += weight / (self.k + rank)
+        return fused
+
+    def ranking(self) -> List[Dict]:
+        """
+        Returns copies of the results in fused order (ties keep the search engine order), each with
+        'fused_score' and '<signal>_score' for every signal received so far.
+        """
+        fused = self.scores()
+        ranked = []
+        for i in sorted(range(len(self.results)), key=lambda i: (-fused[i], i)):
+            item = dict(self.results[i])
+            item['fused_score'] = fused[i]
+            for name, scores in self.signal_scores.items():
+                if i in scores:
+                    item[f'{name}_score'] = scores[i]
+            ranked.append(item)
+        return ranked
+
+
+async def _alistwise_signal(query: str, items: List[Dict]) -> AsyncIterator[List[Dict]]:
+    from src.ranking import alistwise_rank
+
+    ranked, _ = await alistwise_rank(query, items)
+    yield ranked
+
+
+async def _apointwise_signal(query: str, items: List[Dict]) -> AsyncIterator[List[Dict]]:
+    # The provisional ranking after every score, so partial pointwise scores are fused as they arrive.
+    from src.ranking import astream_re_rank
+
+    async for _, _, provisional in astream_re_rank(query, items):
+        yield provisional
+
+
+async def astream_fused_rank(
+    query: str,
+    results: List[Dict],
+    weights: Optional[Dict[str, float]] = None,
+    deadline_seconds: Optional[float] = None,
+) -> AsyncIterator[Tuple[List[Dict], List[str]]]:
+    """
+    Yields (fused_results, signals_so_far), first with the search engine order alone, then when
+    the listwise ranker finishes and each time another pointwise score arrives (the pointwise
+    signal ranks the items scored so far). Rankers still running when deadline_seconds (default:
+    config.FUSION_DEADLINE_SECONDS) have elapsed are cancelled, so the last ranking yielded is
+    whatever the time budget allowed, including a partial pointwise signal. To wait for every
+    ranker, set config.FUSION_DEADLINE_SECONDS to None (passing None here selects the config default).
+    Signals with weight 0 are not computed.
+    """
+    started = time.monotonic()
+    weights = weights or config.FUSION_WEIGHTS
+    deadline_seconds = config.FUSION_DEADLINE_SECONDS if deadline_seconds is None else deadline_seconds
+    fusion = IncrementalFusion(results, weights)
+    fusion.add_signal(BASELINE, list(range(len(results))))
+    yield fusion.ranking(), list(fusion.signals)
+
+    rankers = {LISTWISE: _alistwise_signal, POINTWISE: _apointwise_signal}
+    signals = {}
+    positions = {}
+    for name, ranker in rankers.items():
+        if weights.get(name, 1.0) <= 0:
+            continue
+        items = [dict(item) for item in results]
+        positions[name] = {id(item): i for i, item in enumerate(items)}
+        signals[name] = ranker(query, items)
+    tasks = {asyncio.ensure_future(anext(signal)): name for name, signal in signals.items()}
+    try:
+        while tasks:
+            timeout = None if deadline_seconds is None else deadline_seconds - (time.monotonic() - started)
+            if timeout is not None and timeout <= 0:
+                logging.info("Fusion deadline reached; %s still running", sorted(tasks.values()))
+                return
+            done, _ = await asyncio.wait(set(tasks), timeout=timeout, return_when=asyncio.FIRST_COMPLETED)
+            for task in done:
+                name = tasks.pop(task)
+                try:
+                    ranked = task.result()
+                except StopAsyncIteration:
+                    continue
+                except Exception:
+                    logging.exception("%s ranker failed; fusing what it ranked so far", name)
+                    continue
+                tasks[asyncio.ensure_future(anext(signals[name]))] = name
+                fusion.add_ranked_items(name, ranked, positions[name])
+                yield fusion.ranking(), list(fusion.signals)
+    finally:
+        for task in tasks:
+            task.cancel()
+        await asyncio.gather(*tasks, return_exceptions=True)
+        for signal in signals.values():
+            await signal.aclose()
+
+
+async def afused_rank(
+    query: str,
+    results: List[Dict],
+    weights: Optional[Dict[str, float]] = None,
+    deadline_seconds: Optional[float] = None,
+) -> Tuple[List[Dict], List[str]]:
+    """Returns the last (fused_results, signals) of astream_fused_rank, i.e. the best ranking within the deadline."""
+    latest = (results, [])
+    async for latest in astream_fused_rank(query, results, weights, deadline_seconds):
+        pass
+    return latest
+
+
+def stream_fused_rank(
+    query: str,
+    results: List[Dict],
+    weights: Optional[Dict[str, float]] = None,
+    deadline_seconds: Optional[float] = None,
+) -> Iterator[Tuple[List[Dict], List[str]]]:
+    """Synchronous generator wrapper around astream_fused_rank."""
+    return iterate_sync(astream_fused_rank(query, results, weights, deadline_seconds))
+
+
+def fused_rank(
+    query: str,
+    results: List[Dict],
+    weights: Optional[Dict[str, float]] = None,
+    deadline_seconds: Optional[float] = None,
+) -> Tuple[List[Dict], List[str]]:
+    """Synchronous wrapper around afused_rank."""
+    return run_sync(afused_rank(query, results, weights, deadline_seconds))
@@ -0,0 +1,290 @@
+import logging
+import threading
+import time
+from collections import deque
+from contextlib import contextmanager
+from contextvars import ContextVar
+from dataclasses import dataclass, field
+from typing import Any, Dict, Iterator, List, Optional, Tuple
+
+import numpy as np
+from langchain_core.callbacks import BaseCallbackHandler
+
+import src.config as config
+
+# Upper bounds (seconds) of the Prometheus latency histogram buckets
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0)
+
+
+@dataclass
+class CallRecord:
+    """Measurements of one instrumented call; fields can be filled in while the call runs."""
+
+    stage: str
+    provider: str = ""
+    model: str = ""
+    started_at: float = field(default_factory=time.time)
+    wall_seconds: float = 0.0
+    queue_seconds: float = 0.0
+    prompt_tokens: int = 0
+    completion_tokens: int = 0
+    cached_tokens: int = 0
+    cache_hit: bool = False
+    error: Optional[str] = None
+
+    def add_usage(self, prompt_tokens: int = 0, completion_tokens: int = 0, cached_tokens: int = 0) -> None:
+        self.prompt_tokens += prompt_tokens
+        self.completion_tokens += completion_tokens
+        self.cached_tokens += cached_tokens
+
+
+class _Series:
+    """Aggregates for one (stage, provider, model) label set."""
+
+    def __init__(self, sample_size: int):
+        self.count = 0
+        self.errors = 0
+        self.cache_hits = 0
+        self.wall_sum = 0.0
+        self.queue_sum = 0.0
+        self.prompt_tokens = 0
+        self.completion_tokens = 0
+        self.cached_tokens = 0
+        self.buckets = [0] * len(LATENCY_BUCKETS)
+        self.samples: deque = deque(maxlen=sample_size)
+
+    def add(self, record: CallRecord) -> None:
+        self.count += 1
+        self.errors += record.error is not None
+        self.cache_hits += record.cache_hit
+        self.wall_sum += record.wall_seconds
+        self.queue_sum += record.queue_seconds
+        self.prompt_tokens += record.prompt_tokens
+        self.completion_tokens += record.completion_tokens
+        self.cached_tokens += record.cached_tokens
+        for i, bound in enumerate(LATENCY_BUCKETS):
+            if record.wall_seconds <= bound:
+                self.buckets[i] += 1
+        self.samples.append(record.wall_seconds)
+
+
+class Instrumentation:
+    """
+    Thread-safe in-process store of call measurements, aggregated per (stage, provider, model).
+    Exposes a summary() API, Prometheus text exposition and, when enabled and installed,
+    one OpenTelemetry span per call.
+    """
+
+    def __init__(self, sample_size: int = 10000):
+        self.sample_size = sample_size
+        self._series: Dict[Tuple[str, str, str], _Series] = {}
+        self._lock = threading.Lock()
+
+    def record(self, record: CallRecord) -> None:
+        key = (record.stage, record.provider, record.model)
+        with self._lock:
+            series = self._series.get(key)
+            if series is None:
+                series = self._series[key] = _Series(self.sample_size)
+            series.add(record)
+        if config.INSTRUMENTATION_OTEL_ENABLED:
+            _emit_span(record)
+
+    def reset(self) -> None:
+        with self._lock:
+            self._series.clear()
+
+    def summary(self) -> List[Dict[str, Any]]:
+        """Returns one row per (stage, provider, model) with counts, rates, latency percentiles and tokens."""
+        rows = []
+        with self._lock:
+            for (stage, provider, model), s in sorted(self._series.items()):
+                p50, p95, p99 = np.percentile(np.array(s.samples) * 1000, [50, 95, 99]) if s.samples else (0, 0, 0)
+                rows.append({
+                    "stage": stage,
+                    "provider": provider,
+                    "model": model,
+                    "calls": s.count,
+                    "error_rate": s.errors / s.count,
+                    "cache_hit_rate": s.cache_hits / s.count,
+                    "p50_ms": float(p50),
+                    "p95_ms": float(p95),
+                    "p99_ms": float(p99),
+                    "mean_queue_ms": s.queue_sum / s.count * 1000,
+                    "prompt_tokens": s.prompt_tokens,
+                    "completion_tokens": s.completion_tokens,
+                    "cached_tokens": s.cached_tokens,
+                })
+        return rows
+
+    def to_prometheus(self, prefix: str = "llm_search") -> str:
+        """Renders all series in the Prometheus text exposition format."""
+        counters = (
+            ("calls_total", "Instrumented calls", "count"),
+            ("errors_total", "Calls that raised an error", "errors"),
+            ("cache_hits_total", "Calls answered from a cache", "cache_hits"),
+            ("prompt_tokens_total", "Prompt tokens sent", "prompt_tokens"),
+            ("completion_tokens_total", "Completion tokens received", "completion_tokens"),
+            ("cached_tokens_total", "Prompt tokens served from the provider prompt cache", "cached_tokens"),
+            ("queue_seconds_total", "Time spent waiting for rate limits and concurrency slots", "queue_sum"),
+        )
+        with self._lock:
+            items = sorted(self._series.items())
+            lines = []
+            for name, help_text, attribute in counters:
+                lines.append(f"# HELP {prefix}_{name} {help_text}")
+                lines.append(f"# TYPE {prefix}_{name} counter")
+                for labels, series in items:
+                    lines.append(f"{prefix}_{name}{{{_labels(labels)}}} {getattr(series, attribute)}")
+            name = f"{prefix}_call_duration_seconds"
+            lines.append(f"# HELP {name} Wall time per call")
+            lines.append(f"# TYPE {name} histogram")
+            for labels, series in items:
+                label_text = _labels(labels)
+                for bound, bucket_count in zip(LATENCY_BUCKETS, series.buckets):
+                    lines.append(f'{name}_bucket{{{label_text},le="{bound}"}} {bucket_count}')
+                lines.append(f'{name}_bucket{{{label_text},le="+Inf"}} {series.count}')
+                lines.append(f"{name}_sum{{{label_text}}} {series.wall_sum}")
+                lines.append(f"{name}_count{{{label_text}}} {series.count}")
+        return "\n".join(lines) + "\n"
+
+
+def _labels(labels: Tuple[str, str, str]) -> str:
+    escaped = [value.replace("\\", "\\\\").replace('"', '\\"') for value in labels]
+    return 'stage="{}",provider="{}",model="{}"'.format(*escaped)
+
+
+def _emit_span(record: CallRecord) -> None:
+    try:
+        from opentelemetry import trace
+    except ImportError:
+        logging.warning("INSTRUMENTATION_OTEL_ENABLED is set but opentelemetry is not installed")
+        config.INSTRUMENTATION_OTEL_ENABLED = False
+        return
+    tracer = trace.get_tracer("llm-search-poc")
+    start_ns = int(record.started_at * 1e9)
+    span = tracer.start_span(record.stage, start_time=start_ns, attributes={
+        "llm.provider": record.provider,
+        "llm.model": record.model,
+        "llm.queue_seconds": record.queue_seconds,
+        "llm.prompt_tokens": record.prompt_tokens,
+        "llm.completion_tokens": record.completion_tokens,
+        "llm.cached_tokens": record.cached_tokens,
+        "cache.hit": record.cache_hit,
+    })
+    if record.error is not None:
+        span.set_status(trace.Status(trace.StatusCode.ERROR, record.error))
+    span.end(end_time=start_ns + int(record.wall_seconds * 1e9))
+
+
+instrumentation = Instrumentation(config.INSTRUMENTATION_SAMPLE_SIZE)
+
+_current_call: ContextVar[Optional[CallRecord]] = ContextVar("current_call", default=None)
+
+
+def current_call() -> Optional[CallRecord]:
+    """Returns the record of the innermost track() block running in this context, if any."""
+    return _current_call.get()
+
+
+@contextmanager
+def track(stage: str, provider: str = "", model: str = "", cache_hit: bool = False) -> Iterator[CallRecord]:
+    """
+    Measures the wall time of the enclosed block (sync or async code) and records it under
+    (stage, provider, model). The yielded CallRecord can be annotated with queue time, tokens and
+    cache hits while the block runs; an escaping exception is recorded as an error and re-raised.
+    """
+    record = CallRecord(stage=stage, provider=provider, model=model, cache_hit=cache_hit)
+    if not config.INSTRUMENTATION_ENABLED:
+        yield record
+        return
+    token = _current_call.set(record)
+    started = time.perf_counter()
+    try:
+        yield record
+    except BaseException as e:
+        record.error = type(e).__name__
+        raise
+    finally:
+        record.wall_seconds = time.perf_counter() - started
+        _current_call.reset(token)
+        instrumentation.record(record)
+
+
+def _usage_from_result(response: Any) -> Tuple[int, int, int]:
+    """Extracts (prompt, completion, cached) token counts from a LangChain LLMResult."""
+    for generations in getattr(response, "generations", []) or []:
+        for generation in generations:
+            usage = getattr(getattr(generation, "message", None), "usage_metadata", None)
+            if usage:
+                details = usage.get("input_token_details") or {}
+                return usage.get("input_tokens", 0), usage.get("output_tokens", 0), details.get("cache_read", 0) or 0
+    token_usage = (getattr(response, "llm_output", None) or {}).get("token_usage") or {}
+    cached = (token_usage.get("prompt_tokens_details") or {}).get("cached_tokens", 0) or 0
+    return token_usage.get("prompt_tokens", 0), token_usage.get("completion_tokens", 0), cached
+
+
+class InstrumentationCallbackHandler(BaseCallbackHandler):
+    """
+    LangChain callback handler that feeds the instrumentation store.
+    Inside a track() block (e.g. calls made through src/scheduler.py) it adds token usage to the
+    current record. Elsewhere, e.g. when passed to a LangGraph graph as
+    config={"callbacks": [InstrumentationCallbackHandler()]}, it records each chat model call
+    (stage "llm") and each graph node run (stage "node:<name>") on its own.
+    """
+
+    run_inline = True
+
+    def __init__(self):
+        self._runs: Dict[Any, CallRecord] = {}
+        self._starts: Dict[Any, float] = {}
+
+    def _start(self, run_id: Any, record: CallRecord) -> None:
+        self._runs[run_id] = record
+        self._starts[run_id] = time.perf_counter()
+
+    def _finish(self, run_id: Any, error: Optional[BaseException] = None) -> Optional[CallRecord]:
+        record = self._runs.pop(run_id, None)
+        started = self._starts.pop(run_id, None)
+        if record is None:
+            return None
+        record.wall_seconds = time.perf_counter() - started
+        if error is not None:
+            record.error = type(error).__name__
+        if config.INSTRUMENTATION_ENABLED:
+            instrumentation.record(record)
+        return record
+
+    def on_chat_model_start(self, serialized, messages, *, run_id, metadata=None, **kwargs) -> None:
+        if current_call() is None:
+            metadata = metadata or {}
+            self._start(run_id, CallRecord(
+                stage="llm",
+                provider=str(metadata.get("ls_provider", "")),
+                model=str(metadata.get("ls_model_name", "")),
+            ))
+
+    def on_llm_end(self, response, *, run_id, **kwargs) -> None:
+        usage = _usage_from_result(response)
+        record = self._runs.get(run_id) or current_call()
+        if record is not None:
+            record.add_usage(*usage)
+        self._finish(run_id)
+
+    def on_llm_error(self, error, *, run_id, **kwargs) -> None:
+        self._finish(run_id, error)
+
+    def on_chain_start(self, serialized, inputs, *, run_id, metadata=None, **kwargs) -> None:
+        node = (metadata or {}).get("langgraph_node")
+        # Only the node's own run, not the runnables nested inside it.
+        if node and kwargs.get("name") == node:
+            self._start(run_id, CallRecord(stage=f"node:{node}"))
+
+    def on_chain_end(self, outputs, *, run_id, **kwargs) -> None:
+        self._finish(run_id)
+
+    def on_chain_error(self, error, *, run_id, **kwargs) -> None:
+        self._finish(run_id, error)
+
+
+callback_handler = InstrumentationCallbackHandler()
@@ -0,0 +1,47 @@
+import math
+import re
+import unicodedata
+from collections import Counter
+from typing import List
+
+_TOKEN_RE = re.compile(r"\w+")
+
+
+def tokenize(text: str) -> List[str]:
+    """
+    Lower-cases text, strips accents (so 'sillón' matches 'sillon') and splits it into word tokens.
+    """
+    normalized = unicodedata.normalize("NFKD", text.lower())
+    normalized = "".join(ch for ch in normalized if not unicodedata.combining(ch))
+    return _TOKEN_RE.findall(normalized)
+
+
+def bm25_scores(query: str, documents: List[str], k1: float = 1.5, b: float = 0.75) -> List[float]:
+    """
+    Scores each document against the query with Okapi BM25.
+    Term statistics are computed over the given documents only, so the index is built per SERP
+    and costs a single pass over its text.
+    """
+    tokenized = [tokenize(document) for document in documents]
+    if not tokenized:
+        return []
+    avg_length = sum(len(tokens) for tokens in tokenized) / len(tokenized) or 1.0
+    document_frequency = Counter(term for tokens in tokenized for term in set(tokens))
+    query_terms = set(tokenize(query))
+    n = len(tokenized)
+    idf = {
+        term: math.log(1 + (n - document_frequency[term] + 0.5) / (document_frequency[term] + 0.5))
+        for term in query_terms
+    }
+
+    scores = []
+    for tokens in tokenized:
+        term_frequency = Counter(tokens)
+        length_norm = k1 * (1 - b + b * len(tokens) / avg_length)
+        score = 0.0
+        for term in query_terms:
+            tf = term_frequency.get(term, 0)
+            if tf:
+                score += idf[term] * tf * (k1 + 1) / (tf + length_norm)
+        scores.append(score)
+    return scores
@@ -0,0 +1,153 @@
+import threading
+from typing import Any, Dict, Optional, Tuple, Type
+
+from pydantic import BaseModel
+
+import src.config as config
+
+_clients: Dict[Tuple, Any] = {}
+_structured: Dict[Tuple, Any] = {}
+_lock = threading.Lock()
+
+
+def _create_llm(provider: str, model: str, temperature: float) -> Any:
+    if provider == "ChatOpenAI":
+        from langchain_openai import ChatOpenAI
+        # Retries are handled by src/scheduler.py, which needs to see every 429.
+        return ChatOpenAI(model=model, temperature=temperature, max_retries=0)
+    elif provider == "ChatGemini":
+        from langchain_google_genai import ChatGoogleGenerativeAI
+        return ChatGoogleGenerativeAI(model=model, temperature=temperature, max_retries=0)
+    elif provider == "ChatBedrock":
+        from langchain_aws import BedrockLLM
+        return BedrockLLM(credentials_profile_name="bedrock-admin", model_id=model)
+    elif provider == "Replay":
+        from src.replay_llm import ReplayChatModel
+        return ReplayChatModel(
+            config.REPLAY_CASSETTE_PATH,
+            config.REPLAY_UPSTREAM_PROVIDER,
+            model,
+            temperature,
+            config.REPLAY_MISS_POLICY,
+        )
+    elif provider == "Stub":
+        from src.stub_llm import StubChatModel
+        return StubChatModel(**config.STUB_LLM_SETTINGS)
+    else:
+        raise ValueError("Unsupported LLM provider: " + provider)
+
+
+def _resolve(provider: Optional[str], model: Optional[str], temperature: Optional[float]) -> Tuple[str, str, float]:
+    return (
+        provider or config.DEFAULT_LLM_PROVIDER,
+        model or config.DEFAULT_LLM_MODEL,
+        config.DEFAULT_LLM_TEMPERATURE if temperature is None else temperature,
+    )
+
+
+def get_llm(provider: Optional[str] = None, model: Optional[str] = None, temperature: Optional[float] = None) -> Any:
+    """
+    Returns the chat model client for (provider, model, temperature), creating it on first use.
+    Arguments left as None are read from src.config at call time, so changes made in the
+    Settings tab take effect on the next call without re-importing anything.
+    """
+    key = _resolve(provider, model, temperature)
+    client = _clients.get(key)
+    if client is None:
+        with _lock:
+            client = _clients.get(key)
+            if client is None:
+                client = _create_llm(*key)
+                _clients[key] = client
+    return client
+
+
+def get_structured_llm(
+    schema: Type[BaseModel],
+    provider: Optional[str] = None,
+    model: Optional[str] = None,
+    temperature: Optional[float] = None,
+) -> Any:
+    """
+    Returns the cached with_structured_output(schema) runnable of the resolved client, so the
+    schema is bound once per (provider, model, temperature, schema) instead of on every call.
+    """
+    key = _resolve(provider, model, temperature) + (schema,)
+    runnable = _structured.get(key)
+    if runnable is None:
+        llm = get_llm(*key[:3])
+        with _lock:
+            runnable = _structured.get(key)
+            if runnable is None:
+                runnable = llm.with_structured_output(schema)
+                _structured[key] = runnable
+    return runnable
+
+
+def get_logprob_llm(
+    top_logprobs: int,
+    provider: Optional[str] = None,
+    model: Optional[str] = None,
+    temperature: Optional[float] = None,
+) -> Optional[Any]:
+    """
+    Returns the client bound to reply with a single token and its top_logprobs alternatives, or
+    None when the provider is not in config.LOGPROB_PROVIDERS (callers then use structured output).
+    """
+    key = _resolve(provider, model, temperature) + (("logprobs", top_logprobs),)
+    if key[0] not in config.LOGPROB_PROVIDERS:
+        return None
+    runnable = _structured.get(key)
+    if runnable is None:
+        llm = get_llm(*key[:3])
+        with _lock:
+            runnable = _structured.get(key)
+            if runnable is None:
+                runnable = llm.bind(logprobs=True, top_logprobs=top_logprobs, max_tokens=1)
+                _structured[key] = runnable
+    return runnable
+
+
+def _create_embeddings(provider: str, model: str) -> Any:
+    if provider == "Hashing":
+        from src.scorers import HashingEmbeddings
+        return HashingEmbeddings(config.EMBEDDING_DIMENSIONS)
+    elif provider == "OpenAI":
+        from langchain_openai import OpenAIEmbeddings
+        return OpenAIEmbeddings(model=model)
+    elif provider == "HuggingFace":
+        from langchain_huggingface import HuggingFaceEmbeddings
+        return HuggingFaceEmbeddings(model_name=model)
+    elif provider == "Fake":
+        from langchain_core.embeddings import DeterministicFakeEmbedding
+        return DeterministicFakeEmbedding(size=config.EMBEDDING_DIMENSIONS)
+    else:
+        raise ValueError("Unsupported embedding provider: " + provider)
+
+
+def get_embeddings(provider: Optional[str] = None, model: Optional[str] = None) -> Any:
+    """
+    Returns the LangChain Embeddings client for (provider, model), creating it on first use.
+    Defaults are read from config.EMBEDDING_PROVIDER and config.EMBEDDING_MODEL at call time.
+    With config.EMBEDDING_STORE_ENABLED, document embeddings are read from and added to the
+    on-disk embedding store (see src/embedding_store.py).
+    """
+    key = ("embeddings", provider or config.EMBEDDING_PROVIDER, model or config.EMBEDDING_MODEL, config.EMBEDDING_STORE_ENABLED)
+    client = _clients.get(key)
+    if client is None:
+        with _lock:
+            client = _clients.get(key)
+            if client is None:
+                client = _create_embeddings(*key[1:3])
+                if config.EMBEDDING_STORE_ENABLED:
+                    from src.embedding_store import StoredEmbeddings, get_embedding_store
+                    client = StoredEmbeddings(client, get_embedding_store(*key[1:3]))
+                _clients[key] = client
+    return client
+
+
+def clear_registry() -> None:
+    """Drops every cached client and bound runnable."""
+    with _lock:
+        _clients.clear()
+        _structured.clear()
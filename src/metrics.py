@@ -1,5 +1,78 @@
-import math
-from typing import List
+from typing import Dict, List, Optional, Sequence, Tuple, Union
+
+import numpy as np
+
+_discounts = 1.0 / np.log2(np.arange(64) + 2.0)
+
+
+def _discount_table(length: int) -> np.ndarray:
+    """Returns 1 / log2(rank + 1) for ranks 1..length, extending the cached table as needed."""
+    global _discounts
+    if length > len(_discounts):
+        size = max(length, 2 * len(_discounts))
+        _discounts = 1.0 / np.log2(np.arange(size) + 2.0)
+    return _discounts[:length]
+
+
+def _pad(relevances: Union[np.ndarray, Sequence[Sequence[float]]]) -> Tuple[np.ndarray, np.ndarray]:
+    """Packs ragged per-query relevance lists into a zero-padded matrix plus per-query lengths."""
+    if isinstance(relevances, np.ndarray) and relevances.ndim == 2:
+        return relevances.astype(float, copy=False), np.full(len(relevances), relevances.shape[1])
+    lengths = np.fromiter((len(r) for r in relevances), dtype=np.int64, count=len(relevances))
+    width = int(lengths.max()) if len(lengths) else 0
+    matrix = np.zeros((len(lengths), width))
+    if width:
+        mask = np.arange(width) < lengths[:, None]
+        matrix[mask] = np.concatenate([np.asarray(r, dtype=float) for r in relevances])
+    return matrix, lengths
+
+
+def batch_metrics(
+    relevances: Union[np.ndarray, Sequence[Sequence[float]]],
+    k: Optional[int] = None,
+    relevance_threshold: float = 1.0,
+    max_grade: Optional[float] = None,
+) -> Dict[str, np.ndarray]:
+    """
+    Computes ranking metrics for a batch of queries in one vectorized pass.
+    relevances holds, per query, the graded relevance of each result in ranked order; lists may have
+    different lengths (a 2D array is also accepted). Only the top k results count (all if k is None).
+    Returns arrays of shape (n_queries,) under the keys:
+      - "dcg":       sum((2^rel - 1) / log2(rank + 1))
+      - "ndcg":      dcg divided by the dcg of the ideal (sorted) order, 0 when that is 0
+      - "mrr":       1 / rank of the first result with rel >= relevance_threshold, 0 if none
+      - "precision": share of the top k (or of the whole list if k is None) with rel >= relevance_threshold
+      - "err":       expected reciprocal rank, with stop probabilities (2^rel - 1) / 2^max_grade
+                     (max_grade defaults to the largest relevance in the batch)
+    """
+    matrix, lengths = _pad(relevances)
+    n_queries, width = matrix.shape
+    valid = np.arange(width) < lengths[:, None]
+    gains = np.where(valid, np.exp2(matrix) - 1.0, 0.0)
+    ideal_gains = -np.sort(-gains, axis=1)
+    cutoff = width if k is None else min(k, width)
+    discounts = _discount_table(cutoff)
+
+    dcg = gains[:, :cutoff] @ discounts
+    idcg = ideal_gains[:, :cutoff] @ discounts
+    ndcg = np.divide(dcg, idcg, out=np.zeros(n_queries), where=idcg > 0)
+
+    relevant = (matrix[:, :cutoff] >= relevance_threshold) & valid[:, :cutoff]
+    has_relevant = relevant.any(axis=1)
+    first_relevant = relevant.argmax(axis=1)
+    mrr = np.where(has_relevant, 1.0 / (first_relevant + 1.0), 0.0)
+
+    denominators = np.minimum(lengths, cutoff) if k is None else np.full(n_queries, k)
+    precision = np.divide(relevant.sum(axis=1), denominators, out=np.zeros(n_queries), where=denominators > 0)
+
+    if max_grade is None:
+        max_grade = float(matrix[valid].max()) if valid.any() else 0.0
+    stop = gains[:, :cutoff] / 2.0 ** max_grade
+    reach = np.cumprod(np.hstack([np.ones((n_queries, 1)), 1.0 - stop[:, :-1]]), axis=1) if cutoff else stop
+    err = (stop * reach) @ (1.0 / np.arange(1, cutoff + 1))
+
+    return {"dcg": dcg, "ndcg": ndcg, "mrr": mrr, "precision": precision, "err": err}
+
 
 def calculate_ndcg(scores: List[float]) -> float:
     """
@@ -7,10 +80,6 @@ def calculate_ndcg(scores: List[float]) -> float:
     DCG = sum((2^score - 1) / log2(i + 2)) for each score.
     Returns the NDCG value.
     """
-    def dcg(relevances: List[float]) -> float:
-        return sum((2 ** rel - 1) / math.log2(i + 2) for i, rel in enumerate(relevances))
-    
-    dcg_val = dcg(scores)
-    ideal_scores = sorted(scores, reverse=True)
-    idcg_val = dcg(ideal_scores)
-    return dcg_val / idcg_val if idcg_val > 0 else 0
+    if not len(scores):
+        return 0
+    return float(batch_metrics([scores])["ndcg"][0])
@@ -0,0 +1,129 @@
+import asyncio
+import copy
+import logging
+from typing import AsyncIterator, Dict, Iterator, List, Optional
+
+import src.config as config
+from src.concurrency import iterate_sync
+from src.ranking import alistwise_rank, are_rank_results
+from src.search_engine import search_engine
+
+_DONE = object()
+
+
+async def _search_worker(todo: asyncio.Queue, searched: asyncio.Queue, progress: Dict) -> None:
+    while True:
+        job = await todo.get()
+        if job is _DONE:
+            return
+        index, keyword = job
+        record = {"index": index, "keyword": keyword, "error": None}
+        try:
+            # search_engine is blocking (requests), so it runs in the default thread pool.
+            results = await asyncio.to_thread(search_engine, keyword)
+            for i, r in enumerate(results):
+                r["original_index"] = i + 1
+            record["results"] = results
+        except Exception as e:
+            logging.exception("Search failed for keyword %r", keyword)
+            record["error"] = f"search failed: {e!r}"
+        progress["searched"] += 1
+        await searched.put(record)
+
+
+async def _rank_worker(searched: asyncio.Queue, done: asyncio.Queue, progress: Dict) -> None:
+    while True:
+        record = await searched.get()
+        if record is _DONE:
+            return
+        if record["error"] is None:
+            keyword = record["keyword"]
+            results = record["results"]
+            try:
+                (listwise_results, query_intent), pointwise_results = await asyncio.gather(
+                    alistwise_rank(keyword, copy.deepcopy(results)),
+                    are_rank_results(keyword, copy.deepcopy(results)),
+                )
+                record["listwise_results"] = listwise_results
+                record["query_intent"] = query_intent
+                record["pointwise_results"] = pointwise_results
+            except Exception as e:
+                logging.exception("Ranking failed for keyword %r", record["keyword"])
+                record["error"] = f"ranking failed: {e!r}"
+        progress["ranked"] += 1
+        await done.put(record)
+
+
+async def arun_bulk_pipeline(
+    keywords: List[str],
+    search_concurrency: Optional[int] = None,
+    rank_concurrency: Optional[int] = None,
+    prefetch: Optional[int] = None,
+    ordered: bool = True,
+) -> AsyncIterator[Dict]:
+    """
+    Runs search, listwise and pointwise ranking for many keywords as a bounded two-stage pipeline.
+    search_concurrency workers (default: config.BULK_SEARCH_CONCURRENCY) fetch upcoming keywords while
+    rank_concurrency workers (default: config.BULK_RANK_CONCURRENCY) rank earlier ones, running
+    listwise and pointwise in parallel per keyword. At most prefetch searched keywords (default:
+    config.BULK_PREFETCH) wait between the stages, which bounds memory. LLM calls still share the
+    global budget and rate limits of src/scheduler.py.
+
+    Yields one record per keyword with keys 'index', 'keyword', 'error', 'results',
+    'listwise_results', 'query_intent', 'pointwise_results' and a 'progress' snapshot
+    ({'total', 'searched', 'ranked'}). Records come in input order if ordered is True, otherwise
+    as soon as each keyword finishes.
+    """
+    search_concurrency = search_concurrency or config.BULK_SEARCH_CONCURRENCY
+    rank_concurrency = rank_concurrency or config.BULK_RANK_CONCURRENCY
+    prefetch = prefetch or config.BULK_PREFETCH
+    progress = {"total": len(keywords), "searched": 0, "ranked": 0}
+
+    todo: asyncio.Queue = asyncio.Queue()
+    searched: asyncio.Queue = asyncio.Queue(maxsize=prefetch)
+    done: asyncio.Queue = asyncio.Queue()
+    for job in enumerate(keywords):
+        todo.put_nowait(job)
+    for _ in range(search_concurrency):
+        todo.put_nowait(_DONE)
+
+    search_workers = [asyncio.ensure_future(_search_worker(todo, searched, progress)) for _ in range(search_concurrency)]
+    rank_workers = [asyncio.ensure_future(_rank_worker(searched, done, progress)) for _ in range(rank_concurrency)]
+
+    async def _close_rank_stage():
+        await asyncio.gather(*search_workers)
+        for _ in range(rank_concurrency):
+            await searched.put(_DONE)
+
+    closer = asyncio.ensure_future(_close_rank_stage())
+    pending: Dict[int, Dict] = {}
+    next_index = 0
+    try:
+        for _ in range(len(keywords)):
+            record = await done.get()
+            logging.info("Bulk progress: %d/%d searched, %d/%d ranked",
+                         progress["searched"], progress["total"], progress["ranked"], progress["total"])
+            if not ordered:
+                record["progress"] = dict(progress)
+                yield record
+                continue
+            pending[record["index"]] = record
+            while next_index in pending:
+                ready = pending.pop(next_index)
+                ready["progress"] = dict(progress)
+                yield ready
+                next_index += 1
+    finally:
+        for task in search_workers + rank_workers + [closer]:
+            task.cancel()
+
+
+def run_bulk_pipeline(
+    keywords: List[str],
+    search_concurrency: Optional[int] = None,
+    rank_concurrency: Optional[int] = None,
+    prefetch: Optional[int] = None,
+    ordered: bool = True,
+) -> Iterator[Dict]:
+    """Synchronous generator wrapper around arun_bulk_pipeline."""
+    return iterate_sync(arun_bulk_pipeline(keywords, search_concurrency, rank_concurrency, prefetch, ordered))
@@ -0,0 +1,171 @@
+import functools
+import logging
+import re
+import threading
+import unicodedata
+from typing import Any, Dict, List, Optional, Tuple
+
+import src.config as config
+
+# Emoji, pictographs, dingbats and the joiners/selectors used to compose them
+_EMOJI_RE = re.compile(
+    "["
+    "\U0001F000-\U0001FAFF"
+    "\U00002600-\U000027BF"
+    "\U00002B00-\U00002BFF"
+    "\U0000FE00-\U0000FE0F"
+    "\U0000200D"
+    "\U000020E3"
+    "]+"
+)
+# Runs of 4+ identical punctuation or symbol characters ("!!!!!!", "*******", "------")
+_REPEATED_PUNCTUATION_RE = re.compile(r"([^\w\s])\1{3,}")
+_WHITESPACE_RE = re.compile(r"\s+")
+_ELLIPSIS = " …"
+
+_stats_lock = threading.Lock()
+_stats = {"prompts": 0, "documents": 0, "truncated_documents": 0, "tokens_before": 0, "tokens_after": 0}
+
+
+@functools.lru_cache(maxsize=None)
+def _encoding(model: str) -> Any:
+    """Returns the tiktoken encoding for model, or None when tiktoken or its BPE files are unavailable."""
+    try:
+        import tiktoken
+    except ImportError:
+        logging.info("tiktoken is not installed; estimating prompt tokens from text length")
+        return None
+    try:
+        return tiktoken.encoding_for_model(model)
+    except KeyError:
+        pass
+    except Exception:
+        logging.warning("Could not load the tiktoken encoding for %s; estimating prompt tokens from text length", model)
+        return None
+    try:
+        return tiktoken.get_encoding("o200k_base")
+    except Exception:
+        logging.warning("Could not load a tiktoken encoding; estimating prompt tokens from text length")
+        return None
+
+
+def count_tokens(text: str, model: Optional[str] = None) -> int:
+    """
+    Counts the tokens of text with the model's tokenizer (tiktoken). Models tiktoken does not know
+    use its o200k_base encoding; without tiktoken the count is estimated as 4 characters per token.
+    """
+    encoding = _encoding(model or config.DEFAULT_LLM_MODEL)
+    if encoding is None:
+        return (len(text) + 3) // 4
+    return len(encoding.encode(text, disallowed_special=()))
+
+
+def truncate_to_tokens(text: str, max_tokens: int, model: Optional[str] = None) -> str:
+    """Cuts text to at most max_tokens tokens, at a word boundary where possible, marking the cut with an ellipsis."""
+    if count_tokens(text, model) <= max_tokens:
+        return text
+    if max_tokens <= 0:
+        return ""
+    encoding = _encoding(model or config.DEFAULT_LLM_MODEL)
+    keep = max(0, max_tokens - count_tokens(_ELLIPSIS, model))
+    if encoding is None:
+        cut = text[:keep * 4]
+    else:
+        cut = encoding.decode(encoding.encode(text, disallowed_special=())[:keep])
+    # Drop a trailing partial word unless that would remove most of the text.
+    head, _, _ = cut.rpartition(" ")
+    if len(head) > len(cut) // 2:
+        cut = head
+    return cut.rstrip() + _ELLIPSIS
+
+
+def normalize_text(text: str) -> str:
+    """
+    Removes noise that costs tokens without helping relevance judgements: emoji and pictographs,
+    long runs of repeated punctuation, and redundant whitespace (including line breaks).
+    """
+    text = unicodedata.normalize("NFKC", text or "")
+    text = _EMOJI_RE.sub(" ", text)
+    text = _REPEATED_PUNCTUATION_RE.sub(r"\1", text)
+    return _WHITESPACE_RE.sub(" ", text).strip()
+
+
+def _fair_shares(lengths: List[int], budget: int) -> List[int]:
+    # Max-min fair split: short documents keep all their tokens and the rest of the budget is
+    # shared equally among the longer ones.
+    shares = [0] * len(lengths)
+    remaining = budget
+    order = sorted(range(len(lengths)), key=lambda i: lengths[i])
+    for position, i in enumerate(order):
+        shares[i] = min(lengths[i], remaining // (len(lengths) - position))
+        remaining -= shares[i]
+    return shares
+
+
+def fit_documents(
+    documents: List[str],
+    document_max_tokens: Optional[int] = None,
+    prompt_max_tokens: Optional[int] = None,
+    model: Optional[str] = None,
+) -> List[str]:
+    """
+    Prepares documents for a prompt: normalizes each one (normalize_text), truncates it to
+    document_max_tokens (default: config.PROMPT_DOCUMENT_MAX_TOKENS) and, if the documents together
+    still exceed prompt_max_tokens (default: config.PROMPT_DOCUMENTS_MAX_TOKENS), splits that budget
+    fairly so that no single long document can crowd out the others.
+    Budgets of 0 are unlimited. Returns the documents unchanged when config.PROMPT_BUDGET_ENABLED
+    is off. Tokens saved are accumulated in get_budget_stats().
+    """
+    if not config.PROMPT_BUDGET_ENABLED or not documents:
+        return list(documents)
+    document_max_tokens = config.PROMPT_DOCUMENT_MAX_TOKENS if document_max_tokens is None else document_max_tokens
+    prompt_max_tokens = config.PROMPT_DOCUMENTS_MAX_TOKENS if prompt_max_tokens is None else prompt_max_tokens
+
+    tokens_before = sum(count_tokens(document, model) for document in documents)
+    normalized = [normalize_text(document) for document in documents]
+    lengths = [count_tokens(document, model) for document in normalized]
+    limits = [min(length, document_max_tokens) if document_max_tokens else length for length in lengths]
+    if prompt_max_tokens and sum(limits) > prompt_max_tokens:
+        limits = _fair_shares(limits, prompt_max_tokens)
+    fitted = [
+        truncate_to_tokens(document, limit, model) if limit < length else document
+        for document, length, limit in zip(normalized, lengths, limits)
+    ]
+    tokens_after = sum(count_tokens(document, model) for document in fitted)
+    truncated = sum(limit < length for length, limit in zip(lengths, limits))
+    with _stats_lock:
+        _stats["prompts"] += 1
+        _stats["documents"] += len(documents)
+        _stats["truncated_documents"] += truncated
+        _stats["tokens_before"] += tokens_before
+        _stats["tokens_after"] += tokens_after
+    if truncated:
+        logging.debug("Prompt budget truncated %d of %d documents (%d -> %d tokens)",
+                      truncated, len(documents), tokens_before, tokens_after)
+    return fitted
+
+
+def fit_document(document: str, model: Optional[str] = None) -> str:
+    """fit_documents for a single document (per-document budget only)."""
+    return fit_documents([document], prompt_max_tokens=0, model=model)[0]
+
+
+def budget_signature() -> Tuple:
+    """Settings that change prepared prompt text; part of the score cache key."""
+    if not config.PROMPT_BUDGET_ENABLED:
+        return ()
+    return (config.PROMPT_DOCUMENT_MAX_TOKENS, config.PROMPT_DOCUMENTS_MAX_TOKENS)
+
+
+def get_budget_stats() -> Dict:
+    """Returns counters of the documents prepared so far, including tokens_saved."""
+    with _stats_lock:
+        stats = dict(_stats)
+    stats["tokens_saved"] = stats["tokens_before"] - stats["tokens_after"]
+    return stats
+
+
+def reset_budget_stats() -> None:
+    with _stats_lock:
+        for key in _stats:
+            _stats[key] = 0
@@ -0,0 +1,55 @@
+import re
+from typing import List, Optional, Tuple
+
+from langchain_core.messages import BaseMessage, HumanMessage, SystemMessage
+
+import src.config as config
+
+# First replacement field of a format string ("{query}", "{document!r}", ...), skipping "{{" escapes
+_FIELD_RE = re.compile(r"(?<!\{)\{(?!\{)[^{}]*\}")
+
+
+def split_template(template: str) -> Tuple[str, str]:
+    """
+    Splits a prompt template into (static_prefix, variable_template): the prefix is the text before
+    the line holding the first replacement field, already unescaped, and the variable part is a
+    format string with the rest. A template that starts with variable content has an empty prefix.
+    """
+    match = _FIELD_RE.search(template)
+    if match is None:
+        return template.format().strip(), ""
+    line_start = template.rfind("\n", 0, match.start()) + 1
+    return template[:line_start].format().strip(), template[line_start:]
+
+
+def _system_message(prefix: str, provider: str) -> SystemMessage:
+    if config.PROMPT_CACHE_CONTROL and provider in config.PROMPT_CACHE_CONTROL_PROVIDERS:
+        # Explicit cache breakpoint at the end of the static prefix (Anthropic-style content block).
+        return SystemMessage(content=[{"type": "text", "text": prefix, "cache_control": {"type": "ephemeral"}}])
+    return SystemMessage(content=prefix)
+
+
+def build_prompt(template: str, provider: Optional[str] = None, **values) -> List[BaseMessage]:
+    """
+    Formats a prompt template as [system message with the static prefix, human message with the
+    variable content], so that every call sharing the template sends a byte-identical prefix that
+    providers can serve from their prompt cache. With config.PROMPT_CACHE_CONTROL, providers listed
+    in config.PROMPT_CACHE_CONTROL_PROVIDERS also get an explicit cache_control marker on the
+    prefix. With config.PROMPT_PREFIX_LAYOUT off, the whole prompt is a single human message.
+    """
+    provider = provider or config.DEFAULT_LLM_PROVIDER
+    if not config.PROMPT_PREFIX_LAYOUT:
+        return [HumanMessage(content=template.format(**values))]
+    prefix, variable = split_template(template)
+    human = HumanMessage(content=variable.format(**values))
+    if not prefix:
+        return [human]
+    return [_system_message(prefix, provider), human]
+
+
+def message_text(message: BaseMessage) -> str:
+    """Text of a message whose content is a string or a list of content blocks."""
+    content = message.content
+    if isinstance(content, str):
+        return content
+    return "".join(block if isinstance(block, str) else block.get("text", "") for block in content)
@@ -1,85 +1,505 @@
+import asyncio
 import math
 import re
-from typing import List, Tuple, Dict
+from typing import AsyncIterator, Iterator, List, Tuple, Dict, Optional
 import logging
-from concurrent.futures import ThreadPoolExecutor, as_completed
 from dotenv import load_dotenv
 
-from src.schemas import LLMPointwiseResponse, LLMListwiseDetailedResponse
+from src.schemas import LLMPointwiseResponse, LLMPointwiseBatchResponse, LLMListwiseDetailedResponse, LLMListwiseRankingResponse, LLMQueryIntentResponse
 from src.metrics import calculate_ndcg
+from src.cache import get_intent_cache, get_score_cache, make_cache_key
+from src.concurrency import iterate_sync, run_sync
+from src.scheduler import ainvoke_llm
+from src.instrumentation import track
+from src.lexical import bm25_scores, tokenize
+from src.dedup import cluster_members, cluster_near_duplicates
+from src.prompts import build_prompt
+from src.scorers import Scorer
+from src.prompt_budget import budget_signature, fit_document, fit_documents, normalize_text
+from src.llm_registry import get_logprob_llm, get_structured_llm
 import src.config as config
 
 load_dotenv()
 logging.basicConfig(level=logging.INFO)
 
-# Instantiate the LLM based on the provider specified in config
-if config.DEFAULT_LLM_PROVIDER == "ChatOpenAI":
-    from langchain_openai import ChatOpenAI
-    llm = ChatOpenAI(model=config.DEFAULT_LLM_MODEL, temperature=config.DEFAULT_LLM_TEMPERATURE)
-elif config.DEFAULT_LLM_PROVIDER == "ChatGemini":
-    from langchain_google_genai import ChatGoogleGenerativeAI
-    llm = ChatGoogleGenerativeAI(model=config.DEFAULT_LLM_MODEL, temperature=config.DEFAULT_LLM_TEMPERATURE)
-elif config.DEFAULT_LLM_PROVIDER == "ChatBedrock":
-    from langchain_aws import BedrockLLM
-    llm = BedrockLLM(credentials_profile_name="bedrock-admin", model_id=config.DEFAULT_LLM_MODEL)
-else:
-    raise ValueError("Unsupported LLM provider: " + config.DEFAULT_LLM_PROVIDER)
-
-def get_relevance_score(query: str, document: str) -> float:
-    prompt = config.DEFAULT_POINTWISE_PROMPT.format(query=query, document=document)
+# Values of the 'llm_status' field set by the pointwise re-ranker
+SCORED = "scored"
+UNSCORED = "unscored"
+
+def _score_cache_key(query: str, document: str, prompt_template: Optional[str] = None) -> str:
+    return make_cache_key(
+        prompt_template=prompt_template or config.DEFAULT_POINTWISE_PROMPT,
+        provider=config.DEFAULT_LLM_PROVIDER,
+        model=config.DEFAULT_LLM_MODEL,
+        temperature=config.DEFAULT_LLM_TEMPERATURE,
+        query=query,
+        document=document,
+        prompt_budget=budget_signature(),
+        query_intent=config.QUERY_INTENT_ENABLED,
+    )
+
+def _document_text(item: Dict) -> str:
+    return f"{item.get('title','')} {item.get('description','')}"
+
+def _near_duplicate_clusters(results: List[Dict]) -> Dict[int, List[int]]:
+    """
+    Clusters near-duplicate results (see src/dedup.py) and returns {representative: [members]}
+    for every result, keyed by position. Members get 'duplicate_of', the 1-based position of their
+    representative. Without config.DEDUP_ENABLED every result is its own cluster.
+    """
+    if not config.DEDUP_ENABLED or len(results) < 2:
+        return {i: [] for i in range(len(results))}
+    clusters = cluster_members(cluster_near_duplicates([_document_text(item) for item in results]))
+    for representative, members in clusters.items():
+        for i in members:
+            results[i]['duplicate_of'] = representative + 1
+    if len(clusters) < len(results):
+        logging.info("Collapsed %d near-duplicate results into %d representatives",
+                     len(results), len(clusters))
+    return clusters
+
+def _copy_llm_fields(source: Dict, target: Dict) -> None:
+    for field in ('llm_score', 'llm_status', 'llm_confidence', 'llm_reasoning'):
+        if field in source:
+            target[field] = source[field]
+
+# In-flight intent extractions, so concurrent callers for the same query share one LLM call.
+# Keyed by (id of the event loop, cache key): a task can only be awaited on its own loop.
+_intent_tasks: Dict[Tuple[int, str], "asyncio.Task"] = {}
+
+def _intent_cache_key(query: str) -> str:
+    return make_cache_key(
+        prompt_template=config.DEFAULT_QUERY_INTENT_PROMPT,
+        provider=config.DEFAULT_LLM_PROVIDER,
+        model=config.DEFAULT_LLM_MODEL,
+        temperature=config.DEFAULT_LLM_TEMPERATURE,
+        query=" ".join(tokenize(query)),
+    )
+
+async def _aextract_query_intent(query: str) -> Optional[str]:
+    prompt = build_prompt(config.DEFAULT_QUERY_INTENT_PROMPT, query=query)
     try:
-        response = llm.with_structured_output(LLMPointwiseResponse).invoke(prompt)
-        return response.score
+        response = await ainvoke_llm(get_structured_llm(LLMQueryIntentResponse), prompt, stage="query_intent")
+    except Exception:
+        logging.exception("LLM call failed in aget_query_intent")
+        return None
+    return response.query_intent.strip() or None
+
+async def aget_query_intent(query: str) -> Optional[str]:
+    """
+    Returns what the model understands the user is looking for with query, extracted once per
+    normalized query (lower-cased, accents and punctuation stripped) and model. Intents are
+    cached in the query-intent cache (see src/cache.py), and concurrent callers for the same query
+    share a single LLM call. Returns None if the extraction fails.
+    """
+    key = _intent_cache_key(query)
+    cache = get_intent_cache()
+    if cache is not None:
+        cached_intent = await cache.aget(key)
+        if cached_intent is not None:
+            with track("query_intent", config.DEFAULT_LLM_PROVIDER, config.DEFAULT_LLM_MODEL, cache_hit=True):
+                return cached_intent
+    task_key = (id(asyncio.get_running_loop()), key)
+    task = _intent_tasks.get(task_key)
+    if task is None:
+        task = _intent_tasks[task_key] = asyncio.ensure_future(_aextract_query_intent(query))
+        task.add_done_callback(lambda _: _intent_tasks.pop(task_key, None))
+    intent = await asyncio.shield(task)
+    if intent is not None and cache is not None:
+        cache.set(key, intent)
+    return intent
+
+def get_query_intent(query: str) -> Optional[str]:
+    """Synchronous wrapper around aget_query_intent."""
+    return run_sync(aget_query_intent(query))
+
+async def _aintent_block(query: str) -> str:
+    # Value of the {intent_block} prompt field: the query intent line, or "" when disabled or unknown.
+    if not config.QUERY_INTENT_ENABLED:
+        return ""
+    intent = await aget_query_intent(query)
+    return f"Query intent: \"{intent}\"\n" if intent else ""
+
+def _cacheable(intent_block: str) -> bool:
+    # Score cache keys assume the intent was in the prompt whenever the stage is on; scores
+    # computed without it (failed extraction) are not cached so they are retried later.
+    return not config.QUERY_INTENT_ENABLED or bool(intent_block)
+
+async def aget_relevance_score(query: str, document: str) -> Optional[float]:
+    """
+    Returns the pointwise LLM relevance score for a query/document pair.
+    With config.DEFAULT_POINTWISE_SCORING_MODE "logprobs" the score is the expected grade from
+    aget_graded_relevance; otherwise the model returns it through structured output.
+    The document is normalized and truncated to the per-document token budget (see
+    src/prompt_budget.py) before it is put in the prompt.
+    With config.QUERY_INTENT_ENABLED the prompt also carries the cached query intent
+    (see aget_query_intent).
+    Scores are looked up in the score cache first (see src/cache.py); only misses reach the LLM,
+    and failed calls are not cached. LLM calls go through the scheduler (see src/scheduler.py),
+    which shares one concurrency budget and the provider rate limits between all queries and
+    retries transient errors. Returns None (unscored) if the call still fails.
+    """
+    if config.DEFAULT_POINTWISE_SCORING_MODE == "logprobs":
+        graded = await aget_graded_relevance(query, document)
+        return graded[0] if graded is not None else None
+    return await _astructured_score(query, document)
+
+async def _astructured_score(query: str, document: str) -> Optional[float]:
+    cache = get_score_cache()
+    cache_key = _score_cache_key(query, document) if cache is not None else None
+    if cache is not None:
+        cached_score = await cache.aget(cache_key)
+        if cached_score is not None:
+            with track("pointwise", config.DEFAULT_LLM_PROVIDER, config.DEFAULT_LLM_MODEL, cache_hit=True):
+                return cached_score
+    intent_block = await _aintent_block(query)
+    prompt = build_prompt(
+        config.DEFAULT_POINTWISE_PROMPT,
+        query=query,
+        intent_block=intent_block,
+        document=fit_document(document),
+    )
+    try:
+        response = await ainvoke_llm(get_structured_llm(LLMPointwiseResponse), prompt, stage="pointwise")
     except Exception as e:
         logging.exception("LLM call failed in get_relevance_score")
-        return 0.0
-
-def re_rank_results(query: str, results: List[Dict]) -> List[Dict]:
-    """
-    Re-ranks search results using pointwise LLM relevance scores in parallel.
-    Each result is processed concurrently using a thread pool (with a maximum number of workers
-    defined in config.DEFAULT_CONCURRENT_PROCESSES). After all scores are computed, the results
-    are sorted in descending order by the LLM score.
-    """
-    max_workers = config.DEFAULT_CONCURRENT_PROCESSES
-    with ThreadPoolExecutor(max_workers=max_workers) as executor:
-        future_to_item = {
-            executor.submit(get_relevance_score, query, f"{item.get('title','')} {item.get('description','')}"): item
-            for item in results
-        }
-        for future in as_completed(future_to_item):
-            item = future_to_item[future]
-            try:
-                item['llm_score'] = future.result()
-            except Exception as exc:
-                logging.exception("Error computing score for item")
-                item['llm_score'] = 0.0
-    sorted_results = sorted(results, key=lambda x: x['llm_score'], reverse=True)
+        return None
+    if cache is not None and _cacheable(intent_block):
+        cache.set(cache_key, response.score)
+    return response.score
+
+def _grade_distribution(message) -> Optional[Dict[int, float]]:
+    """
+    Reads the top log-probabilities of the first reply token and returns the probability of each
+    grade (0, 1, 2), renormalised over the grade tokens. None if no grade token is among them.
+    """
+    content = (message.response_metadata.get("logprobs") or {}).get("content") or []
+    if not content:
+        return None
+    probabilities: Dict[int, float] = {}
+    for alternative in content[0].get("top_logprobs") or [content[0]]:
+        token = alternative["token"].strip()
+        if token in ("0", "1", "2"):
+            grade = int(token)
+            probabilities[grade] = probabilities.get(grade, 0.0) + math.exp(alternative["logprob"])
+    mass = sum(probabilities.values())
+    if mass <= 0:
+        return None
+    return {grade: p / mass for grade, p in probabilities.items()}
+
+async def aget_graded_relevance(query: str, document: str) -> Optional[Tuple[float, Optional[float]]]:
+    """
+    Scores a query/document pair from a single-token grade ("logprobs" scoring mode) and returns
+    (expected_relevance, confidence): the expected grade on the 0-2 scale under the model's top
+    token log-probabilities, and the probability of the most likely grade. Continuous scores
+    break the ties of integer grades, and the reply costs one output token.
+    Providers without logprob support (see config.LOGPROB_PROVIDERS), or replies without a grade
+    token, fall back to the structured-output score with confidence None.
+    Returns None (unscored) if the call fails.
+    """
+    runnable = get_logprob_llm(config.LOGPROB_TOP_K)
+    if runnable is None:
+        score = await _astructured_score(query, document)
+        return (score, None) if score is not None else None
+    cache = get_score_cache()
+    cache_key = _score_cache_key(query, document, config.DEFAULT_POINTWISE_LOGPROB_PROMPT) if cache is not None else None
+    if cache is not None:
+        cached = await cache.aget(cache_key)
+        if cached is not None:
+            with track("pointwise_logprobs", config.DEFAULT_LLM_PROVIDER, config.DEFAULT_LLM_MODEL, cache_hit=True):
+                return cached[0], cached[1]
+    intent_block = await _aintent_block(query)
+    prompt = build_prompt(
+        config.DEFAULT_POINTWISE_LOGPROB_PROMPT,
+        query=query,
+        intent_block=intent_block,
+        document=fit_document(document),
+    )
+    try:
+        message = await ainvoke_llm(runnable, prompt, stage="pointwise_logprobs")
+    except Exception:
+        logging.exception("LLM call failed in aget_graded_relevance")
+        return None
+    distribution = _grade_distribution(message)
+    if distribution is None:
+        logging.warning("No grade token in the logprobs reply %r; falling back to structured scoring", message.content)
+        score = await _astructured_score(query, document)
+        return (score, None) if score is not None else None
+    expected = sum(grade * p for grade, p in distribution.items())
+    confidence = max(distribution.values())
+    if cache is not None and _cacheable(intent_block):
+        cache.set(cache_key, [expected, confidence])
+    return expected, confidence
+
+async def agrade_documents(query: str, documents: List[str]) -> List[Optional[Tuple[float, Optional[float]]]]:
+    """aget_graded_relevance for every document, concurrently, in input order."""
+    return list(await asyncio.gather(*(aget_graded_relevance(query, document) for document in documents)))
+
+def get_relevance_score(query: str, document: str) -> Optional[float]:
+    """Synchronous wrapper around aget_relevance_score."""
+    return run_sync(aget_relevance_score(query, document))
+
+def get_cache_stats() -> Dict:
+    """Returns hit/miss counters of the relevance score cache (empty if caching is disabled)."""
+    cache = get_score_cache()
+    return cache.stats() if cache is not None else {}
+
+async def _ascore_batch(query: str, documents: List[str], intent_block: str = "") -> List[Optional[float]]:
+    """
+    Scores several documents with a single LLM call using DEFAULT_POINTWISE_BATCH_PROMPT.
+    intent_block fills the prompt's {intent_block} field (see _aintent_block).
+    Returns one score per document, with None for every document the reply did not cover
+    (or for all of them if the call failed or the reply could not be parsed).
+    """
+    documents_block = ""
+    for idx, document in enumerate(fit_documents(documents), start=1):
+        documents_block += f"{idx}. \"{document}\"\n\n"
+    prompt = build_prompt(
+        config.DEFAULT_POINTWISE_BATCH_PROMPT,
+        query=query,
+        intent_block=intent_block,
+        documents_block=documents_block,
+    )
+    scores: List[Optional[float]] = [None] * len(documents)
+    try:
+        response = await ainvoke_llm(get_structured_llm(LLMPointwiseBatchResponse), prompt, stage="pointwise_batch")
+    except Exception:
+        logging.exception("LLM call failed in _ascore_batch")
+        return scores
+    for entry in response.scores:
+        if 1 <= entry.index <= len(documents) and scores[entry.index - 1] is None:
+            scores[entry.index - 1] = entry.score
+    return scores
+
+async def ascore_documents(query: str, documents: List[str], batch_size: Optional[int] = None) -> List[Optional[float]]:
+    """
+    Returns the pointwise relevance score of each document, in input order (None if unscored).
+    With batch_size > 1 (default: config.DEFAULT_POINTWISE_BATCH_SIZE) uncached documents are
+    scored batch_size at a time, so the rubric is sent once per batch instead of once per document.
+    Documents missing from a malformed or partial batch reply fall back to per-document calls.
+    The "logprobs" scoring mode always scores one document per call.
+    """
+    batch_size = batch_size or config.DEFAULT_POINTWISE_BATCH_SIZE
+    if batch_size <= 1 or config.DEFAULT_POINTWISE_SCORING_MODE == "logprobs":
+        return list(await asyncio.gather(*(aget_relevance_score(query, document) for document in documents)))
+
+    cache = get_score_cache()
+    batch_template = config.DEFAULT_POINTWISE_BATCH_PROMPT
+    scores: List[Optional[float]] = [None] * len(documents)
+    if cache is not None:
+        for i, document in enumerate(documents):
+            # Documents that previously fell back to single calls are cached under the pointwise key.
+            scores[i] = await cache.aget(_score_cache_key(query, document, batch_template))
+            if scores[i] is None:
+                scores[i] = await cache.aget(_score_cache_key(query, document))
+    pending = [i for i, score in enumerate(scores) if score is None]
+    batches = [pending[i:i + batch_size] for i in range(0, len(pending), batch_size)]
+    intent_block = await _aintent_block(query) if batches else ""
+    batch_scores = await asyncio.gather(
+        *(_ascore_batch(query, [documents[i] for i in batch], intent_block) for batch in batches)
+    )
+
+    fallback = []
+    for batch, batch_result in zip(batches, batch_scores):
+        for i, score in zip(batch, batch_result):
+            if score is None:
+                fallback.append(i)
+                continue
+            scores[i] = score
+            if cache is not None and _cacheable(intent_block):
+                cache.set(_score_cache_key(query, documents[i], batch_template), score)
+    if fallback:
+        logging.warning("Batch scoring left %d of %d documents unscored; falling back to per-document calls",
+                        len(fallback), len(pending))
+        fallback_scores = await asyncio.gather(*(aget_relevance_score(query, documents[i]) for i in fallback))
+        for i, score in zip(fallback, fallback_scores):
+            scores[i] = score
+    return scores
+
+async def are_rank_results(
+    query: str,
+    results: List[Dict],
+    batch_size: Optional[int] = None,
+    scorer: Optional[Scorer] = None,
+) -> List[Dict]:
+    """
+    Re-ranks search results using pointwise LLM relevance scores.
+    All items are scored concurrently with ainvoke; the number of in-flight LLM calls is bounded
+    by the global budget shared with every other query in the process rather than per call.
+    batch_size selects batched scoring (see ascore_documents). In the "logprobs" scoring mode
+    items also get 'llm_confidence' (see aget_graded_relevance).
+    A scorer (see src/scorers.py, e.g. EmbeddingScorer) replaces the pointwise LLM scores; its
+    scores are stored in 'llm_score' the same way.
+    Near-duplicate results are collapsed first: only one representative per cluster is scored
+    and its score is copied to the other members.
+    After all scores are computed, the results are sorted in descending order by the LLM score.
+    Items whose call failed are marked with llm_status "unscored" (llm_score None) and placed
+    after the scored ones in their original relative order, instead of being scored 0.
+    """
+    clusters = _near_duplicate_clusters(results)
+    representatives = sorted(clusters)
+    documents = [_document_text(results[i]) for i in representatives]
+    if scorer is not None:
+        scores = [(score, None) for score in await scorer.ascore(query, documents)]
+    else:
+        scores = await _ascore_items(query, documents, batch_size)
+    for i, (score, confidence) in zip(representatives, scores):
+        for j in [i] + clusters[i]:
+            _set_pointwise_score(results[j], score, confidence)
+    sorted_results = sorted(results, key=_pointwise_sort_key)
     return sorted_results
 
-def evaluate_results(query: str, results: List[Dict]) -> Tuple[float, List[float]]:
+def re_rank_results(
+    query: str,
+    results: List[Dict],
+    batch_size: Optional[int] = None,
+    scorer: Optional[Scorer] = None,
+) -> List[Dict]:
+    """Synchronous wrapper around are_rank_results."""
+    return run_sync(are_rank_results(query, results, batch_size, scorer))
+
+async def _ascore_items(
+    query: str, documents: List[str], batch_size: Optional[int]
+) -> List[Tuple[Optional[float], Optional[float]]]:
+    # (score, confidence) per document; confidences only come from the "logprobs" scoring mode.
+    if config.DEFAULT_POINTWISE_SCORING_MODE == "logprobs":
+        return [graded or (None, None) for graded in await agrade_documents(query, documents)]
+    return [(score, None) for score in await ascore_documents(query, documents, batch_size)]
+
+def _set_pointwise_score(item: Dict, score: Optional[float], confidence: Optional[float] = None) -> None:
+    item['llm_score'] = score
+    item['llm_status'] = SCORED if score is not None else UNSCORED
+    if confidence is not None:
+        item['llm_confidence'] = confidence
+
+def _pointwise_sort_key(item: Dict) -> Tuple[bool, float]:
+    # Scored items first, by descending score; Python's stable sort keeps the rest in input order.
+    score = item.get('llm_score')
+    return (score is None, -(score or 0.0))
+
+async def astream_re_rank(
+    query: str, results: List[Dict], batch_size: Optional[int] = None
+) -> AsyncIterator[Tuple[Dict, Optional[float], List[Dict]]]:
+    """
+    Progressive variant of are_rank_results: yields (item, score, provisional_ranking) as soon as
+    each item is scored, in completion order. provisional_ranking lists the items scored so far
+    by descending score, followed by the still-pending (and unscored) ones in original order.
+    With batch_size > 1 the items of a batch are yielded together when the batch completes, and
+    near-duplicates of an item (see are_rank_results) are yielded right after it.
+    """
+    batch_size = max(1, batch_size or config.DEFAULT_POINTWISE_BATCH_SIZE)
+    clusters = _near_duplicate_clusters(results)
+    representatives = sorted(clusters)
+    chunks = [representatives[i:i + batch_size] for i in range(0, len(representatives), batch_size)]
+    tasks = {
+        asyncio.ensure_future(_ascore_items(query, [_document_text(results[i]) for i in chunk], batch_size)): chunk
+        for chunk in chunks
+    }
+    try:
+        pending = set(tasks)
+        while pending:
+            done, pending = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+            for task in done:
+                chunk = tasks[task]
+                for i, (score, confidence) in zip(chunk, task.result()):
+                    for j in [i] + clusters[i]:
+                        _set_pointwise_score(results[j], score, confidence)
+                        yield results[j], score, sorted(results, key=_pointwise_sort_key)
+    finally:
+        for task in tasks:
+            task.cancel()
+
+def stream_re_rank_results(
+    query: str, results: List[Dict], batch_size: Optional[int] = None
+) -> Iterator[Tuple[Dict, Optional[float], List[Dict]]]:
+    """Synchronous generator wrapper around astream_re_rank."""
+    return iterate_sync(astream_re_rank(query, results, batch_size))
+
+def evaluate_results(query: str, results: List[Dict]) -> Tuple[float, List[Optional[float]]]:
+    """
+    Scores each result pointwise and returns (ndcg, scores).
+    Unscored results (None) are left out of the NDCG computation rather than counted as 0.
+    """
     scores = []
     for item in results:
-        document = f"{item.get('title','')} {item.get('description','')}"
+        document = _document_text(item)
         score = get_relevance_score(query, document)
         scores.append(score)
-    ndcg = calculate_ndcg(scores)
+    scored = [score for score in scores if score is not None]
+    if len(scored) < len(scores):
+        logging.warning("%d of %d results are unscored and excluded from NDCG", len(scores) - len(scored), len(scores))
+    ndcg = calculate_ndcg(scored)
     return ndcg, scores
 
-def listwise_rank(query: str, results: List[Dict]) -> Tuple[List[Dict], str]:
+async def _alistwise_response(query: str, results: List[Dict]):
+    # Titles are short; the token budget is spent on the descriptions.
+    # With the query-intent stage the reply has no query_intent (see _alistwise_query_intent);
+    # otherwise the schema asks the model to state its interpretation.
+    descriptions = fit_documents([item.get("description", "") for item in results])
     results_block = ""
-    for idx, item in enumerate(results, start=1):
-        title = item.get("title", "")
-        description = item.get("description", "")
+    for idx, (item, description) in enumerate(zip(results, descriptions), start=1):
+        title = normalize_text(item.get("title", ""))
         results_block += f"{idx}. Title: {title}\n   Description: {description}\n\n"
-    prompt = config.DEFAULT_LISTWISE_PROMPT.format(query=query, results_block=results_block)
+    prompt = build_prompt(
+        config.DEFAULT_LISTWISE_PROMPT,
+        query=query,
+        intent_block=await _aintent_block(query),
+        results_block=results_block,
+    )
+    schema = LLMListwiseRankingResponse if config.QUERY_INTENT_ENABLED else LLMListwiseDetailedResponse
+    return await ainvoke_llm(get_structured_llm(schema), prompt, stage="listwise")
+
+async def _alistwise_query_intent(query: str, response_intent: Optional[str] = None) -> str:
+    # The cached query intent when the query-intent stage is on, else the listwise reply's own.
+    if config.QUERY_INTENT_ENABLED:
+        response_intent = await aget_query_intent(query)
+    return response_intent or "No interpretation available."
+
+async def alistwise_rank(query: str, results: List[Dict], scorer: Optional[Scorer] = None) -> Tuple[List[Dict], str]:
+    """
+    Ranks all results with a single listwise LLM call and returns (sorted_results, query_intent).
+    When config.DEFAULT_LISTWISE_WINDOW_SIZE is set and the list is longer than one window,
+    the sliding-window mode (alistwise_rank_windowed) is used instead.
+    A scorer (see src/scorers.py) replaces the listwise LLM call: results are ordered by its
+    scores, stored in 'llm_score', with unscored results last; query_intent is then the cached
+    query intent (see aget_query_intent) when config.QUERY_INTENT_ENABLED is set.
+    Near-duplicate results are collapsed first: only one representative per cluster is sent to
+    the LLM, and the other members are placed right after it with its score and reasoning.
+    """
+    if not results:
+        return results, await _alistwise_query_intent(query)
+    clusters = _near_duplicate_clusters(results)
+    if len(clusters) == len(results):
+        return await _alistwise_rank_unique(query, results, scorer)
+    representatives = {id(results[i]): i for i in clusters}
+    ranked, query_intent = await _alistwise_rank_unique(query, [results[i] for i in sorted(clusters)], scorer)
+    expanded = []
+    for item in ranked:
+        expanded.append(item)
+        for j in clusters[representatives[id(item)]]:
+            _copy_llm_fields(item, results[j])
+            expanded.append(results[j])
+    return expanded, query_intent
+
+async def _ascorer_rank(query: str, results: List[Dict], scorer: Scorer) -> Tuple[List[Dict], str]:
+    scores = await scorer.ascore(query, [_document_text(item) for item in results])
+    for item, score in zip(results, scores):
+        _set_pointwise_score(item, score)
+    return sorted(results, key=_pointwise_sort_key), await _alistwise_query_intent(query)
+
+async def _alistwise_rank_unique(query: str, results: List[Dict], scorer: Optional[Scorer] = None) -> Tuple[List[Dict], str]:
+    if scorer is not None:
+        return await _ascorer_rank(query, results, scorer)
+    window_size = config.DEFAULT_LISTWISE_WINDOW_SIZE
+    if window_size and len(results) > window_size:
+        return await alistwise_rank_windowed(query, results)
     try:
-        response = llm.with_structured_output(LLMListwiseDetailedResponse).invoke(prompt)
+        response = await _alistwise_response(query, results)
     except Exception as e:
         logging.exception("LLM call failed in listwise_rank")
-        return results, "No interpretation available."
+        return results, await _alistwise_query_intent(query)
     new_ranking = response.ranking
-    query_intent = response.query_intent
+    query_intent = await _alistwise_query_intent(query, getattr(response, "query_intent", None))
     sorted_results = []
     for ranking_item in new_ranking:
         if 1 <= ranking_item.index <= len(results):
@@ -89,6 +509,135 @@ def listwise_rank(query: str, results: List[Dict]) -> Tuple[List[Dict], str]:
             sorted_results.append(result)
     return sorted_results, query_intent
 
+def listwise_rank(query: str, results: List[Dict], scorer: Optional[Scorer] = None) -> Tuple[List[Dict], str]:
+    """Synchronous wrapper around alistwise_rank."""
+    return run_sync(alistwise_rank(query, results, scorer))
+
+def _sliding_windows(length: int, window_size: int, stride: int) -> List[Tuple[int, int]]:
+    """Returns (start, end) bounds of overlapping windows that together cover range(length) (none if empty)."""
+    windows = []
+    start = 0
+    while start < length:
+        end = min(start + window_size, length)
+        windows.append((start, end))
+        if end >= length:
+            break
+        start += stride
+    return windows
+
+async def alistwise_rank_windowed(
+    query: str,
+    results: List[Dict],
+    window_size: Optional[int] = None,
+    stride: Optional[int] = None,
+) -> Tuple[List[Dict], str]:
+    """
+    RankGPT-style sliding-window listwise ranking for result lists that do not fit one prompt.
+    The list is split into overlapping windows of window_size items, stride items apart
+    (defaults: config.DEFAULT_LISTWISE_WINDOW_SIZE / DEFAULT_LISTWISE_WINDOW_STRIDE), and every
+    window is ranked concurrently. Partial orders are merged by each item's mean LLM score,
+    ties broken by its mean normalised position within the windows that contain it.
+    Items no window managed to rank keep their original order at the bottom.
+    Returns (sorted_results, query_intent), like listwise_rank.
+    """
+    window_size = window_size or config.DEFAULT_LISTWISE_WINDOW_SIZE or len(results)
+    stride = max(1, min(stride or config.DEFAULT_LISTWISE_WINDOW_STRIDE, window_size))
+    windows = _sliding_windows(len(results), window_size, stride)
+    responses = await asyncio.gather(
+        *(_alistwise_response(query, results[start:end]) for start, end in windows),
+        return_exceptions=True,
+    )
+
+    query_intent = None
+    scores: Dict[int, List[float]] = {}
+    positions: Dict[int, List[float]] = {}
+    reasoning: Dict[int, Tuple[float, str]] = {}
+    for (start, end), response in zip(windows, responses):
+        if isinstance(response, BaseException):
+            logging.error("LLM call failed for listwise window %d-%d", start + 1, end, exc_info=response)
+            continue
+        if query_intent is None:
+            query_intent = getattr(response, "query_intent", None)
+        window_length = end - start
+        seen = set()
+        ranked = [item for item in response.ranking if 1 <= item.index <= window_length]
+        for position, ranking_item in enumerate(ranked):
+            if ranking_item.index in seen:
+                continue
+            seen.add(ranking_item.index)
+            i = start + ranking_item.index - 1
+            scores.setdefault(i, []).append(ranking_item.score)
+            positions.setdefault(i, []).append(position / max(len(ranked) - 1, 1))
+            # Keep the reasoning from the window that scored the item highest.
+            if i not in reasoning or ranking_item.score > reasoning[i][0]:
+                reasoning[i] = (ranking_item.score, ranking_item.reasoning)
+
+    ranked_indices = sorted(
+        scores,
+        key=lambda i: (-sum(scores[i]) / len(scores[i]), sum(positions[i]) / len(positions[i]), i),
+    )
+    sorted_results = []
+    for i in ranked_indices:
+        result = results[i]
+        result['llm_score'] = sum(scores[i]) / len(scores[i])
+        result['llm_reasoning'] = reasoning[i][1]
+        sorted_results.append(result)
+    sorted_results.extend(result for i, result in enumerate(results) if i not in scores)
+    return sorted_results, await _alistwise_query_intent(query, query_intent)
+
+def listwise_rank_windowed(
+    query: str,
+    results: List[Dict],
+    window_size: Optional[int] = None,
+    stride: Optional[int] = None,
+) -> Tuple[List[Dict], str]:
+    """Synchronous wrapper around alistwise_rank_windowed."""
+    return run_sync(alistwise_rank_windowed(query, results, window_size, stride))
+
+async def acascade_rank(
+    query: str,
+    results: List[Dict],
+    top_m: Optional[int] = None,
+    second_stage: Optional[str] = None,
+) -> Tuple[List[Dict], Optional[str]]:
+    """
+    Two-stage cascade: a per-SERP BM25 pass over title and description orders all results, and
+    only the top_m candidates (default: config.DEFAULT_CASCADE_TOP_M) are sent to the LLM ranker
+    named by second_stage ("listwise" or "pointwise"; default: config.DEFAULT_CASCADE_SECOND_STAGE).
+    The remaining results keep their BM25 order below the LLM-ranked block.
+    Every result gets a 'lexical_score'. Returns (sorted_results, query_intent); query_intent is
+    None for the pointwise second stage.
+    """
+    top_m = top_m or config.DEFAULT_CASCADE_TOP_M
+    second_stage = second_stage or config.DEFAULT_CASCADE_SECOND_STAGE
+    lexical_scores = bm25_scores(query, [_document_text(item) for item in results])
+    for item, score in zip(results, lexical_scores):
+        item['lexical_score'] = score
+    order = sorted(range(len(results)), key=lambda i: (-lexical_scores[i], i))
+    head = [results[i] for i in order[:top_m]]
+    tail = [results[i] for i in order[top_m:]]
+    logging.info("Cascade: sending %d of %d results to the %s ranker", len(head), len(results), second_stage)
+
+    if second_stage == "listwise":
+        ranked, query_intent = await alistwise_rank(query, head)
+        # The listwise reply may omit candidates; keep them right after the ranked ones.
+        ranked_ids = {id(item) for item in ranked}
+        ranked += [item for item in head if id(item) not in ranked_ids]
+    elif second_stage == "pointwise":
+        ranked, query_intent = await are_rank_results(query, head), None
+    else:
+        raise ValueError("Unsupported cascade second stage: " + second_stage)
+    return ranked + tail, query_intent
+
+def cascade_rank(
+    query: str,
+    results: List[Dict],
+    top_m: Optional[int] = None,
+    second_stage: Optional[str] = None,
+) -> Tuple[List[Dict], Optional[str]]:
+    """Synchronous wrapper around acascade_rank."""
+    return run_sync(acascade_rank(query, results, top_m, second_stage))
+
 if __name__ == "__main__":
     dummy_query = "silla de madera para mesa de exterior"
     dummy_results = [
@@ -0,0 +1,141 @@
+import hashlib
+import json
+import logging
+import os
+import threading
+from typing import Any, Dict, Type
+
+from pydantic import BaseModel
+
+from src.concurrency import run_sync
+from src.instrumentation import current_call
+from src.scheduler import estimate_tokens, get_provider_limiter
+
+MISS_FAIL = "fail"
+MISS_RECORD = "record"
+
+
+class ReplayMissError(Exception):
+    """Raised when a prompt is not in the cassette and the miss policy is 'fail'."""
+
+
+def _serialize_prompt(prompt: Any) -> Any:
+    if isinstance(prompt, list):
+        return [{"type": getattr(m, "type", "human"), "content": getattr(m, "content", m)} for m in prompt]
+    return str(prompt)
+
+
+class ReplayChatModel:
+    """
+    Record/replay wrapper around a live provider for reproducible evaluation runs.
+    Every structured call is keyed by (upstream provider, model, temperature, schema, prompt).
+    Keys found in the cassette (a JSONL file) are answered from disk without network access.
+    On a miss, miss_policy 'fail' raises ReplayMissError and 'record' calls the upstream provider
+    and appends the prompt and response to the cassette. Upstream calls get the caller's runnable
+    config (so the scheduler's instrumentation callbacks see them) and wait for the upstream
+    provider's RPM/TPM buckets (see src/scheduler.py), since the scheduler only rate-limits them
+    under the "Replay" provider.
+    """
+
+    def __init__(self, cassette_path: str, upstream_provider: str, model: str, temperature: float, miss_policy: str = MISS_FAIL):
+        if miss_policy not in (MISS_FAIL, MISS_RECORD):
+            raise ValueError("Unsupported replay miss policy: " + miss_policy)
+        if upstream_provider == "Replay":
+            raise ValueError("The Replay provider cannot use itself as its upstream provider")
+        self.cassette_path = cassette_path
+        self.upstream_provider = upstream_provider
+        self.model = model
+        self.temperature = temperature
+        self.miss_policy = miss_policy
+        self._entries: Dict[str, Dict] = {}
+        self._lock = threading.Lock()
+        self._stats = {"hits": 0, "misses": 0, "recorded": 0}
+        if os.path.exists(cassette_path):
+            with open(cassette_path, encoding="utf-8") as f:
+                for line in f:
+                    if line.strip():
+                        entry = json.loads(line)
+                        self._entries[entry["key"]] = entry
+        logging.info("Loaded %d cassette entries from %s", len(self._entries), cassette_path)
+
+    def with_structured_output(self, schema: Type[BaseModel]) -> "ReplayStructuredRunnable":
+        return ReplayStructuredRunnable(self, schema)
+
+    def stats(self) -> Dict[str, int]:
+        with self._lock:
+            return dict(self._stats)
+
+    def key(self, schema: Type[BaseModel], prompt: Any) -> str:
+        payload = json.dumps({
+            "provider": self.upstream_provider,
+            "model": self.model,
+            "temperature": self.temperature,
+            "schema": schema.__name__,
+            "prompt": _serialize_prompt(prompt),
+        }, sort_keys=True, ensure_ascii=False)
+        return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+    def lookup(self, key: str) -> Any:
+        with self._lock:
+            entry = self._entries.get(key)
+            self._stats["hits" if entry is not None else "misses"] += 1
+        return entry
+
+    def record(self, key: str, schema: Type[BaseModel], prompt: Any, response: BaseModel) -> None:
+        entry = {
+            "key": key,
+            "schema": schema.__name__,
+            "prompt": _serialize_prompt(prompt),
+            "response": response.model_dump(),
+        }
+        with self._lock:
+            self._entries[key] = entry
+            directory = os.path.dirname(self.cassette_path)
+            if directory:
+                os.makedirs(directory, exist_ok=True)
+            with open(self.cassette_path, "a", encoding="utf-8") as f:
+                f.write(json.dumps(entry, ensure_ascii=False) + "\n")
+            self._stats["recorded"] += 1
+
+
+class ReplayStructuredRunnable:
+    """Result of ReplayChatModel.with_structured_output(schema)."""
+
+    def __init__(self, model: ReplayChatModel, schema: Type[BaseModel]):
+        self.model = model
+        self.schema = schema
+
+    def _upstream(self) -> Any:
+        from src.llm_registry import get_structured_llm
+        return get_structured_llm(self.schema, self.model.upstream_provider, self.model.model, self.model.temperature)
+
+    def _replay(self, prompt: Any):
+        key = self.model.key(self.schema, prompt)
+        entry = self.model.lookup(key)
+        if entry is not None:
+            record = current_call()
+            if record is not None:
+                record.cache_hit = True
+            return key, self.schema.model_validate(entry["response"])
+        if self.model.miss_policy == MISS_FAIL:
+            raise ReplayMissError(f"No cassette entry for {self.schema.__name__} prompt (key {key[:12]})")
+        return key, None
+
+    def _limiter_acquire(self, prompt: Any):
+        return get_provider_limiter(self.model.upstream_provider).acquire(estimate_tokens(prompt))
+
+    async def ainvoke(self, prompt: Any, config: Any = None) -> BaseModel:
+        key, response = self._replay(prompt)
+        if response is None:
+            await self._limiter_acquire(prompt)
+            response = await self._upstream().ainvoke(prompt, config=config)
+            self.model.record(key, self.schema, prompt, response)
+        return response
+
+    def invoke(self, prompt: Any, config: Any = None) -> BaseModel:
+        key, response = self._replay(prompt)
+        if response is None:
+            run_sync(self._limiter_acquire(prompt))
+            response = self._upstream().invoke(prompt, config=config)
+            self.model.record(key, self.schema, prompt, response)
+        return response
@@ -0,0 +1,188 @@
+import asyncio
+import logging
+import random
+import threading
+import time
+from typing import Any, Dict, Optional
+
+import src.config as config
+from src.concurrency import get_llm_budget, run_sync
+from src.instrumentation import callback_handler, track
+from src.prompts import message_text
+
+_RETRYABLE_STATUS_CODES = {408, 409, 429, 500, 502, 503, 504, 529}
+_RETRYABLE_ERROR_NAMES = ("RateLimit", "Timeout", "Connection", "ServiceUnavailable", "InternalServer", "Throttl")
+
+
+class LLMCallFailed(Exception):
+    """Raised when an LLM call still fails after all retries (or fails with a non-retryable error)."""
+
+
+class TokenBucket:
+    """
+    Token bucket refilled continuously at rate_per_minute, holding at most one minute's worth.
+    acquire() reserves tokens immediately and sleeps off any deficit, so concurrent callers are
+    served in arrival order and the long-run rate never exceeds the limit.
+    """
+
+    def __init__(self, rate_per_minute: float):
+        self.rate_per_second = rate_per_minute / 60.0
+        self.capacity = float(rate_per_minute)
+        self._tokens = self.capacity
+        self._updated_at = time.monotonic()
+        self._lock = threading.Lock()
+
+    async def acquire(self, amount: float = 1.0) -> None:
+        amount = min(amount, self.capacity)
+        with self._lock:
+            now = time.monotonic()
+            self._tokens = min(self.capacity, self._tokens + (now - self._updated_at) * self.rate_per_second)
+            self._updated_at = now
+            self._tokens -= amount
+            deficit = -self._tokens
+        if deficit > 0:
+            await asyncio.sleep(deficit / self.rate_per_second)
+
+
+class ProviderLimiter:
+    """Requests-per-minute and tokens-per-minute buckets for one provider."""
+
+    def __init__(self, requests_per_minute: float, tokens_per_minute: float):
+        self.requests = TokenBucket(requests_per_minute)
+        self.tokens = TokenBucket(tokens_per_minute)
+
+    async def acquire(self, estimated_tokens: int) -> None:
+        await self.requests.acquire(1)
+        await self.tokens.acquire(estimated_tokens)
+
+
+_limiters: Dict[str, ProviderLimiter] = {}
+_limiters_lock = threading.Lock()
+_successes_since_increase = 0
+
+
+def get_provider_limiter(provider: str) -> ProviderLimiter:
+    limiter = _limiters.get(provider)
+    if limiter is None:
+        with _limiters_lock:
+            limiter = _limiters.get(provider)
+            if limiter is None:
+                limits = config.LLM_RATE_LIMITS.get(provider, config.LLM_RATE_LIMITS["default"])
+                limiter = ProviderLimiter(limits["rpm"], limits["tpm"])
+                _limiters[provider] = limiter
+    return limiter
+
+
+def estimate_tokens(prompt: Any) -> int:
+    """Rough token estimate (about 4 characters per token) used for the TPM bucket."""
+    if isinstance(prompt, list):
+        text = " ".join(message_text(message) for message in prompt)
+    else:
+        text = str(prompt)
+    return max(1, len(text) // 4) + config.LLM_EXPECTED_OUTPUT_TOKENS
+
+
+def _status_code(exc: BaseException) -> Optional[int]:
+    status = getattr(exc, "status_code", None)
+    if status is None:
+        status = getattr(getattr(exc, "response", None), "status_code", None)
+    return status if isinstance(status, int) else None
+
+
+def _is_rate_limit(exc: BaseException) -> bool:
+    return _status_code(exc) == 429 or "RateLimit" in type(exc).__name__
+
+
+def _is_retryable(exc: BaseException) -> bool:
+    status = _status_code(exc)
+    if status is not None:
+        return status in _RETRYABLE_STATUS_CODES
+    return any(name in type(exc).__name__ for name in _RETRYABLE_ERROR_NAMES)
+
+
+def _retry_after(exc: BaseException) -> Optional[float]:
+    """Reads Retry-After (seconds) or retry-after-ms from the error's HTTP response, if any."""
+    headers = getattr(getattr(exc, "response", None), "headers", None)
+    if not headers:
+        return None
+    try:
+        if headers.get("retry-after-ms"):
+            return float(headers["retry-after-ms"]) / 1000.0
+        if headers.get("retry-after"):
+            return float(headers["retry-after"])
+    except (TypeError, ValueError):
+        pass
+    return None
+
+
+def _backoff_delay(attempt: int, exc: BaseException) -> float:
+    retry_after = _retry_after(exc)
+    if retry_after is not None:
+        return retry_after + random.uniform(0, config.LLM_BACKOFF_BASE_SECONDS)
+    # Full jitter exponential backoff.
+    return random.uniform(0, min(config.LLM_BACKOFF_MAX_SECONDS, config.LLM_BACKOFF_BASE_SECONDS * 2 ** attempt))
+
+
+def _on_success() -> None:
+    # Additive increase: one extra slot after every LLM_CONCURRENCY_INCREASE_EVERY successes.
+    global _successes_since_increase
+    budget = get_llm_budget()
+    if budget.limit >= config.LLM_MAX_CONCURRENCY:
+        return
+    with _limiters_lock:
+        _successes_since_increase += 1
+        if _successes_since_increase < config.LLM_CONCURRENCY_INCREASE_EVERY:
+            return
+        _successes_since_increase = 0
+    budget.set_limit(budget.limit + 1)
+
+
+def _on_rate_limit() -> None:
+    # Multiplicative decrease.
+    global _successes_since_increase
+    budget = get_llm_budget()
+    with _limiters_lock:
+        _successes_since_increase = 0
+    if budget.limit > 1:
+        budget.set_limit(budget.limit // 2)
+        logging.warning("Rate limited by provider; LLM concurrency reduced to %d", budget.limit)
+
+
+async def ainvoke_llm(runnable: Any, prompt: Any, provider: Optional[str] = None, stage: str = "llm") -> Any:
+    """
+    Invokes runnable.ainvoke(prompt) under the scheduler: the call waits for the provider's RPM and
+    TPM buckets and for a slot of the global concurrency budget, and retryable failures (429, 5xx,
+    timeouts, connection errors) are retried with jittered exponential backoff, honouring
+    Retry-After. Rate limits halve the budget; sustained success grows it back up to
+    config.LLM_MAX_CONCURRENCY. Raises LLMCallFailed when the call cannot be completed.
+    The call is instrumented under the given stage, with waiting time recorded as queueing time.
+    """
+    provider = provider or config.DEFAULT_LLM_PROVIDER
+    limiter = get_provider_limiter(provider)
+    estimated_tokens = estimate_tokens(prompt)
+    with track(stage, provider, config.DEFAULT_LLM_MODEL) as record:
+        for attempt in range(config.LLM_MAX_RETRIES + 1):
+            queued_at = time.perf_counter()
+            await limiter.acquire(estimated_tokens)
+            try:
+                async with get_llm_budget():
+                    record.queue_seconds += time.perf_counter() - queued_at
+                    response = await runnable.ainvoke(prompt, config={"callbacks": [callback_handler]})
+            except Exception as exc:
+                if _is_rate_limit(exc):
+                    _on_rate_limit()
+                if not _is_retryable(exc) or attempt == config.LLM_MAX_RETRIES:
+                    raise LLMCallFailed(f"LLM call failed after {attempt + 1} attempt(s): {exc!r}") from exc
+                delay = _backoff_delay(attempt, exc)
+                logging.warning("Retryable LLM error (%s); retrying in %.1fs", type(exc).__name__, delay)
+                queued_at = time.perf_counter()
+                await asyncio.sleep(delay)
+                record.queue_seconds += time.perf_counter() - queued_at
+                continue
+            _on_success()
+            return response
+
+
+def invoke_llm(runnable: Any, prompt: Any, provider: Optional[str] = None, stage: str = "llm") -> Any:
+    """Synchronous wrapper around ainvoke_llm."""
+    return run_sync(ainvoke_llm(runnable, prompt, provider, stage))
@@ -12,3 +12,15 @@ class LLMListwiseDetailedItem(BaseModel):
 class LLMListwiseDetailedResponse(BaseModel):
     query_intent: str                 # How the model interpreted the query
     ranking: List[LLMListwiseDetailedItem]  # Ranked list of items
+
+class LLMListwiseRankingResponse(BaseModel):
+    ranking: List[LLMListwiseDetailedItem]  # Ranked list of items (the intent comes from the query-intent stage)
+
+class LLMPointwiseBatchItem(LLMPointwiseResponse):
+    index: int      # Position of the document in the batch (1-indexed)
+
+class LLMPointwiseBatchResponse(BaseModel):
+    scores: List[LLMPointwiseBatchItem]  # One entry per document in the batch
+
+class LLMQueryIntentResponse(BaseModel):
+    query_intent: str  # What the user is looking for, with the attributes the query requires
@@ -0,0 +1,126 @@
+import hashlib
+import math
+from abc import ABC, abstractmethod
+from collections import Counter
+from typing import Dict, List, Optional
+
+import numpy as np
+from langchain_core.embeddings import Embeddings
+
+from src.concurrency import run_sync
+from src.lexical import tokenize
+
+
+class Scorer(ABC):
+    """
+    Scores documents against a query (higher is more relevant, None if a document could not be
+    scored). Ranking functions accept any Scorer, e.g. re_rank_results(query, results, scorer=...).
+    """
+
+    name = "scorer"
+
+    @abstractmethod
+    async def ascore(self, query: str, documents: List[str]) -> List[Optional[float]]:
+        """Returns one score per document, in input order."""
+
+    def score(self, query: str, documents: List[str]) -> List[Optional[float]]:
+        """Synchronous wrapper around ascore."""
+        return run_sync(self.ascore(query, documents))
+
+
+class PointwiseLLMScorer(Scorer):
+    """Pointwise LLM relevance scores (see src/ranking.py ascore_documents)."""
+
+    name = "pointwise"
+
+    def __init__(self, batch_size: Optional[int] = None):
+        self.batch_size = batch_size
+
+    async def ascore(self, query: str, documents: List[str]) -> List[Optional[float]]:
+        from src.ranking import ascore_documents
+        return await ascore_documents(query, documents, self.batch_size)
+
+
+class ListwiseLLMScorer(Scorer):
+    """
+    Listwise LLM scores (see src/ranking.py alistwise_rank): the 1-10 score the model gave each
+    document in a single ranking call. Documents the reply left out are None.
+    """
+
+    name = "listwise"
+
+    async def ascore(self, query: str, documents: List[str]) -> List[Optional[float]]:
+        from src.ranking import alistwise_rank
+        items = [{"title": "", "description": document} for document in documents]
+        ranked, _ = await alistwise_rank(query, items)
+        positions = {id(item): i for i, item in enumerate(items)}
+        scores: List[Optional[float]] = [None] * len(documents)
+        for item in ranked:
+            scores[positions[id(item)]] = item.get("llm_score")
+        return scores
+
+
+def cosine_similarity_matrix(a: np.ndarray, b: np.ndarray) -> np.ndarray:
+    """Cosine similarities between the rows of a (n x d) and the rows of b (m x d), as an n x m matrix."""
+    a = np.asarray(a, dtype=np.float32)
+    b = np.asarray(b, dtype=np.float32)
+    a = a / np.maximum(np.linalg.norm(a, axis=1, keepdims=True), 1e-12)
+    b = b / np.maximum(np.linalg.norm(b, axis=1, keepdims=True), 1e-12)
+    return a @ b.T
+
+
+class EmbeddingScorer(Scorer):
+    """
+    Scores documents by cosine similarity between the query embedding and the document embeddings,
+    using any LangChain Embeddings object (see src/llm_registry.py get_embeddings). Documents are
+    embedded in one batch and scored with a single matrix product, so with a local embedding model
+    ranking a SERP takes milliseconds and needs no network access.
+    """
+
+    name = "embedding"
+
+    def __init__(self, embeddings: Embeddings):
+        self.embeddings = embeddings
+
+    async def ascore(self, query: str, documents: List[str]) -> List[Optional[float]]:
+        if not documents:
+            return []
+        query_vector = await self.embeddings.aembed_query(query)
+        document_vectors = await self.embeddings.aembed_documents(documents)
+        similarities = cosine_similarity_matrix(np.array([query_vector]), np.array(document_vectors))[0]
+        return [float(similarity) for similarity in similarities]
+
+
+class HashingEmbeddings(Embeddings):
+    """
+    Local, dependency-free embedding model: word unigrams and character trigrams (after
+    src/lexical.py tokenize) hashed into a fixed number of dimensions, with sublinear term
+    frequency weighting. It captures lexical overlap only, but needs no model download, so it is
+    the offline default and a baseline for real embedding models.
+    """
+
+    def __init__(self, dimensions: int = 512):
+        self.dimensions = dimensions
+
+    def _features(self, text: str) -> Dict[str, int]:
+        features = Counter()
+        for token in tokenize(text):
+            features["w:" + token] += 1
+            padded = f"#{token}#"
+            features.update("c:" + padded[i:i + 3] for i in range(len(padded) - 2))
+        return features
+
+    def _embed(self, text: str) -> List[float]:
+        vector = np.zeros(self.dimensions, dtype=np.float32)
+        for feature, count in self._features(text).items():
+            digest = hashlib.blake2b(feature.encode("utf-8"), digest_size=8).digest()
+            index = int.from_bytes(digest[:4], "big") % self.dimensions
+            sign = 1.0 if digest[4] & 1 else -1.0
+            vector[index] += sign * (1.0 + math.log(count))
+        return vector.tolist()
+
+    def embed_documents(self, texts: List[str]) -> List[List[float]]:
+        return [self._embed(text) for text in texts]
+
+    def embed_query(self, text: str) -> List[float]:
+        return self._embed(text)
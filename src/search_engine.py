@@ -1,41 +1,104 @@
+import logging
+import time
 import requests
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
 from typing import List, Dict
 
+import src.config as config
+from src.cache import TTLLRUCache
+from src.geohash import decode, encode
+from src.instrumentation import track
+
+logger = logging.getLogger(__name__)
+
+SEARCH_URL = "https://api.wallapop.com/api/v3/search"
+
+SEARCH_HEADERS = {
+    "Accept": "application/json, text/plain, */*",
+    "Accept-Language": "es,it-IT;q=0.9,it;q=0.8,en-US;q=0.7,en;q=0.6",
+    "Cache-Control": "no-cache",
+    "Connection": "keep-alive",
+    "DeviceOS": "0",
+    "MPID": "-5589673199823489972",
+    "Origin": "https://es.wallapop.com",
+    "Pragma": "no-cache",
+    "Referer": "https://es.wallapop.com/",
+    "Sec-Fetch-Dest": "empty",
+    "Sec-Fetch-Mode": "cors",
+    "Sec-Fetch-Site": "same-site",
+    "User-Agent": "Mozilla/5.0 (Macintosh; Intel Mac OS X 10_15_7) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/134.0.0.0 Safari/537.36",
+    "X-AppVersion": "84230",
+    "X-DeviceID": "b80b8c1a-a846-4392-9223-eeb4c77c67bb",
+    "X-DeviceOS": "0",
+    "sec-ch-ua": '"Chromium";v="134", "Not:A-Brand";v="24", "Google Chrome";v="134"',
+    "sec-ch-ua-mobile": "?0",
+    "sec-ch-ua-platform": '"macOS"'
+}
+
+def _build_session() -> requests.Session:
+    """
+    Creates the pooled keep-alive session shared by every search call.
+    Connection errors and 5xx responses are retried with exponential backoff by urllib3.
+    """
+    retry = Retry(
+        total=config.SEARCH_MAX_RETRIES,
+        connect=config.SEARCH_MAX_RETRIES,
+        read=config.SEARCH_MAX_RETRIES,
+        status=config.SEARCH_MAX_RETRIES,
+        status_forcelist=(500, 502, 503, 504),
+        allowed_methods=frozenset({"GET"}),
+        backoff_factor=config.SEARCH_BACKOFF_FACTOR,
+        raise_on_status=False,
+    )
+    adapter = HTTPAdapter(pool_connections=1, pool_maxsize=config.SEARCH_POOL_SIZE, max_retries=retry)
+    session = requests.Session()
+    session.headers.update(SEARCH_HEADERS)
+    session.mount("https://", adapter)
+    return session
+
+_session = _build_session()
+
+_search_cache = TTLLRUCache(config.SEARCH_CACHE_MAX_ENTRIES, config.SEARCH_CACHE_TTL_SECONDS)
+
+def _normalize_query(query: str) -> str:
+    return " ".join(query.lower().split())
+
 def search_engine(query: str, latitude: float = 41.387917, longitude: float = 2.1699187) -> List[Dict]:
     """
     Queries the Wallapop API with the provided query and returns a list of dictionaries.
     Each dictionary contains the 'title', 'description', and the first thumbnail image URL of a search result.
+    Results are cached per normalized query and geohash cell of (latitude, longitude), with precision
+    config.SEARCH_CACHE_GEOHASH_PRECISION; the API is queried at the cell centre, so every point in a
+    cell gets the same results. Callers receive fresh copies of the cached dictionaries.
     """
-    url = "https://api.wallapop.com/api/v3/search"
+    with track("search", "wallapop") as record:
+        if config.SEARCH_CACHE_ENABLED:
+            cell = encode(latitude, longitude, config.SEARCH_CACHE_GEOHASH_PRECISION)
+            cache_key = f"{_normalize_query(query)}|{cell}"
+            cached = _search_cache.get(cache_key)
+            if cached is not None:
+                record.cache_hit = True
+                return [dict(result) for result in cached]
+            latitude, longitude = decode(cell)
+            results = _fetch_results(query, latitude, longitude)
+            _search_cache.set(cache_key, [dict(result) for result in results])
+            return results
+        return _fetch_results(query, latitude, longitude)
+
+def _fetch_results(query: str, latitude: float, longitude: float) -> List[Dict]:
     params = {
         "source": "search_box",
         "keywords": query,
         "latitude": latitude,
         "longitude": longitude
     }
-    headers = {
-        "Accept": "application/json, text/plain, */*",
-        "Accept-Language": "es,it-IT;q=0.9,it;q=0.8,en-US;q=0.7,en;q=0.6",
-        "Cache-Control": "no-cache",
-        "Connection": "keep-alive",
-        "DeviceOS": "0",
-        "MPID": "-5589673199823489972",
-        "Origin": "https://es.wallapop.com",
-        "Pragma": "no-cache",
-        "Referer": "https://es.wallapop.com/",
-        "Sec-Fetch-Dest": "empty",
-        "Sec-Fetch-Mode": "cors",
-        "Sec-Fetch-Site": "same-site",
-        "User-Agent": "Mozilla/5.0 (Macintosh; Intel Mac OS X 10_15_7) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/134.0.0.0 Safari/537.36",
-        "X-AppVersion": "84230",
-        "X-DeviceID": "b80b8c1a-a846-4392-9223-eeb4c77c67bb",
-        "X-DeviceOS": "0",
-        "sec-ch-ua": '"Chromium";v="134", "Not:A-Brand";v="24", "Google Chrome";v="134"',
-        "sec-ch-ua-mobile": "?0",
-        "sec-ch-ua-platform": '"macOS"'
-    }
-    
-    response = requests.get(url, headers=headers, params=params)
+    started = time.perf_counter()
+    response = _session.get(
+        SEARCH_URL,
+        params=params,
+        timeout=(config.SEARCH_CONNECT_TIMEOUT_SECONDS, config.SEARCH_READ_TIMEOUT_SECONDS),
+    )
     response.raise_for_status()
     data = response.json()
 
@@ -50,5 +113,8 @@ def search_engine(query: str, latitude: float = 41.387917, longitude: float = 2.
         if images:
             thumbnail = images[0].get("urls", {}).get("small", "")
         results.append({"title": title, "description": description, "thumbnail": thumbnail})
-        print(results)
+    logger.info(
+        "Search for %r at (%s, %s) returned %d results in %.0f ms",
+        query, latitude, longitude, len(results), (time.perf_counter() - started) * 1000,
+    )
     return results
@@ -0,0 +1,213 @@
+import asyncio
+import hashlib
+import math
+import random
+import re
+import threading
+import time
+from typing import Any, Dict, List, Set, Type
+
+from langchain_core.messages import AIMessage
+from pydantic import BaseModel
+
+from src.instrumentation import current_call
+from src.prompts import message_text
+from src.schemas import (
+    LLMListwiseDetailedItem,
+    LLMListwiseDetailedResponse,
+    LLMListwiseRankingResponse,
+    LLMPointwiseBatchItem,
+    LLMPointwiseBatchResponse,
+    LLMPointwiseResponse,
+    LLMQueryIntentResponse,
+)
+
+_NUMBERED_LINE_RE = re.compile(r"^\s*(\d+)\. ", re.MULTILINE)
+
+
+class StubRateLimitError(Exception):
+    """Injected failure that looks like a provider 429 to src/scheduler.py."""
+
+    status_code = 429
+
+
+def _prompt_text(prompt: Any) -> str:
+    if isinstance(prompt, list):
+        return "\n".join(message_text(message) for message in prompt)
+    return str(prompt)
+
+
+def _static_prefix(prompt: Any) -> str:
+    if isinstance(prompt, list) and prompt and getattr(prompt[0], "type", None) == "system":
+        return message_text(prompt[0])
+    return ""
+
+
+def _numbered_indices(text: str) -> List[int]:
+    indices = []
+    for match in _NUMBERED_LINE_RE.finditer(text):
+        index = int(match.group(1))
+        if index == len(indices) + 1:
+            indices.append(index)
+    return indices
+
+
+class StubChatModel:
+    """
+    Deterministic, offline stand-in for a chat model, used for benchmarks and tests.
+    Structured replies are derived from a hash of the prompt, so the same prompt always gets the
+    same answer. Each call sleeps for a log-normal latency (median latency_ms, spread
+    latency_sigma) and fails with a 429-like error with probability error_rate.
+    System-message prefixes seen before are reported as cached prompt tokens, like a provider's
+    prompt cache would. Call and prompt-token counters are available through stats().
+    """
+
+    def __init__(self, latency_ms: float = 300.0, latency_sigma: float = 0.3, error_rate: float = 0.0, seed: int = 0):
+        self.latency_ms = latency_ms
+        self.latency_sigma = latency_sigma
+        self.error_rate = error_rate
+        self.seed = seed
+        self._lock = threading.Lock()
+        self._calls_per_prompt: Dict[str, int] = {}
+        self._seen_prefixes: Set[str] = set()
+        self._stats = {"calls": 0, "errors": 0, "prompt_tokens": 0, "cached_tokens": 0}
+
+    def with_structured_output(self, schema: Type[BaseModel]) -> "StubStructuredRunnable":
+        return StubStructuredRunnable(self, schema)
+
+    def bind(self, **kwargs: Any) -> "StubLogprobRunnable":
+        """Supports the single-token logprobs binding used by the "logprobs" scoring mode."""
+        return StubLogprobRunnable(self, kwargs.get("top_logprobs", 5))
+
+    def stats(self) -> Dict[str, int]:
+        with self._lock:
+            return dict(self._stats)
+
+    def reset_stats(self) -> None:
+        with self._lock:
+            self._stats = {"calls": 0, "errors": 0, "prompt_tokens": 0, "cached_tokens": 0}
+            self._seen_prefixes.clear()
+
+    def _draw(self, text: str) -> random.Random:
+        digest = hashlib.sha256(text.encode("utf-8")).hexdigest()
+        with self._lock:
+            attempt = self._calls_per_prompt.get(digest, 0)
+            self._calls_per_prompt[digest] = attempt + 1
+            self._stats["calls"] += 1
+            self._stats["prompt_tokens"] += max(1, len(text) // 4)
+        return random.Random(f"{self.seed}:{digest}:{attempt}")
+
+    def _call(self, text: str) -> float:
+        """Accounts for one call and returns its simulated latency in seconds (raising injected errors)."""
+        rng = self._draw(text)
+        latency = self.latency_ms / 1000.0 * rng.lognormvariate(0.0, self.latency_sigma)
+        if rng.random() < self.error_rate:
+            with self._lock:
+                self._stats["errors"] += 1
+            raise StubRateLimitError("Injected rate limit error")
+        return latency
+
+    def cached_tokens(self, prefix: str) -> int:
+        """Tokens of prefix served from the simulated prompt cache (0 the first time it is seen)."""
+        if not prefix:
+            return 0
+        with self._lock:
+            if prefix not in self._seen_prefixes:
+                self._seen_prefixes.add(prefix)
+                return 0
+            cached = max(1, len(prefix) // 4)
+            self._stats["cached_tokens"] += cached
+        return cached
+
+    def build_grade_message(self, text: str, top_logprobs: int) -> AIMessage:
+        """One-token grade reply with OpenAI-style top log-probabilities over "2", "1", "0" and filler tokens."""
+        rng = random.Random(hashlib.sha256(f"{self.seed}:logprobs:{text}".encode("utf-8")).digest())
+        weights = {token: rng.random() ** 3 for token in ("2", "1", "0", " ", "unknown")}
+        total = sum(weights.values())
+        ranked = sorted(weights.items(), key=lambda item: -item[1])[:top_logprobs]
+        alternatives = [{"token": token, "logprob": math.log(weight / total), "bytes": None} for token, weight in ranked]
+        return AIMessage(
+            content=ranked[0][0],
+            response_metadata={"logprobs": {"content": [dict(alternatives[0], top_logprobs=alternatives)]}},
+        )
+
+    def build_response(self, schema: Type[BaseModel], text: str) -> BaseModel:
+        rng = random.Random(hashlib.sha256(f"{self.seed}:{text}".encode("utf-8")).digest())
+        if schema is LLMPointwiseResponse:
+            return LLMPointwiseResponse(score=rng.choice([0, 1, 2]))
+        if schema is LLMPointwiseBatchResponse:
+            documents = text.split("Documents:", 1)[-1]
+            return LLMPointwiseBatchResponse(scores=[
+                LLMPointwiseBatchItem(index=i, score=rng.choice([0, 1, 2])) for i in _numbered_indices(documents)
+            ])
+        if schema is LLMListwiseDetailedResponse or schema is LLMListwiseRankingResponse:
+            indices = _numbered_indices(text)
+            rng.shuffle(indices)
+            ranking = [
+                LLMListwiseDetailedItem(index=i, score=10 - 9 * position / max(len(indices), 1), reasoning="stub")
+                for position, i in enumerate(indices)
+            ]
+            if schema is LLMListwiseRankingResponse:
+                return LLMListwiseRankingResponse(ranking=ranking)
+            return LLMListwiseDetailedResponse(query_intent="Stub interpretation of the query", ranking=ranking)
+        if schema is LLMQueryIntentResponse:
+            return LLMQueryIntentResponse(query_intent="Stub interpretation of the query")
+        raise NotImplementedError(f"StubChatModel has no reply generator for {schema.__name__}")
+
+
+class StubStructuredRunnable:
+    """Result of StubChatModel.with_structured_output(schema)."""
+
+    def __init__(self, model: StubChatModel, schema: Type[BaseModel]):
+        self.model = model
+        self.schema = schema
+
+    def _respond(self, prompt: Any, text: str) -> BaseModel:
+        response = self.model.build_response(self.schema, text)
+        record = current_call()
+        if record is not None:
+            record.add_usage(
+                max(1, len(text) // 4),
+                max(1, len(response.model_dump_json()) // 4),
+                self.model.cached_tokens(_static_prefix(prompt)),
+            )
+        return response
+
+    async def ainvoke(self, prompt: Any, config: Any = None) -> BaseModel:
+        text = _prompt_text(prompt)
+        latency = self.model._call(text)
+        await asyncio.sleep(latency)
+        return self._respond(prompt, text)
+
+    def invoke(self, prompt: Any, config: Any = None) -> BaseModel:
+        text = _prompt_text(prompt)
+        latency = self.model._call(text)
+        time.sleep(latency)
+        return self._respond(prompt, text)
+
+
+class StubLogprobRunnable:
+    """Result of StubChatModel.bind(logprobs=True, top_logprobs=..., max_tokens=1)."""
+
+    def __init__(self, model: StubChatModel, top_logprobs: int):
+        self.model = model
+        self.top_logprobs = top_logprobs
+
+    def _respond(self, prompt: Any, text: str) -> AIMessage:
+        message = self.model.build_grade_message(text, self.top_logprobs)
+        record = current_call()
+        if record is not None:
+            record.add_usage(max(1, len(text) // 4), 1, self.model.cached_tokens(_static_prefix(prompt)))
+        return message
+
+    async def ainvoke(self, prompt: Any, config: Any = None) -> AIMessage:
+        text = _prompt_text(prompt)
+        latency = self.model._call(text)
+        await asyncio.sleep(latency)
+        return self._respond(prompt, text)
+
+    def invoke(self, prompt: Any, config: Any = None) -> AIMessage:
+        text = _prompt_text(prompt)
+        latency = self.model._call(text)
+        time.sleep(latency)
+        return self._respond(prompt, text)
@@ -0,0 +1,17 @@
+import pytest
+
+import src.config as config
+from src.llm_registry import clear_registry
+
+
+@pytest.fixture
+def stub_llm(monkeypatch):
+    """Offline Stub provider without latency, caches, near-duplicate collapse or query-intent stage."""
+    monkeypatch.setattr(config, "DEFAULT_LLM_PROVIDER", "Stub")
+    monkeypatch.setattr(config, "STUB_LLM_SETTINGS", {"latency_ms": 0.0, "latency_sigma": 0.0, "error_rate": 0.0, "seed": 0})
+    monkeypatch.setattr(config, "SCORE_CACHE_ENABLED", False)
+    monkeypatch.setattr(config, "QUERY_INTENT_ENABLED", False)
+    monkeypatch.setattr(config, "DEDUP_ENABLED", False)
+    clear_registry()
+    yield
+    clear_registry()
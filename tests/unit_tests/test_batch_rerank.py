@@ -0,0 +1,51 @@
+import json
+
+import pytest
+
+import src.batch_rerank as batch_rerank
+
+
+def _fake_pipeline(failing):
+    async def arun_bulk_pipeline(keywords, search_concurrency=None, rank_concurrency=None, ordered=True):
+        for index, keyword in enumerate(keywords):
+            error = "search failed" if keyword in failing else None
+            yield {"index": index, "keyword": keyword, "error": error, "results": []}
+    return arun_bulk_pipeline
+
+
+@pytest.mark.parametrize("output_format", ["jsonl", "parquet"])
+def test_failed_rows_are_retried_and_written_once(tmp_path, monkeypatch, output_format) -> None:
+    source = tmp_path / "keywords.csv"
+    source.write_text("search_keywords\nsilla\nmesa\nsofa\n", encoding="utf-8")
+    output = tmp_path / ("results.jsonl" if output_format == "jsonl" else "results")
+    argv = [str(source), "--output", str(output), "--format", output_format, "--chunk-size", "2"]
+
+    monkeypatch.setattr(batch_rerank, "arun_bulk_pipeline", _fake_pipeline({"mesa"}))
+    batch_rerank.main(argv)
+    assert batch_rerank.load_checkpoint(str(output) + ".checkpoint") == {0, 2}
+
+    monkeypatch.setattr(batch_rerank, "arun_bulk_pipeline", _fake_pipeline(set()))
+    batch_rerank.main(argv)
+    assert batch_rerank.load_checkpoint(str(output) + ".checkpoint") == {0, 1, 2}
+
+    if output_format == "jsonl":
+        records = [json.loads(line) for line in output.read_text(encoding="utf-8").splitlines()]
+    else:
+        import pyarrow.parquet as pq
+        records = pq.read_table(str(output)).to_pylist()
+    assert sorted((r["row_number"], r["error"]) for r in records) == [(0, None), (1, None), (2, None)]
+
+
+def test_records_written_before_a_crash_are_not_duplicated(tmp_path, monkeypatch) -> None:
+    source = tmp_path / "keywords.csv"
+    source.write_text("search_keywords\nsilla\nmesa\n", encoding="utf-8")
+    output = tmp_path / "results.jsonl"
+    # Row 1 was written but the run stopped before checkpointing it, in the middle of the next line.
+    output.write_text('{"row_number": 0}\n{"row_number": 1}\n{"row_nu', encoding="utf-8")
+    (tmp_path / "results.jsonl.checkpoint").write_text("0\n", encoding="utf-8")
+
+    monkeypatch.setattr(batch_rerank, "arun_bulk_pipeline", _fake_pipeline(set()))
+    batch_rerank.main([str(source), "--output", str(output)])
+    records = [json.loads(line) for line in output.read_text(encoding="utf-8").splitlines()]
+    assert [r["row_number"] for r in records] == [0, 1]
+    assert records[1]["keyword"] == "mesa"
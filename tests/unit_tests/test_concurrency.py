@@ -0,0 +1,72 @@
+import asyncio
+import threading
+
+import pytest
+
+from src.concurrency import ConcurrencyBudget, submit
+
+
+@pytest.mark.asyncio
+async def test_cancelled_waiter_returns_its_slot() -> None:
+    budget = ConcurrencyBudget(1)
+    await budget.acquire()
+    waiter = asyncio.ensure_future(budget.acquire())
+    await asyncio.sleep(0)
+    waiter.cancel()
+    with pytest.raises(asyncio.CancelledError):
+        await waiter
+    budget.release()
+    assert budget.in_flight == 0
+    await asyncio.wait_for(budget.acquire(), timeout=1)
+    assert budget.in_flight == 1
+
+
+@pytest.mark.asyncio
+async def test_waiter_cancelled_after_grant_returns_its_slot() -> None:
+    budget = ConcurrencyBudget(1)
+    await budget.acquire()
+    waiter = asyncio.ensure_future(budget.acquire())
+    await asyncio.sleep(0)
+    # The slot is assigned to the waiter, but the waiter is cancelled before the grant runs.
+    budget.release()
+    waiter.cancel()
+    with pytest.raises(asyncio.CancelledError):
+        await waiter
+    await asyncio.sleep(0)
+    assert budget.in_flight == 0
+
+
+@pytest.mark.asyncio
+async def test_limit_is_respected_across_loops() -> None:
+    budget = ConcurrencyBudget(3)
+    lock = threading.Lock()
+    running = 0
+    peak = 0
+
+    async def call() -> None:
+        nonlocal running, peak
+        async with budget:
+            with lock:
+                running += 1
+                peak = max(peak, running)
+            await asyncio.sleep(0.01)
+            with lock:
+                running -= 1
+
+    # Half of the calls run on the background loop, half on this test's loop.
+    background = [asyncio.wrap_future(submit(call())) for _ in range(10)]
+    await asyncio.gather(*(call() for _ in range(10)), *background)
+    assert peak <= 3
+    assert budget.in_flight == 0
+
+
+@pytest.mark.asyncio
+async def test_raising_the_limit_wakes_waiters() -> None:
+    budget = ConcurrencyBudget(1)
+    await budget.acquire()
+    waiter = asyncio.ensure_future(budget.acquire())
+    await asyncio.sleep(0)
+    assert not waiter.done()
+    budget.set_limit(2)
+    await asyncio.wait_for(waiter, timeout=1)
+    assert budget.in_flight == 2
@@ -0,0 +1,37 @@
+import pytest
+
+import src.config as config
+import src.ranking as ranking
+from src.dedup import (
+    cluster_members,
+    cluster_near_duplicates,
+    hamming_distance,
+    simhash,
+)
+from src.llm_registry import get_llm
+
+
+def test_simhash_ignores_case_and_punctuation() -> None:
+    assert simhash("Silla de madera, como nueva!") == simhash("silla de madera como nueva")
+    assert hamming_distance(simhash("silla de madera como nueva"), simhash("bicicleta de carretera talla M")) > 3
+
+
+def test_clusters_are_keyed_by_their_first_text() -> None:
+    texts = ["mesa de cocina", "Silla de madera", "lampara de pie", "silla de madera!", "SILLA DE MADERA"]
+    assert cluster_near_duplicates(texts) == [0, 1, 2, 1, 1]
+    assert cluster_members([0, 1, 2, 1, 1]) == {0: [], 1: [3, 4], 2: []}
+
+
+@pytest.mark.asyncio
+async def test_duplicates_are_scored_once_and_share_the_score(stub_llm, monkeypatch) -> None:
+    monkeypatch.setattr(config, "DEDUP_ENABLED", True)
+    results = [
+        {"title": "Silla de madera", "description": "como nueva"},
+        {"title": "mesa de cocina", "description": ""},
+        {"title": "silla de madera", "description": "Como nueva."},
+    ]
+    ranked = await ranking.are_rank_results("silla", results)
+    assert get_llm().stats()["calls"] == 2
+    assert results[2]["duplicate_of"] == 1
+    assert results[2]["llm_score"] == results[0]["llm_score"]
+    assert len(ranked) == 3
@@ -0,0 +1,61 @@
+import numpy as np
+import pytest
+
+from src.embedding_store import EmbeddingStore, StoredEmbeddings
+from src.scorers import HashingEmbeddings
+
+
+def _unit(vector):
+    vector = np.asarray(vector, dtype=np.float32)
+    return vector / np.linalg.norm(vector)
+
+
+@pytest.mark.parametrize("dtype, tolerance", [("float16", 1e-3), ("int8", 1e-2)])
+def test_vectors_round_trip(tmp_path, dtype, tolerance) -> None:
+    rng = np.random.default_rng(0)
+    vectors = rng.standard_normal((20, 16)).astype(np.float32)
+    store = EmbeddingStore(str(tmp_path), dtype)
+    assert store.add([f"k{i}" for i in range(20)], vectors) == 20
+    reopened = EmbeddingStore(str(tmp_path), dtype)
+    for vector, stored in zip(vectors, reopened.get([f"k{i}" for i in range(20)])):
+        np.testing.assert_allclose(stored, _unit(vector), atol=tolerance)
+    assert reopened.get(["missing"]) == [None]
+
+
+@pytest.mark.parametrize("dtype", ["float16", "int8"])
+def test_rows_orphaned_by_a_crash_are_discarded(tmp_path, dtype) -> None:
+    e1, e2, e3 = np.eye(3, dtype=np.float32)
+    store = EmbeddingStore(str(tmp_path), dtype)
+    store.add(["a"], [e1])
+    # Simulate a crash after the row was appended but before its key was.
+    with open(tmp_path / "vectors.bin", "ab") as f:
+        f.write(np.array([e3]).astype(dtype).tobytes())
+    if dtype == "int8":
+        with open(tmp_path / "scales.bin", "ab") as f:
+            f.write(np.array([1.0], dtype=np.float32).tobytes())
+    with open(tmp_path / "keys.jsonl", "ab") as f:
+        f.write(b'"b')
+
+    restarted = EmbeddingStore(str(tmp_path), dtype)
+    assert restarted.add(["c"], [e2]) == 1
+    assert len(restarted) == 2
+    np.testing.assert_allclose(restarted.get(["c"])[0], e2, atol=1e-2)
+    np.testing.assert_allclose(restarted.get(["a"])[0], e1, atol=1e-2)
+    assert EmbeddingStore(str(tmp_path), dtype).get(["b", "c"])[0] is None
+
+
+@pytest.mark.asyncio
+async def test_stored_embeddings_only_embed_unseen_texts(tmp_path) -> None:
+    class CountingEmbeddings(HashingEmbeddings):
+        calls = 0
+
+        async def aembed_documents(self, texts):
+            self.calls += len(texts)
+            return await super().aembed_documents(texts)
+
+    embeddings = CountingEmbeddings(64)
+    stored = StoredEmbeddings(embeddings, EmbeddingStore(str(tmp_path)))
+    first = await stored.aembed_documents(["silla de madera", "mesa"])
+    second = await stored.aembed_documents(["mesa", "silla de madera", "sofa"])
+    assert embeddings.calls == 3
+    np.testing.assert_allclose(second[1], first[0], atol=1e-3)
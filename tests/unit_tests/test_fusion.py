@@ -0,0 +1,46 @@
+import asyncio
+import time
+
+import pytest
+
+import src.config as config
+import src.ranking as ranking
+from src.fusion import IncrementalFusion, afused_rank
+
+
+def _results(n):
+    return [{"title": f"listing {i}", "description": f"description {i}"} for i in range(n)]
+
+
+def test_reciprocal_rank_fusion() -> None:
+    fusion = IncrementalFusion(_results(3), weights={"baseline": 1.0, "listwise": 2.0}, k=1)
+    fusion.add_signal("baseline", [0, 1, 2])
+    fusion.add_signal("listwise", [2, 0], {2: 9.0, 0: 5.0})
+    assert fusion.scores() == pytest.approx([1 / 2 + 2 / 3, 1 / 3, 1 / 4 + 2 / 2])
+    ranked = fusion.ranking()
+    assert [item["title"] for item in ranked] == ["listing 2", "listing 0", "listing 1"]
+    assert ranked[0]["listwise_score"] == 9.0 and "listwise_score" not in ranked[2]
+
+
+@pytest.mark.asyncio
+async def test_deadline_serves_the_pointwise_scores_received_so_far(monkeypatch) -> None:
+    monkeypatch.setattr(config, "DEDUP_ENABLED", False)
+    monkeypatch.setattr(config, "DEFAULT_POINTWISE_BATCH_SIZE", 1)
+
+    async def slow_listwise(query, results, scorer=None):
+        await asyncio.sleep(10)
+
+    async def score_items(query, documents, batch_size):
+        # Odd listings take far longer than the deadline.
+        slow = int(documents[0].split()[-1]) % 2
+        await asyncio.sleep(10 if slow else 0.01)
+        return [(1.0, None)]
+
+    monkeypatch.setattr(ranking, "alistwise_rank", slow_listwise)
+    monkeypatch.setattr(ranking, "_ascore_items", score_items)
+    started = time.monotonic()
+    fused, signals = await afused_rank("listing", _results(6), deadline_seconds=0.3)
+    assert time.monotonic() - started < 1.0
+    assert signals == ["baseline", "pointwise"]
+    assert [item["title"] for item in fused[:3]] == ["listing 0", "listing 2", "listing 4"]
+    assert all(item["pointwise_score"] is None for item in fused[3:])
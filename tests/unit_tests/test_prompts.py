@@ -0,0 +1,37 @@
+import src.config as config
+from src.prompts import build_prompt, message_text, split_template
+
+
+def test_prefix_ends_before_the_line_of_the_first_field() -> None:
+    prefix, variable = split_template('Rate {{"score": 2}} style.\nBe strict.\nQuery: "{query}"\nDone.')
+    assert prefix == 'Rate {"score": 2} style.\nBe strict.'
+    assert variable == 'Query: "{query}"\nDone.'
+
+
+def test_templates_without_a_static_start_have_no_prefix() -> None:
+    assert split_template("{query} and more") == ("", "{query} and more")
+    assert split_template("No fields {{here}}") == ("No fields {here}", "")
+
+
+def test_pointwise_prompts_share_the_rubric_prefix(monkeypatch) -> None:
+    monkeypatch.setattr(config, "PROMPT_PREFIX_LAYOUT", True)
+    first = build_prompt(config.DEFAULT_POINTWISE_PROMPT, query="silla", intent_block="", document="a")
+    second = build_prompt(config.DEFAULT_POINTWISE_PROMPT, query="mesa", intent_block="", document="b")
+    assert first[0].type == "system" and first[0].content == second[0].content
+    assert message_text(first[0]) == config.POINTWISE_RUBRIC.strip()
+    assert message_text(first[1]).strip().startswith('Query: "silla"')
+
+
+def test_cache_control_marks_the_prefix_for_listed_providers(monkeypatch) -> None:
+    monkeypatch.setattr(config, "PROMPT_PREFIX_LAYOUT", True)
+    monkeypatch.setattr(config, "PROMPT_CACHE_CONTROL", True)
+    monkeypatch.setattr(config, "PROMPT_CACHE_CONTROL_PROVIDERS", ("Stub",))
+    marked = build_prompt("Static.\n{query}", provider="Stub", query="silla")
+    assert marked[0].content[0]["cache_control"] == {"type": "ephemeral"}
+    assert isinstance(build_prompt("Static.\n{query}", provider="ChatOpenAI", query="silla")[0].content, str)
+
+
+def test_layout_off_sends_a_single_message(monkeypatch) -> None:
+    monkeypatch.setattr(config, "PROMPT_PREFIX_LAYOUT", False)
+    messages = build_prompt("Static.\n{query}", query="silla")
+    assert len(messages) == 1 and messages[0].content == "Static.\nsilla"
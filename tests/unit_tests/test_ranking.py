@@ -0,0 +1,168 @@
+import asyncio
+import math
+
+import pytest
+from langchain_core.messages import AIMessage
+
+import src.config as config
+import src.ranking as ranking
+from src.concurrency import submit
+from src.llm_registry import get_llm, get_structured_llm
+from src.schemas import LLMPointwiseBatchItem, LLMPointwiseBatchResponse
+
+DOCUMENTS = [f"silla de madera modelo {i}" for i in range(7)]
+
+
+class BatchReply:
+    """Answers every batch call with the given entries."""
+
+    def __init__(self, *entries):
+        self.entries = entries
+
+    async def ainvoke(self, prompt, config=None):
+        return LLMPointwiseBatchResponse(scores=[LLMPointwiseBatchItem(index=i, score=s) for i, s in self.entries])
+
+
+@pytest.mark.asyncio
+async def test_batches_score_every_document(stub_llm) -> None:
+    scores = await ranking.ascore_documents("silla", DOCUMENTS, batch_size=3)
+    assert all(score in (0, 1, 2) for score in scores)
+    assert get_llm().stats()["calls"] == 3
+
+
+@pytest.mark.asyncio
+async def test_documents_missing_from_a_batch_reply_fall_back_to_single_calls(stub_llm, monkeypatch) -> None:
+    # Index 9 is out of range and the second entry for index 1 is ignored.
+    reply = BatchReply((1, 2.0), (9, 0.0), (1, 0.0), (3, 1.0))
+    monkeypatch.setattr(ranking, "get_structured_llm",
+                        lambda schema: reply if schema is LLMPointwiseBatchResponse else get_structured_llm(schema))
+    scores = await ranking.ascore_documents("silla", DOCUMENTS[:3], batch_size=3)
+    assert scores[0] == 2.0 and scores[2] == 1.0
+    assert scores[1] in (0, 1, 2)
+    assert get_llm().stats()["calls"] == 1
+
+
+@pytest.mark.parametrize("length, expected", [
+    (0, []),
+    (5, [(0, 5)]),
+    (20, [(0, 10), (5, 15), (10, 20)]),
+    (22, [(0, 10), (5, 15), (10, 20), (15, 22)]),
+])
+def test_sliding_windows_cover_the_list(length, expected) -> None:
+    assert ranking._sliding_windows(length, 10, 5) == expected
+
+
+@pytest.mark.asyncio
+async def test_windowed_ranking_merges_every_window(stub_llm) -> None:
+    results = [{"title": document, "description": ""} for document in DOCUMENTS]
+    ranked, _ = await ranking.alistwise_rank_windowed("silla", results, window_size=4, stride=2)
+    assert get_llm().stats()["calls"] == 3
+    assert sorted(item["title"] for item in ranked) == sorted(DOCUMENTS)
+    scores = [item["llm_score"] for item in ranked]
+    assert scores == sorted(scores, reverse=True)
+
+
+@pytest.mark.asyncio
+async def test_empty_list_makes_no_listwise_call(stub_llm) -> None:
+    assert (await ranking.alistwise_rank_windowed("silla", [], window_size=4, stride=2))[0] == []
+    assert (await ranking.alistwise_rank("silla", []))[0] == []
+    assert get_llm().stats()["calls"] == 0
+
+
+@pytest.mark.parametrize("second_stage", ["listwise", "pointwise"])
+@pytest.mark.asyncio
+async def test_cascade_sends_only_the_bm25_head_to_the_llm(stub_llm, second_stage) -> None:
+    results = [
+        {"title": "mesa de cocina", "description": ""},
+        {"title": "silla de madera", "description": "silla de madera maciza"},
+        {"title": "lampara", "description": ""},
+        {"title": "silla plegable", "description": ""},
+    ]
+    ranked, _ = await ranking.acascade_rank("silla de madera", results, top_m=2, second_stage=second_stage)
+    head, tail = ranked[:2], ranked[2:]
+    assert {item["title"] for item in head} == {"silla de madera", "silla plegable"}
+    assert all("llm_score" in item for item in head) and not any("llm_score" in item for item in tail)
+    assert [item["lexical_score"] for item in tail] == sorted((item["lexical_score"] for item in tail), reverse=True)
+    assert get_llm().stats()["calls"] == (1 if second_stage == "listwise" else 2)
+
+
+@pytest.mark.asyncio
+async def test_cascade_rejects_an_unknown_second_stage(stub_llm) -> None:
+    with pytest.raises(ValueError):
+        await ranking.acascade_rank("silla", [{"title": "silla", "description": ""}], second_stage="bm25")
+
+
+def _grade_message(**logprobs):
+    alternatives = [{"token": token, "logprob": math.log(p)} for token, p in logprobs.items()]
+    return AIMessage(content=alternatives[0]["token"],
+                     response_metadata={"logprobs": {"content": [dict(alternatives[0], top_logprobs=alternatives)]}})
+
+
+def test_grade_distribution_is_renormalised_over_grade_tokens() -> None:
+    distribution = ranking._grade_distribution(_grade_message(**{"2": 0.4, "1": 0.2, "unknown": 0.3, "0": 0.2}))
+    assert distribution == pytest.approx({2: 0.5, 1: 0.25, 0: 0.25})
+    assert ranking._grade_distribution(_grade_message(unknown=0.9)) is None
+
+
+@pytest.mark.asyncio
+async def test_logprob_score_is_the_expected_grade(stub_llm, monkeypatch) -> None:
+    monkeypatch.setattr(config, "DEFAULT_POINTWISE_SCORING_MODE", "logprobs")
+    expected, confidence = await ranking.aget_graded_relevance("silla", DOCUMENTS[0])
+    assert 0.0 <= expected <= 2.0 and 1 / 3 <= confidence <= 1.0
+    assert await ranking.aget_relevance_score("silla", DOCUMENTS[0]) == pytest.approx(expected)
+
+
+@pytest.mark.asyncio
+async def test_providers_without_logprobs_fall_back_to_structured_scores(stub_llm, monkeypatch) -> None:
+    monkeypatch.setattr(config, "LOGPROB_PROVIDERS", ())
+    score, confidence = await ranking.aget_graded_relevance("silla", DOCUMENTS[0])
+    assert score in (0, 1, 2) and confidence is None
+
+
+class DictCache:
+    def __init__(self):
+        self.values = {}
+
+    async def aget(self, key):
+        return self.values.get(key)
+
+    def set(self, key, value):
+        self.values[key] = value
+
+
+@pytest.mark.asyncio
+async def test_concurrent_callers_share_one_intent_call(stub_llm, monkeypatch) -> None:
+    monkeypatch.setattr(config, "QUERY_INTENT_ENABLED", True)
+    intents = await asyncio.gather(*(ranking.aget_query_intent(q) for q in ("Sillón", "sillon", "SILLÓN!")))
+    assert len(set(intents)) == 1 and intents[0]
+    assert get_llm().stats()["calls"] == 1
+
+
+@pytest.mark.asyncio
+async def test_intent_calls_in_flight_on_two_event_loops(stub_llm, monkeypatch) -> None:
+    monkeypatch.setattr(config, "QUERY_INTENT_ENABLED", True)
+    monkeypatch.setattr(config, "STUB_LLM_SETTINGS", dict(config.STUB_LLM_SETTINGS, latency_ms=50.0))
+    background = asyncio.wrap_future(submit(ranking.aget_query_intent("silla")))
+    here, there = await asyncio.gather(ranking.aget_query_intent("silla"), background)
+    assert here == there
+
+
+@pytest.mark.asyncio
+async def test_scores_without_the_intent_are_not_cached(stub_llm, monkeypatch) -> None:
+    cache = DictCache()
+    monkeypatch.setattr(config, "QUERY_INTENT_ENABLED", True)
+    monkeypatch.setattr(ranking, "get_score_cache", lambda: cache)
+    monkeypatch.setattr(ranking, "get_intent_cache", lambda: None)
+    extract = ranking._aextract_query_intent
+
+    async def failed_extraction(query):
+        return None
+
+    monkeypatch.setattr(ranking, "_aextract_query_intent", failed_extraction)
+    assert await ranking.aget_relevance_score("silla", DOCUMENTS[0]) is not None
+    assert await ranking.ascore_documents("silla", DOCUMENTS[1:3], batch_size=2) != [None, None]
+    assert cache.values == {}
+
+    monkeypatch.setattr(ranking, "_aextract_query_intent", extract)
+    await ranking.aget_relevance_score("silla", DOCUMENTS[0])
+    assert len(cache.values) == 1
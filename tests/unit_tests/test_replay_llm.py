@@ -0,0 +1,33 @@
+import pytest
+
+from src.replay_llm import MISS_RECORD, ReplayChatModel
+from src.schemas import LLMPointwiseResponse
+
+
+class UpstreamRunnable:
+    def __init__(self):
+        self.configs = []
+
+    async def ainvoke(self, prompt, config=None):
+        self.configs.append(config)
+        return LLMPointwiseResponse(score=2)
+
+
+def test_replay_cannot_be_its_own_upstream(tmp_path) -> None:
+    with pytest.raises(ValueError):
+        ReplayChatModel(str(tmp_path / "cassette.jsonl"), "Replay", "model", 0.0, MISS_RECORD)
+
+
+@pytest.mark.asyncio
+async def test_misses_are_recorded_with_the_callers_config(tmp_path, monkeypatch) -> None:
+    upstream = UpstreamRunnable()
+    model = ReplayChatModel(str(tmp_path / "cassette.jsonl"), "Stub", "model", 0.0, MISS_RECORD)
+    runnable = model.with_structured_output(LLMPointwiseResponse)
+    monkeypatch.setattr(type(runnable), "_upstream", lambda self: upstream)
+    run_config = {"callbacks": ["handler"]}
+    assert (await runnable.ainvoke("prompt", config=run_config)).score == 2
+    assert upstream.configs == [run_config]
+
+    replayed = ReplayChatModel(str(tmp_path / "cassette.jsonl"), "Stub", "model", 0.0)
+    assert (await replayed.with_structured_output(LLMPointwiseResponse).ainvoke("prompt")).score == 2
+    assert replayed.stats()["hits"] == 1
@@ -0,0 +1,88 @@
+import time
+from types import SimpleNamespace
+
+import pytest
+
+import src.config as config
+import src.ranking as ranking
+from src.concurrency import get_llm_budget
+from src.scheduler import LLMCallFailed, _backoff_delay, ainvoke_llm
+
+
+class HTTPError(Exception):
+    def __init__(self, status_code: int, headers: dict = None):
+        super().__init__(f"HTTP {status_code}")
+        self.status_code = status_code
+        self.response = SimpleNamespace(status_code=status_code, headers=headers or {})
+
+
+class FlakyRunnable:
+    """Raises the given errors on successive calls, then answers "ok"."""
+
+    def __init__(self, *errors: Exception):
+        self.errors = list(errors)
+        self.calls = 0
+
+    async def ainvoke(self, prompt, config=None):
+        self.calls += 1
+        if self.errors:
+            raise self.errors.pop(0)
+        return "ok"
+
+
+@pytest.fixture(autouse=True)
+def fast_retries(monkeypatch):
+    monkeypatch.setattr(config, "LLM_BACKOFF_BASE_SECONDS", 0.0)
+    monkeypatch.setattr(config, "LLM_MAX_RETRIES", 2)
+    monkeypatch.setattr(config, "DEFAULT_CONCURRENT_PROCESSES", 8)
+    get_llm_budget()  # picks up the patched limit
+    yield
+    get_llm_budget().set_limit(8)
+
+
+@pytest.mark.asyncio
+async def test_rate_limit_halves_the_budget_and_retries() -> None:
+    runnable = FlakyRunnable(HTTPError(429))
+    assert await ainvoke_llm(runnable, "prompt", provider="test") == "ok"
+    assert runnable.calls == 2
+    assert get_llm_budget().limit == 4
+
+
+@pytest.mark.asyncio
+async def test_retry_after_is_honoured() -> None:
+    runnable = FlakyRunnable(HTTPError(503, {"retry-after": "0.2"}))
+    started = time.monotonic()
+    assert await ainvoke_llm(runnable, "prompt", provider="test") == "ok"
+    assert time.monotonic() - started >= 0.2
+
+
+def test_retry_after_ms_takes_precedence_over_backoff() -> None:
+    assert _backoff_delay(5, HTTPError(429, {"retry-after-ms": "1500"})) == 1.5
+
+
+@pytest.mark.asyncio
+async def test_non_retryable_error_is_not_retried() -> None:
+    runnable = FlakyRunnable(HTTPError(400))
+    with pytest.raises(LLMCallFailed):
+        await ainvoke_llm(runnable, "prompt", provider="test")
+    assert runnable.calls == 1
+    assert get_llm_budget().limit == 8
+
+
+@pytest.mark.asyncio
+async def test_exhausted_retries_raise_llm_call_failed() -> None:
+    runnable = FlakyRunnable(HTTPError(500), HTTPError(500), HTTPError(500))
+    with pytest.raises(LLMCallFailed):
+        await ainvoke_llm(runnable, "prompt", provider="test")
+    assert runnable.calls == 3
+
+
+@pytest.mark.asyncio
+async def test_failed_call_leaves_the_document_unscored(monkeypatch) -> None:
+    runnable = FlakyRunnable(HTTPError(400))
+    monkeypatch.setattr(config, "SCORE_CACHE_ENABLED", False)
+    monkeypatch.setattr(config, "QUERY_INTENT_ENABLED", False)
+    monkeypatch.setattr(config, "DEFAULT_POINTWISE_SCORING_MODE", "structured")
+    monkeypatch.setattr(ranking, "get_structured_llm", lambda schema: runnable)
+    assert await ranking.aget_relevance_score("silla", "silla de madera") is None
+    assert runnable.calls == 1
@@ -0,0 +1,40 @@
+import os
+import sys
+import time
+
+import pytest
+from streamlit.testing.v1 import AppTest
+
+import src.config as config
+import src.search_engine  # noqa: F401
+
+APP_PATH = os.path.join(os.path.dirname(__file__), "..", "..", "app", "streamlit_app.py")
+
+
+@pytest.fixture
+def slow_stub(stub_llm, monkeypatch):
+    monkeypatch.setattr(config, "STUB_LLM_SETTINGS", dict(config.STUB_LLM_SETTINGS, latency_ms=1000.0))
+    monkeypatch.setattr(config, "DEFAULT_POINTWISE_BATCH_SIZE", 1)
+    monkeypatch.setattr(config, "FUSION_DEADLINE_SECONDS", 0.5)
+    # src/__init__.py re-exports the search_engine function under the module's name.
+    results = [{"title": f"silla {i}", "description": f"silla de madera modelo {i}", "thumbnail": ""} for i in range(8)]
+    monkeypatch.setattr(sys.modules["src.search_engine"], "_fetch_results", lambda query, lat, lon: [dict(r) for r in results])
+
+
+def test_manual_search_is_served_at_the_deadline(slow_stub) -> None:
+    app = AppTest.from_file(APP_PATH, default_timeout=30).run()
+    app.segmented_control(key="manual_view").set_value("LLM Pointwise").run()
+    started = time.monotonic()
+    app.button(key="manual_search").click().run()
+    # Every stub call takes 1s, so neither ranker can finish before the 0.5s deadline.
+    assert time.monotonic() - started < 1.0
+    assert not app.exception
+    assert any("still being scored" in info.value for info in app.info)
+
+    run = app.session_state["manual_runs"][app.session_state["manual_run_key"]]
+    for future in (run["pointwise_future"], run["listwise_future"]):
+        future.result(timeout=10)
+    app.button(key="manual_pointwise_refresh").click().run()
+    assert not any("still being scored" in info.value for info in app.info)
+    assert run["pointwise_scored"] == 8
+    assert run["fusion"].signals.keys() == {"baseline", "pointwise", "listwise"}